@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'KMRLDoc.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Live dashboard streams bypass Django's request handling, which would hold a
+# thread for every open stream (see home.live.live_asgi)
+from django.urls import reverse  # noqa: E402
+from home.live import live_asgi  # noqa: E402
+
+LIVE_PATH = reverse("live_events")
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == LIVE_PATH:
+        return await live_asgi(scope, receive, send)
+    return await django_application(scope, receive, send)
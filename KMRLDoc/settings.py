@@ -29,6 +29,64 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 
+# Google Generative AI key used for translation and summarisation
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', 'API KEY HERE')
+
+# LLM client resilience: per-attempt timeout (s), retries with jittered
+# exponential backoff, and a circuit breaker that opens after N straight failures
+LLM_TIMEOUT = 30
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE = 0.5
+LLM_BACKOFF_CAP = 8
+LLM_BREAKER_THRESHOLD = 5
+LLM_BREAKER_RESET = 60
+# REST endpoint used by the async client (home/async_llm.py)
+GEMINI_API_BASE = 'https://generativelanguage.googleapis.com'
+
+# Summaries: "llm" (extractive fallback), "extractive" (offline TF-IDF ranking only)
+# or "prefilter" (LLM sees only the top-ranked sentences)
+SUMMARY_MODE = 'llm'
+SUMMARY_PREFILTER_SENTENCES = 60
+
+# "compact" memory-maps home/artifacts/compact (see export_compact_model) so all
+# workers share one copy of the model; "sklearn" unpickles the joblib files
+CLASSIFIER_FORMAT = 'compact'
+
+# "summary" classifies the 10-sentence summary; "sections" classifies every page
+# of the extracted text in one batch and stores per-section scores
+CLASSIFY_MODE = 'summary'
+
+# Concurrent classify calls are coalesced into one predict per micro-batch
+CLASSIFY_BATCH_SIZE = 32
+CLASSIFY_BATCH_WAIT_MS = 5
+# Seconds a caller waits for its batch before giving up (the classify stage then fails and is retried)
+CLASSIFY_TIMEOUT = 30
+
+# Import the processing stack (pandas, scikit-learn, Gemini SDK, ...) and load the
+# classifier at startup. Enable only for processes that ingest documents.
+DOCUMENT_WORKER_WARMUP = os.environ.get('DOCUMENT_WORKER_WARMUP') == '1'
+
+# Ingest scheduler: uploads are processed by INGEST_WORKERS threads per process.
+# Priority classes are urgent > normal > bulk; urgent comes from the uploader's role,
+# bulk from batches larger than INGEST_BULK_THRESHOLD files. Only superusers and
+# INGEST_URGENT_ROLES may pick a class on the upload form.
+# Departments share each class by weight (default 1), and a bulk job that has
+# waited INGEST_AGING_SECONDS moves up to normal. An upload request waits up to
+# INGEST_WAIT_SECONDS for its own files before returning.
+INGEST_WORKERS = 2
+INGEST_URGENT_ROLES = ['Compliance', 'Executive']
+INGEST_BULK_THRESHOLD = 20
+INGEST_DEPARTMENT_WEIGHTS = {}
+INGEST_AGING_SECONDS = 60
+INGEST_WAIT_SECONDS = 20
+
+# Async ingestion (serve KMRLDoc.asgi): the admin upload form posts to the async
+# view, which runs up to ASYNC_INGEST_CONCURRENCY jobs per request; extraction
+# runs in a pool of ASYNC_EXTRACT_WORKERS processes
+ASYNC_UPLOADS = os.environ.get('ASYNC_UPLOADS') == '1'
+ASYNC_INGEST_CONCURRENCY = 16
+ASYNC_EXTRACT_WORKERS = os.cpu_count() or 2
+
 
 # Application definition
 
@@ -80,6 +138,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Concurrent writers (bulk import, async ingestion) wait for the write lock
+        # instead of failing with "database is locked" on a read-to-write upgrade
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -125,6 +189,77 @@ MEDIA_URL = '/media/'
 # Directory on your local filesystem where uploaded files will be stored
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Document downloads: None streams through Django, "xsendfile" (Apache/lighttpd)
+# or "xaccel" (nginx) hands the transfer to the front-end server.
+DOCUMENT_SENDFILE_BACKEND = None
+# Internal nginx location that aliases MEDIA_ROOT (used by "xaccel")
+DOCUMENT_SENDFILE_PREFIX = '/protected/'
+# Seconds clients may reuse a downloaded file before revalidating
+DOCUMENT_DOWNLOAD_MAX_AGE = 3600
+
+# Page previews and thumbnails, rendered lazily and kept on disk with LRU eviction
+PREVIEW_CACHE_DIR = BASE_DIR / 'cache' / 'previews'
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PREVIEW_MAX_AGE = 86400
+
+# Revision detection: an upload revises an earlier document with the same
+# normalised title when their MinHash similarity is at least this
+REVISION_MIN_SIMILARITY = 0.5
+REVISION_CANDIDATES = 20
+# Above this share of changed pages a revision is summarised from scratch
+REVISION_MAX_CHANGED_SHARE = 0.3
+# Pages of one document translated concurrently
+TRANSLATE_PAGE_CONCURRENCY = 4
+
+# OCR for PDF pages without a text layer (needs pytesseract, Pillow and the
+# tesseract binary with the listed traineddata). None turns it on only when
+# Tesseract can be found; True also retries extract while OCR is failing
+OCR_ENABLED = None
+OCR_LANGUAGES = 'eng+mal'
+# Pages with fewer extracted characters than this count as scanned
+OCR_MIN_CHARS = 20
+# Worker processes for OCR; 1 reads pages one by one in the calling process
+OCR_WORKERS = os.cpu_count() or 2
+# OCR results by page-image hash, so the same scan is never read twice
+OCR_CACHE_DIR = BASE_DIR / 'cache' / 'ocr'
+OCR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Rendered per-document dashboard fragments. LocMem is per process; point the
+# "fragments" cache at Redis or Memcached to share renders between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'document-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+# Seconds a rendered fragment is kept; edits change its key, so this only bounds memory
+DOCUMENT_FRAGMENT_TIMEOUT = 86400
+
+# Live dashboard updates over Server-Sent Events (serve KMRLDoc.asgi: under WSGI
+# every open dashboard holds a worker thread). Events are rows in the database,
+# so uploads processed by any process reach every web worker; each worker polls
+# them every LIVE_POLL_INTERVAL seconds while it has streams open.
+LIVE_EVENTS_ENABLED = True
+LIVE_POLL_INTERVAL = 1.0
+# Seconds between keepalive comments, and the browser's reconnect delay (ms)
+LIVE_HEARTBEAT = 15
+LIVE_RETRY_MS = 3000
+# A stream this many events behind is closed and resumes from the log on reconnect
+LIVE_QUEUE_SIZE = 100
+# A reconnect that missed more than this many events reloads the page instead
+LIVE_REPLAY_LIMIT = 200
+# Seconds events are kept for reconnecting streams
+LIVE_EVENT_RETENTION = 3600
+
+# Bulk document operations (home/bulk_actions.py): documents per transaction
+BULK_CHUNK_SIZE = 500
+# Stored files the background sweeper deletes per batch after a bulk delete
+FILE_SWEEP_BATCH_SIZE = 500
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
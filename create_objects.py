@@ -3,7 +3,7 @@ import django
 import os
 
 # Setup Django environment
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "your_project_name.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "KMRLDoc.settings")
 django.setup()
 
 from home.models import Category, Department
@@ -21,12 +21,14 @@ categories = [
     "Mixed"
 ]
 
+# One insert; names that already exist are left as they are
+existing = set(Category.objects.filter(name__in=categories).values_list("name", flat=True))
+Category.objects.bulk_create([Category(name=cat) for cat in categories], ignore_conflicts=True)
 for cat in categories:
-    obj, created = Category.objects.get_or_create(name=cat)
-    if created:
-        print(f"Category '{cat}' created.")
-    else:
+    if cat in existing:
         print(f"Category '{cat}' already exists.")
+    else:
+        print(f"Category '{cat}' created.")
 
 # -------------------------
 # Departments
@@ -40,11 +42,12 @@ departments = [
     "Executive/Management"
 ]
 
+existing = set(Department.objects.filter(name__in=departments).values_list("name", flat=True))
+Department.objects.bulk_create([Department(name=dept) for dept in departments], ignore_conflicts=True)
 for dept in departments:
-    obj, created = Department.objects.get_or_create(name=dept)
-    if created:
-        print(f"Department '{dept}' created.")
-    else:
+    if dept in existing:
         print(f"Department '{dept}' already exists.")
+    else:
+        print(f"Department '{dept}' created.")
 
 print("Initial Categories and Departments setup completed.")
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        from django.conf import settings
+        from . import signals  # noqa: F401
+
+        # Ingest workers opt in to loading the processing stack at boot
+        if getattr(settings, 'DOCUMENT_WORKER_WARMUP', False):
+            from .pipeline import warm_up
+            warm_up(gemini_api_key=settings.GEMINI_API_KEY)
@@ -0,0 +1,179 @@
+# async_llm.py
+import asyncio
+import json
+import ssl
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+
+from .llm_client import (
+    SLEEP,
+    BaseLLMClient,
+    LLMHTTPError,
+    LLMTimeout,
+    client_key,
+    get_breaker,
+    get_metrics,
+)
+
+
+# -----------------------
+# MINIMAL ASYNC HTTP (STDLIB ONLY)
+# -----------------------
+async def post_json(url: str, payload: Dict[str, Any], headers: Dict[str, str] = None) -> Tuple[int, bytes]:
+    """
+    POST a JSON body over asyncio streams and return (status, body).
+    One connection per request; handles Content-Length, chunked and
+    read-until-close responses.
+    """
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    ssl_context = ssl.create_default_context() if secure else None
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=ssl_context)
+
+    try:
+        body = json.dumps(payload).encode("utf-8")
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        lines = [
+            f"POST {target} HTTP/1.1",
+            f"Host: {parts.netloc}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ] + [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before response")
+        status = int(status_line.split()[1])
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(chunks)
+        elif "content-length" in response_headers:
+            data = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await reader.read()
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, ssl.SSLError):
+            pass
+    return status, data
+
+
+# -----------------------
+# GEMINI REST MODEL
+# -----------------------
+class GeneratedText:
+    """Mirrors the ``.text`` attribute of the SDK's GenerateContentResponse."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class AsyncGeminiModel:
+    """Calls Gemini's generateContent REST endpoint without tying up a thread."""
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-lite", base_url: str = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.base_url = (base_url or settings.GEMINI_API_BASE).rstrip("/")
+
+    async def generate_content(self, prompt: str) -> GeneratedText:
+        url = f"{self.base_url}/v1beta/models/{quote(self.model_name)}:generateContent"
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        status, body = await post_json(url, payload, headers={"x-goog-api-key": self.api_key})
+        if status != 200:
+            raise LLMHTTPError(status, body.decode("utf-8", "replace"))
+
+        data = json.loads(body)
+        candidates = data.get("candidates") or []
+        if not candidates:
+            raise LLMHTTPError(status, "response has no candidates")
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return GeneratedText("".join(part.get("text", "") for part in parts))
+
+
+# -----------------------
+# RESILIENT ASYNC CLIENT
+# -----------------------
+class AsyncLLMClient(BaseLLMClient):
+    """
+    asyncio counterpart of LLMClient: the same retry loop, breaker and
+    metrics, but a call in flight costs a coroutine, not a thread, and its
+    timeout covers only the request itself.
+    """
+
+    async def _call_once(self, prompt: str, timeout: float):
+        self.metrics.incr("calls")
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(self.model.generate_content(prompt), timeout)
+        except asyncio.TimeoutError:
+            self.metrics.incr("timeouts")
+            raise LLMTimeout(f"LLM call exceeded {timeout:.1f}s")
+        finally:
+            self.metrics.observe(time.monotonic() - started)
+
+    async def generate_content(self, prompt: str, deadline: Optional[float] = None):
+        """Call the model, retrying as in BaseLLMClient.attempts."""
+        steps = self.attempts(deadline)
+        reply = error = None
+        while True:
+            try:
+                kind, value = steps.throw(error) if error is not None else steps.send(reply)
+            except StopIteration as stop:
+                return stop.value
+            reply = error = None
+            if kind == SLEEP:
+                await asyncio.sleep(value)
+                continue
+            try:
+                reply = await self._call_once(prompt, value)
+            except Exception as e:
+                error = e
+
+
+_async_clients: Dict[str, AsyncLLMClient] = {}
+_async_clients_lock = threading.Lock()
+
+def get_async_llm_client(api_key: str, model_name: str = "gemini-2.5-flash-lite") -> AsyncLLMClient:
+    """Process-wide client per (key, model), sharing the sync client's breaker and metrics."""
+    cache_key = client_key(api_key, model_name)
+    breaker, metrics = get_breaker(model_name), get_metrics(api_key, model_name)
+    with _async_clients_lock:
+        client = _async_clients.get(cache_key)
+        if client is None:
+            client = AsyncLLMClient(
+                AsyncGeminiModel(api_key, model_name),
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES,
+                backoff_base=settings.LLM_BACKOFF_BASE,
+                backoff_cap=settings.LLM_BACKOFF_CAP,
+                breaker=breaker,
+                metrics=metrics,
+            )
+            _async_clients[cache_key] = client
+    return client
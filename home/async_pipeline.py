@@ -0,0 +1,107 @@
+# async_pipeline.py
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .async_llm import get_async_llm_client
+from .doc_processor import extract_document
+from .pipeline import (
+    CLASSIFY,
+    DEFAULT_ARTIFACTS_DIR,
+    EXTRACT,
+    ORM,
+    advance,
+    classify_document_sections,
+    get_batcher,
+    run_stages,
+)
+
+
+# -----------------------
+# CPU OFFLOAD
+# -----------------------
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    """
+    Extraction is CPU-bound, so it runs in worker processes instead of on the
+    event loop. Spawned rather than forked: the ASGI server has threads running.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=settings.ASYNC_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _extract_pool
+
+
+# -----------------------
+# INCREMENTAL PIPELINE (ASYNC)
+# -----------------------
+async def aclassify_document(doc, artifacts_dir: str = DEFAULT_ARTIFACTS_DIR):
+    """pipeline.classify_document without holding a thread while the batch is pending."""
+    loop = asyncio.get_running_loop()
+    if settings.CLASSIFY_MODE == "sections":
+        return await loop.run_in_executor(None, classify_document_sections, doc, artifacts_dir)
+    # The batcher's Future resolves on its dispatcher thread; await it here
+    future = get_batcher(artifacts_dir).submit(doc.summary or "")
+    chosen_labels, sorted_probs = await asyncio.wait_for(asyncio.wrap_future(future), settings.CLASSIFY_TIMEOUT)
+    return chosen_labels, sorted_probs, None
+
+
+async def agenerate_all(client, prompts: List[str]) -> List[Any]:
+    """A response or the exception raised for each prompt, several pages at a time."""
+    slots = asyncio.Semaphore(settings.TRANSLATE_PAGE_CONCURRENCY)
+
+    async def call(prompt):
+        async with slots:
+            return await client.generate_content(prompt)
+
+    return await asyncio.gather(*(call(prompt) for prompt in prompts), return_exceptions=True)
+
+
+async def aprocess_document(
+    doc,
+    artifacts_dir: str = DEFAULT_ARTIFACTS_DIR,
+    gemini_api_key: str = "",
+    translate: bool = False,
+    force: Iterable[str] = (),
+) -> List[str]:
+    """
+    Async driver for pipeline.run_stages: the same stages, stamps and saves
+    as process_document. The stage code runs on the default executor, so
+    concurrent jobs' CPU work overlaps; only its queries go through
+    sync_to_async. Extraction runs in the process pool and LLM calls are
+    awaited on the async client, so no job holds a thread while it waits.
+    """
+    loop = asyncio.get_running_loop()
+    stages = run_stages(doc, artifacts_dir, translate, force)
+    client = None
+    reply = error = None
+    while True:
+        request, ran = await loop.run_in_executor(None, advance, stages, reply, error)
+        if request is None:
+            return ran
+        kind, payload = request
+        reply = error = None
+        try:
+            if kind == ORM:
+                reply = await sync_to_async(payload)()
+            elif kind == EXTRACT:
+                reply = await loop.run_in_executor(get_extract_pool(), extract_document, payload)
+            elif kind == CLASSIFY:
+                reply = await aclassify_document(payload, artifacts_dir)
+            else:
+                if client is None:
+                    client = get_async_llm_client(gemini_api_key)
+                reply = await agenerate_all(client, payload)
+        except Exception as e:
+            error = e
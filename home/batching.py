@@ -0,0 +1,153 @@
+# batching.py
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Any, Dict, List, Tuple
+
+from .doc_processor import classify_texts
+
+
+class ClassificationBatcher:
+    """
+    Coalesces concurrent classify requests into micro-batches.
+
+    Callers get a Future immediately. A single dispatcher thread waits for the
+    first request, keeps collecting until ``max_batch_size`` requests or
+    ``max_wait`` seconds have passed, then runs one vectorised
+    transform/predict_proba for the whole batch. classify() gives up after
+    ``timeout`` seconds, so a hung predict cannot block callers forever, and
+    a dispatcher that dies fails everything it was holding; the next submit
+    starts a new one.
+    """
+
+    def __init__(
+        self, vect, clf, labels, thr_arr, max_batch_size: int = 32, max_wait: float = 0.005, timeout: float = 30
+    ):
+        self.vect = vect
+        self.clf = clf
+        self.labels = labels
+        self.thr_arr = thr_arr
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        self._batch_sizes = deque(maxlen=1000)
+        self._queue_waits = deque(maxlen=1000)
+        self.counters = {"requests": 0, "batches": 0, "errors": 0, "timeouts": 0, "restarts": 0}
+
+    # -----------------------
+    # PUBLIC API
+    # -----------------------
+    def submit(self, text: str) -> Future:
+        self._ensure_dispatcher()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def classify(self, text: str, timeout: float = None):
+        """
+        Blocking convenience wrapper with classify_text's return shape.
+        Raises concurrent.futures.TimeoutError after ``timeout`` seconds
+        (default: the batcher's).
+        """
+        future = self.submit(text)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FuturesTimeoutError:
+            future.cancel()  # dropped from its batch if it has not started yet
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            waits = sorted(self._queue_waits)
+            data = dict(self.counters)
+        data["queue_depth"] = self._queue.qsize()
+        if sizes:
+            data["batch_size_avg"] = sum(sizes) / len(sizes)
+            data["batch_size_max"] = max(sizes)
+        if waits:
+            data["queue_wait_p50"] = waits[len(waits) // 2]
+            data["queue_wait_p95"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+        return data
+
+    # -----------------------
+    # DISPATCHER
+    # -----------------------
+    def _ensure_dispatcher(self):
+        # A thread started before a fork does not exist in the child
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._thread is not None and self._pid == os.getpid():
+                    self.counters["restarts"] += 1
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="classify-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[str, Future, float]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = self._collect()
+                self._dispatch(batch)
+                batch = []
+        finally:
+            # Only reached when the dispatcher itself dies: nobody else would answer these
+            error = RuntimeError("Classification dispatcher stopped")
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+
+    def _dispatch(self, batch: List[Tuple[str, Future, float]]) -> None:
+        started = time.monotonic()
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            results = classify_texts(
+                [text for text, _, _ in batch], self.vect, self.clf, self.labels, self.thr_arr
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            with self._lock:
+                self.counters["errors"] += 1
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+        with self._lock:
+            self.counters["requests"] += len(batch)
+            self.counters["batches"] += 1
+            self._batch_sizes.append(len(batch))
+            self._queue_waits.extend(started - enqueued for _, _, enqueued in batch)
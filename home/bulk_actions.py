@@ -0,0 +1,349 @@
+# bulk_actions.py
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .exports import filter_documents
+from .live import ADMIN_CHANNEL, bulk_changes, category_channel, publish_many
+from .models import Category, Department, Document
+
+
+logger = logging.getLogger(__name__)
+
+BULK_ACTIONS = ["delete", "recategorise", "set-department"]
+CategoryLink = Document.categories.through
+
+
+class BulkActionError(ValueError):
+    pass
+
+
+# -----------------------
+# SELECTION
+# -----------------------
+def select_documents(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[str] = None,
+    department: Optional[str] = None,
+    uploaded_by: Optional[str] = None,
+    ids: Optional[Iterable[int]] = None,
+    everything: bool = False,
+) -> List[int]:
+    """
+    Ids of the documents matching every given filter: the export filters, the
+    uploader's username and explicit ids. Without any filter nothing is
+    selected unless ``everything`` is set. Raises ExportFilterError on a
+    malformed date.
+    """
+    if not everything and not any((date_from, date_to, category, department, uploaded_by, ids is not None)):
+        raise BulkActionError("No filter given; pass one, or select everything explicitly")
+    qs = filter_documents(Document.objects.all(), date_from, date_to, category, department)
+    if uploaded_by:
+        qs = qs.filter(uploaded_by__username=uploaded_by)
+    ids = list(ids) if ids is not None else None
+    if ids is None:
+        return list(qs.order_by("id").values_list("id", flat=True))
+    # Explicit id lists can be long: match them a chunk at a time
+    selected = []
+    for chunk in chunked(sorted(set(ids)), settings.BULK_CHUNK_SIZE):
+        selected.extend(qs.filter(pk__in=chunk).order_by("id").values_list("id", flat=True))
+    return selected
+
+
+def chunked(items: Sequence, size: int) -> Iterator[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def category_links(doc_ids: Iterable[int]) -> List[Tuple[int, int]]:
+    return list(CategoryLink.objects.filter(document_id__in=list(doc_ids)).values_list("document_id", "category_id"))
+
+
+# -----------------------
+# OPERATIONS
+# -----------------------
+# Each chunk is one transaction of a handful of set-based statements, however
+# many documents it holds. Per-document signals are silenced (bulk_changes)
+# and the dashboards get one batch of live events at the end.
+def bulk_delete(ids: Sequence[int], chunk_size: Optional[int] = None) -> int:
+    """
+    Delete documents with their category links, clearing revision pointers
+    to them. Stored files go to the background sweeper once each chunk has
+    committed. Returns the number of documents deleted.
+    """
+    chunk_size = chunk_size or settings.BULK_CHUNK_SIZE
+    category_names = dict(Category.objects.values_list("id", "name"))
+    removed = {}
+    deleted = 0
+    with bulk_changes():
+        for chunk in chunked(ids, chunk_size):
+            with transaction.atomic():
+                channels = defaultdict(lambda: [ADMIN_CHANNEL])
+                for doc_id, category_id in category_links(chunk):
+                    channels[doc_id].append(category_channel(category_names.get(category_id, "")))
+                rows = Document.objects.filter(pk__in=chunk)
+                files = [name for doc_id, name in rows.values_list("id", "file") if name]
+                # Rows are collected with only their id: the text columns are never read
+                count = rows.only("id").delete()[1].get(Document._meta.label, 0)
+                deleted += count
+                removed.update({doc_id: channels[doc_id] for doc_id in chunk})
+                transaction.on_commit(lambda files=files: get_file_sweeper().submit(files))
+    publish_many("removed", removed)
+    return deleted
+
+
+def ensure_categories(names: Iterable[str]) -> Dict[str, int]:
+    """Category ids by name, creating the missing ones in one insert."""
+    names = list(dict.fromkeys(n for n in names if n))
+    Category.objects.bulk_create([Category(name=n) for n in names], ignore_conflicts=True)
+    return dict(Category.objects.filter(name__in=names).values_list("name", "id"))
+
+
+def bulk_recategorise(
+    ids: Sequence[int],
+    add: Iterable[str] = (),
+    remove: Iterable[str] = (),
+    replace: Optional[Iterable[str]] = None,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Add and remove categories by name, or with ``replace`` set them exactly,
+    through the link table: one delete and one bulk insert per chunk.
+    Returns the number of documents changed and links added and removed.
+    """
+    chunk_size = chunk_size or settings.BULK_CHUNK_SIZE
+    wanted = set(ensure_categories(replace if replace is not None else add).values())
+    unwanted = set(Category.objects.filter(name__in=list(remove)).values_list("id", flat=True)) - wanted
+    category_names = dict(Category.objects.values_list("id", "name"))
+    result = {"documents": 0, "added": 0, "removed": 0}
+    removed_from, changed = {}, {}
+    with bulk_changes():
+        for chunk in chunked(ids, chunk_size):
+            with transaction.atomic():
+                before = set(category_links(chunk))
+                if replace is not None:
+                    dropped = {(d, c) for d, c in before if c not in wanted}
+                else:
+                    dropped = {(d, c) for d, c in before if c in unwanted}
+                added = {(d, c) for d in chunk for c in wanted} - before
+                if dropped:
+                    CategoryLink.objects.filter(
+                        document_id__in=chunk, category_id__in={c for _, c in dropped}
+                    ).delete()
+                CategoryLink.objects.bulk_create(
+                    [CategoryLink(document_id=d, category_id=c) for d, c in added], ignore_conflicts=True
+                )
+                # Through-table writes send no m2m signals: bump the fragment stamp here
+                touched = sorted({d for d, _ in dropped | added})
+                Document.objects.filter(pk__in=touched).update(updated_at=timezone.now())
+
+                for doc_id, category_id in dropped:
+                    removed_from.setdefault(doc_id, []).append(category_channel(category_names[category_id]))
+                current = defaultdict(lambda: [ADMIN_CHANNEL])
+                for doc_id, category_id in (before - dropped) | added:
+                    current[doc_id].append(category_channel(category_names[category_id]))
+                changed.update({doc_id: current[doc_id] for doc_id in touched})
+                result["documents"] += len(touched)
+                result["added"] += len(added)
+                result["removed"] += len(dropped)
+    publish_many("removed", removed_from)
+    publish_many("document", changed)
+    return result
+
+
+def bulk_set_department(ids: Sequence[int], department: Optional[str], chunk_size: Optional[int] = None) -> int:
+    """Set (or with None, clear) the department of documents; returns how many were updated."""
+    target = None
+    if department:
+        target = Department.objects.filter(name=department).first()
+        if target is None:
+            raise BulkActionError(f"Unknown department: {department!r}")
+    changed = {}
+    with bulk_changes():
+        for chunk in chunked(ids, chunk_size or settings.BULK_CHUNK_SIZE):
+            with transaction.atomic():
+                found = list(Document.objects.filter(pk__in=chunk).values_list("pk", flat=True))
+                Document.objects.filter(pk__in=found).update(department=target, updated_at=timezone.now())
+                changed.update({doc_id: [ADMIN_CHANNEL] for doc_id in found})
+    publish_many("document", changed)
+    return len(changed)
+
+
+# -----------------------
+# USERS
+# -----------------------
+def create_role_users(rows: Iterable[Tuple[str, str, str]]) -> Tuple[List[User], List[str]]:
+    """
+    Create users from (email, password, department name) rows with one
+    insert for the users and one per role table. Password hashing is the
+    slow part by design (PBKDF2 releases the GIL), so it runs on a thread
+    per core. Returns the created users and the emails that already existed.
+    """
+    from .views import ROLE_MAP
+
+    rows = list({email: (email, password, dept) for email, password, dept in rows if email}.values())
+    existing = set(User.objects.filter(username__in=[r[0] for r in rows]).values_list("username", flat=True))
+    rows = [r for r in rows if r[0] not in existing]
+    passwords = [password for _, password, _ in rows]
+    if len(passwords) > 1:
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            hashes = list(pool.map(make_password, passwords))
+    else:
+        hashes = [make_password(p) for p in passwords]
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [User(username=email, email=email, password=h) for (email, _, _), h in zip(rows, hashes)]
+        )
+        if users and users[0].pk is None:
+            # Backends that do not return primary keys from bulk inserts
+            by_name = dict(User.objects.filter(username__in=[u.username for u in users]).values_list("username", "id"))
+            for user in users:
+                user.pk = by_name[user.username]
+        roles = defaultdict(list)
+        for user, (_, _, dept) in zip(users, rows):
+            role_model = ROLE_MAP.get(dept)
+            if role_model:
+                roles[role_model].append(role_model(user=user))
+        for role_model, objs in roles.items():
+            role_model.objects.bulk_create(objs)
+    return users, sorted(existing)
+
+
+# -----------------------
+# FILE SWEEPER
+# -----------------------
+class FileSweeper:
+    """
+    Deletes stored files in the background, in batches, once the rows that
+    referenced them are gone. A name some document still references (the
+    same upload kept twice) is left alone. Requests and commands never wait
+    on the storage; commands call drain() before they exit.
+    """
+
+    def __init__(self, storage=None, batch_size: int = 500):
+        self.storage = storage or Document._meta.get_field("file").storage
+        self.batch_size = batch_size
+
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._busy = False
+        self._thread = None
+        self._pid = None
+
+        self.counters = {"queued": 0, "deleted": 0, "kept": 0, "failed": 0}
+
+    def submit(self, names: Iterable[str]) -> None:
+        names = [n for n in names if n]
+        if not names:
+            return
+        with self._cond:
+            self._pending.extend(names)
+            self.counters["queued"] += len(names)
+            self._cond.notify_all()
+        self._ensure_thread()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted file is handled; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            data = dict(self.counters)
+            data["pending"] = len(self._pending)
+        return data
+
+    def sweep(self, names: List[str]) -> None:
+        referenced = set(Document.objects.filter(file__in=names).values_list("file", flat=True))
+        counts = {"deleted": 0, "kept": 0, "failed": 0}
+        for name in names:
+            if name in referenced:
+                counts["kept"] += 1
+                continue
+            try:
+                self.storage.delete(name)
+                counts["deleted"] += 1
+            except Exception as e:
+                logger.warning("Could not delete %s: %s", name, e)
+                counts["failed"] += 1
+        with self._cond:
+            for key, value in counts.items():
+                self.counters[key] += value
+
+    def _ensure_thread(self):
+        # Threads started before a fork do not exist in the child
+        with self._cond:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="file-sweeper", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._busy = True
+            try:
+                self.sweep(batch)
+            except Exception as e:
+                # e.g. the database went away; these files are left for sweep-files
+                logger.warning("File sweep failed: %s", e)
+                with self._cond:
+                    self.counters["failed"] += len(batch)
+            finally:
+                close_old_connections()
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+def get_file_sweeper() -> FileSweeper:
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = FileSweeper(batch_size=settings.FILE_SWEEP_BATCH_SIZE)
+    return _sweeper
+
+
+def sweeper_metrics() -> Dict[str, Any]:
+    return _sweeper.snapshot() if _sweeper is not None else {}
+
+
+def orphaned_files(min_age: float = 3600) -> Iterator[str]:
+    """
+    Stored uploads no document references, e.g. left by a crash before the
+    sweeper ran. Files younger than ``min_age`` seconds may belong to an
+    upload still being saved and are skipped.
+    """
+    storage = Document._meta.get_field("file").storage
+    directory = Document._meta.get_field("file").upload_to.rstrip("/")
+    try:
+        _, filenames = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    cutoff = time.time() - min_age
+    names = [f"{directory}/{filename}" for filename in sorted(filenames)]
+    for batch in chunked(names, settings.BULK_CHUNK_SIZE):
+        referenced = set(Document.objects.filter(file__in=batch).values_list("file", flat=True))
+        for name in batch:
+            if name not in referenced and storage.get_modified_time(name).timestamp() < cutoff:
+                yield name
@@ -0,0 +1,357 @@
+# bulk_import.py
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List
+
+from django.core.files import File
+from django.db import close_old_connections, transaction
+
+from .doc_processor import TEXT_EXTRACTORS, extract_document
+from .downloads import document_sha256, file_sha256
+from .models import Document
+from .pipeline import DEFAULT_ARTIFACTS_DIR, _stamp, extract_status, process_document, stage_version
+
+
+# Checkpoint statuses; the last line for a path wins
+COMMITTED = "committed"   # Document row and extracted text saved; later stages not yet run
+IMPORTED = "imported"     # all stages ran
+DUPLICATE = "duplicate"   # same content already imported
+FAILED = "failed"         # hashing or extraction raised
+
+
+def walk_files(root: str, exclude: str = None) -> Iterator[str]:
+    """Supported files under root, in a stable order so runs are reproducible."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.abspath(os.path.join(dirpath, name))
+            if path != exclude and os.path.splitext(name)[1].lower() in TEXT_EXTRACTORS:
+                yield path
+
+
+# -----------------------
+# CHECKPOINT
+# -----------------------
+class Checkpoint:
+    """
+    Append-only JSON-lines log of per-file outcomes. A line is written only
+    after the database commit it describes, so replaying the log after a
+    crash never skips work that was lost.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        valid_bytes = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn final line from a crash
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.entries[entry["path"]] = entry
+                    valid_bytes += len(line)
+            # Drop the torn tail so new entries start on a fresh line
+            os.truncate(path, valid_bytes)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, entries: List[dict]) -> None:
+        for entry in entries:
+            self.entries[entry["path"]] = entry
+            self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# -----------------------
+# PROGRESS
+# -----------------------
+class ImportProgress:
+    def __init__(self, total: int):
+        self.total = total
+        self.started = time.monotonic()
+        self.counts = {COMMITTED: 0, IMPORTED: 0, DUPLICATE: 0, FAILED: 0}
+        self.finished = 0
+
+    def finish(self, status: str) -> None:
+        self.counts[status] += 1
+        if status != COMMITTED:
+            self.finished += 1
+
+    def report(self, llm_queue: int = 0) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.finished / elapsed if elapsed else 0.0
+        remaining = self.total - self.finished
+        eta = time.strftime("%H:%M:%S", time.gmtime(remaining / rate)) if rate else "--:--:--"
+        pct = 100 * self.finished / self.total if self.total else 100
+        return (
+            f"{self.finished}/{self.total} files ({pct:.0f}%) | {rate:.1f} files/s | ETA {eta} | "
+            f"imported {self.counts[IMPORTED]}, duplicates {self.counts[DUPLICATE]}, "
+            f"failed {self.counts[FAILED]}, awaiting LLM {llm_queue}"
+        )
+
+
+# -----------------------
+# IMPORTER
+# -----------------------
+class BulkImporter:
+    """
+    Imports a directory tree in three overlapping phases:
+    hashing and extraction in a process pool, bulk inserts in one transaction
+    per batch, and the remaining pipeline stages (translate, summarise,
+    classify) in a thread pool capped at ``llm_concurrency``.
+    """
+
+    def __init__(
+        self,
+        checkpoint: Checkpoint,
+        workers: int = None,
+        llm_concurrency: int = 4,
+        batch_size: int = 200,
+        extract_only: bool = False,
+        retry_failed: bool = False,
+        translate: bool = True,
+        department=None,
+        uploaded_by=None,
+        artifacts_dir: str = DEFAULT_ARTIFACTS_DIR,
+        gemini_api_key: str = "",
+        report: Callable[[str], None] = print,
+        report_interval: float = 5.0,
+    ):
+        self.checkpoint = checkpoint
+        self.workers = workers or os.cpu_count() or 2
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.extract_only = extract_only
+        self.retry_failed = retry_failed
+        self.translate = translate
+        self.department = department
+        self.uploaded_by = uploaded_by
+        self.artifacts_dir = artifacts_dir
+        self.gemini_api_key = gemini_api_key
+        self.report = report
+        self.report_interval = report_interval
+
+    # -----------------------
+    # PLANNING
+    # -----------------------
+    def known_hashes(self) -> set:
+        """Content hashes of every stored document (computed once, then cached in metadata)."""
+        hashes = set()
+        for doc in Document.objects.only("id", "file", "metadata").iterator(chunk_size=2000):
+            meta = doc.metadata or {}
+            if meta.get("sha256"):
+                hashes.add(meta["sha256"])
+            elif doc.file and doc.file.storage.exists(doc.file.name):
+                hashes.add(document_sha256(doc))
+        return hashes
+
+    def plan(self, root: str):
+        """
+        Split the tree into new paths and documents committed but not finished
+        last run, as {doc_id: path}. With retry_failed, files that failed to
+        hash or extract are retried, and documents whose later stages raised
+        are resumed like committed ones.
+        """
+        todo, resume = [], {}
+        for path in walk_files(root, exclude=os.path.abspath(self.checkpoint.path)):
+            entry = self.checkpoint.entries.get(path)
+            retry = self.retry_failed and entry is not None and entry["status"] == FAILED
+            if entry is None or (retry and not entry.get("doc_id")):
+                todo.append(path)
+            elif entry["status"] == COMMITTED or retry:
+                resume[entry["doc_id"]] = path
+        return todo, resume
+
+    # -----------------------
+    # DATABASE
+    # -----------------------
+    def commit_batch(self, batch: List[dict]) -> List[Document]:
+        """
+        Copy the files into storage, then insert every row in one transaction.
+        If that fails the copies are deleted again; what a hard crash in
+        between leaves behind is removed by sweep-files (orphaned_files).
+        """
+        field = Document._meta.get_field("file")
+        docs, saved = [], []
+        try:
+            for item in batch:
+                name = field.generate_filename(None, os.path.basename(item["path"]))
+                with open(item["path"], "rb") as f:
+                    name = field.storage.save(name, File(f), max_length=field.max_length)
+                saved.append(name)
+
+                metadata = {
+                    **item["result"]["metadata"],
+                    "sha256": item["sha256"],
+                    "sha256_size": item["size"],
+                    "sha256_mtime": field.storage.get_modified_time(name).timestamp(),
+                }
+                state = {}
+                _stamp(state, "extract", stage_version("extract"), item["sha256"], *extract_status(item["result"]))
+                docs.append(Document(
+                    title=os.path.basename(item["path"]),
+                    uploaded_by=self.uploaded_by,
+                    department=self.department,
+                    file=name,
+                    extracted_text=item["result"]["text"],
+                    metadata=metadata,
+                    pipeline_state=state,
+                ))
+
+            with transaction.atomic():
+                Document.objects.bulk_create(docs)
+        except Exception:
+            for name in saved:
+                field.storage.delete(name)
+            raise
+        return docs
+
+    def finish_document(self, doc: Document) -> Document:
+        """Runs in an LLM thread: the stages after extract, persisted by process_document."""
+        try:
+            process_document(
+                doc,
+                artifacts_dir=self.artifacts_dir,
+                gemini_api_key=self.gemini_api_key,
+                translate=self.translate,
+            )
+        finally:
+            close_old_connections()
+        return doc
+
+    # -----------------------
+    # MAIN LOOP
+    # -----------------------
+    def run(self, root: str) -> ImportProgress:
+        todo, resume = self.plan(root)
+        known = self.known_hashes()
+        progress = ImportProgress(len(todo) + len(resume))
+        paths = iter(todo)
+        max_in_flight = self.workers * 4
+        max_llm_backlog = self.llm_concurrency * 8
+
+        hashing, extracting, llm = {}, {}, {}
+        # Copies of a file still being extracted, by hash: recorded as duplicates
+        # once it is committed, or extracted in its place if it fails
+        waiting: Dict[str, List[str]] = {}
+        ready: List[dict] = []
+        finished_entries: List[dict] = []  # outcomes not yet written to the checkpoint
+        last_report = 0.0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool, \
+                ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="import-llm") as llm_pool:
+
+            def queue_llm(doc, path):
+                llm[llm_pool.submit(self.finish_document, doc)] = (path, doc.id)
+
+            if not self.extract_only:
+                for doc in Document.objects.filter(id__in=list(resume)):
+                    queue_llm(doc, resume[doc.id])
+
+            exhausted = False
+            while True:
+                # Feed the pool, holding back while the LLM stage is the bottleneck
+                while not exhausted and len(hashing) + len(extracting) < max_in_flight and len(llm) < max_llm_backlog:
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                        break
+                    hashing[pool.submit(file_sha256, path)] = path
+
+                flush = ready and (len(ready) >= self.batch_size or (exhausted and not hashing and not extracting))
+                if flush:
+                    batch, ready = ready[:self.batch_size], ready[self.batch_size:]
+                    docs = self.commit_batch(batch)
+                    entries = [
+                        {"path": item["path"], "sha256": item["sha256"], "doc_id": doc.id, "status": COMMITTED}
+                        for item, doc in zip(batch, docs)
+                    ]
+                    if self.extract_only:
+                        for entry in entries:
+                            entry["status"] = IMPORTED
+                    copies = [
+                        {"path": path, "sha256": item["sha256"], "status": DUPLICATE}
+                        for item in batch for path in waiting.pop(item["sha256"], [])
+                    ]
+                    self.checkpoint.record(entries + copies)
+                    for entry, doc in zip(entries, docs):
+                        progress.finish(entry["status"])
+                        if not self.extract_only:
+                            queue_llm(doc, entry["path"])
+                    for _ in copies:
+                        progress.finish(DUPLICATE)
+
+                pending = set(hashing) | set(extracting) | set(llm)
+                if not pending:
+                    if not ready and exhausted:
+                        break
+                    continue
+                done, _ = wait(pending, timeout=self.report_interval, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in hashing:
+                        path = hashing.pop(future)
+                        try:
+                            sha = future.result()
+                        except Exception as e:
+                            finished_entries.append({"path": path, "status": FAILED, "error": str(e)})
+                            progress.finish(FAILED)
+                            continue
+                        if sha in waiting:
+                            waiting[sha].append(path)  # a copy of a file this run has not committed yet
+                            continue
+                        if sha in known:
+                            finished_entries.append({"path": path, "sha256": sha, "status": DUPLICATE})
+                            progress.finish(DUPLICATE)
+                            continue
+                        known.add(sha)
+                        waiting[sha] = []
+                        extracting[pool.submit(extract_document, path)] = (path, sha)
+
+                    elif future in extracting:
+                        path, sha = extracting.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            finished_entries.append({"path": path, "sha256": sha, "status": FAILED, "error": str(e)})
+                            progress.finish(FAILED)
+                            if waiting[sha]:
+                                # Same content under another path: it gets its own try
+                                retry = waiting[sha].pop(0)
+                                extracting[pool.submit(extract_document, retry)] = (retry, sha)
+                            else:
+                                del waiting[sha]
+                                known.discard(sha)
+                            continue
+                        ready.append({"path": path, "sha256": sha, "size": os.path.getsize(path), "result": result})
+
+                    else:
+                        path, doc_id = llm.pop(future)
+                        try:
+                            future.result()
+                        except Exception as e:
+                            finished_entries.append({"path": path, "doc_id": doc_id, "status": FAILED, "error": str(e)})
+                            progress.finish(FAILED)
+                            continue
+                        finished_entries.append({"path": path, "doc_id": doc_id, "status": IMPORTED})
+                        progress.finish(IMPORTED)
+
+                if finished_entries:
+                    self.checkpoint.record(finished_entries)
+                    finished_entries = []
+
+                if time.monotonic() - last_report >= self.report_interval:
+                    self.report(progress.report(len(llm)))
+                    last_report = time.monotonic()
+
+        self.report(progress.report(0))
+        return progress
@@ -0,0 +1,220 @@
+# compact_model.py
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List
+
+FORMAT_VERSION = 1
+COMPACT_DIRNAME = "compact"
+SOURCE_FILES = [
+    "label_binarizer.joblib",
+    "ovr_logreg.joblib",
+    "tfidf_vectorizer.joblib",
+    "thresholds.json",
+]
+
+
+def artifacts_fingerprint(artifacts_dir: str) -> str:
+    """Content hash of the sklearn artifacts a compact export is derived from."""
+    digest = hashlib.sha256()
+    for name in SOURCE_FILES:
+        path = os.path.join(artifacts_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            digest.update(name.encode("utf-8"))
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+# -----------------------
+# EXPORT (NEEDS SCIKIT-LEARN)
+# -----------------------
+def _effective_idf(vect):
+    """
+    The IDF weights vect.transform actually applies. Vectorizers pickled by
+    older scikit-learn releases only carry ``_idf_diag``, which current
+    releases ignore, so those apply no IDF weighting at all.
+    """
+    import numpy as np
+
+    tfidf = vect._tfidf
+    if vect.use_idf and hasattr(tfidf, "idf_"):
+        return np.asarray(tfidf.idf_, dtype=np.float32)
+    return np.ones(len(vect.vocabulary_), dtype=np.float32)
+
+
+def _unsupported_options(vect) -> List[str]:
+    """Vectorizer options CompactVectorizer cannot reproduce, by name."""
+    unsupported = []
+    if vect.analyzer != "word":
+        unsupported.append("analyzer")
+    if vect.sublinear_tf:
+        unsupported.append("sublinear_tf")
+    if vect.norm not in ("l2", None):
+        unsupported.append("norm")
+    if vect.binary:
+        unsupported.append("binary")
+    if vect.strip_accents is not None:
+        unsupported.append("strip_accents")
+    if not isinstance(vect.lowercase, bool):
+        unsupported.append("lowercase")
+    if vect.preprocessor is not None:
+        unsupported.append("preprocessor")
+    if vect.tokenizer is not None:
+        unsupported.append("tokenizer")
+    # sklearn keeps the one capturing group, if any, as findall does
+    if not isinstance(vect.token_pattern, str) or re.compile(vect.token_pattern).groups > 1:
+        unsupported.append("token_pattern")
+    return unsupported
+
+
+def export_compact_model(artifacts_dir: str, out_dir: str = None) -> Dict[str, Any]:
+    """
+    Write the TF-IDF vectorizer and OvR logistic regression as flat arrays:
+    float32 IDF/coefficients, a sorted fixed-width vocabulary and a JSON
+    header. Every array is loadable with ``np.load(mmap_mode="r")``.
+    """
+    import numpy as np
+    from .doc_processor import load_artifacts
+
+    out_dir = out_dir or os.path.join(artifacts_dir, COMPACT_DIRNAME)
+    os.makedirs(out_dir, exist_ok=True)
+    vect, clf, mlb, labels, thr_arr = load_artifacts(artifacts_dir)
+
+    unsupported = _unsupported_options(vect)
+    if unsupported:
+        raise ValueError(
+            "Only word-analyzer, linear-tf TF-IDF vectorizers can be exported "
+            f"(unsupported: {', '.join(unsupported)})"
+        )
+
+    terms = sorted(vect.vocabulary_)
+    vocab = np.array(terms, dtype=f"<U{max(len(t) for t in terms)}")
+    index = np.array([vect.vocabulary_[t] for t in terms], dtype=np.int32)
+    coef = np.vstack([e.coef_.ravel() for e in clf.estimators_]).astype(np.float32)
+    intercept = np.array([e.intercept_[0] for e in clf.estimators_], dtype=np.float32)
+
+    np.save(os.path.join(out_dir, "vocab.npy"), vocab)
+    np.save(os.path.join(out_dir, "vocab_index.npy"), index)
+    np.save(os.path.join(out_dir, "idf.npy"), _effective_idf(vect))
+    np.save(os.path.join(out_dir, "coef.npy"), coef)
+    np.save(os.path.join(out_dir, "intercept.npy"), intercept)
+
+    stop_words = sorted(vect.get_stop_words() or [])
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "source_fingerprint": artifacts_fingerprint(artifacts_dir),
+        "labels": labels,
+        "thresholds": thr_arr.tolist(),
+        "n_features": len(terms),
+        "lowercase": vect.lowercase,
+        "token_pattern": vect.token_pattern,
+        "ngram_range": list(vect.ngram_range),
+        "norm": vect.norm,
+        "stop_words": stop_words,
+        "normalize_proba": not clf.multilabel_,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# -----------------------
+# RUNTIME (NUMPY ONLY)
+# -----------------------
+class CompactVectorizer:
+    """Drop-in for TfidfVectorizer.transform returning dense float64 rows."""
+
+    def __init__(self, vocab, index, idf, meta):
+        self.vocab = vocab
+        self.index = index
+        self.idf = idf
+        self.n_features = meta["n_features"]
+        self.lowercase = meta["lowercase"]
+        self.token_re = re.compile(meta["token_pattern"])
+        self.min_n, self.max_n = meta["ngram_range"]
+        self.norm = meta["norm"]
+        self.stop_words = frozenset(meta["stop_words"])
+
+    def analyze(self, text: str) -> List[str]:
+        if self.lowercase:
+            text = text.lower()
+        tokens = [t for t in self.token_re.findall(text) if t not in self.stop_words]
+        terms = tokens if self.min_n == 1 else []
+        for n in range(max(self.min_n, 2), self.max_n + 1):
+            terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    def transform(self, texts: List[str]):
+        import numpy as np
+
+        X = np.zeros((len(texts), self.n_features), dtype=np.float64)
+        for row, text in enumerate(texts):
+            terms = self.analyze(text)
+            if not terms:
+                continue
+            terms = np.array(terms)
+            pos = np.searchsorted(self.vocab, terms)
+            pos[pos == len(self.vocab)] = 0
+            known = self.vocab[pos] == terms
+            np.add.at(X[row], self.index[pos[known]], 1.0)
+
+        X *= self.idf
+        if self.norm == "l2":
+            norms = np.linalg.norm(X, axis=1, keepdims=True)
+            np.divide(X, norms, out=X, where=norms != 0)
+        return X
+
+
+class CompactClassifier:
+    """Drop-in for OneVsRestClassifier(LogisticRegression).predict_proba."""
+
+    def __init__(self, coef, intercept, normalize: bool):
+        self.coef = coef
+        self.intercept = intercept
+        self.normalize = normalize
+
+    def predict_proba(self, X):
+        import numpy as np
+
+        scores = X @ self.coef.T + self.intercept
+        Y = 1.0 / (1.0 + np.exp(-scores))
+        if self.normalize:
+            row_sums = Y.sum(axis=1, keepdims=True)
+            np.divide(Y, row_sums, out=Y, where=row_sums != 0)
+        return Y
+
+
+def load_compact_artifacts(compact_dir: str):
+    """
+    Memory-map an exported model read-only, so every worker shares the same
+    page-cache copy. Returns load_artifacts' tuple, with mlb set to None.
+    """
+    import numpy as np
+
+    with open(os.path.join(compact_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact model format: {meta.get('format_version')}")
+
+    def mmap(name):
+        return np.load(os.path.join(compact_dir, name), mmap_mode="r")
+
+    vect = CompactVectorizer(mmap("vocab.npy"), mmap("vocab_index.npy"), mmap("idf.npy"), meta)
+    clf = CompactClassifier(mmap("coef.npy"), mmap("intercept.npy"), meta["normalize_proba"])
+    thr_arr = np.array(meta["thresholds"], dtype=float)
+    return vect, clf, None, meta["labels"], thr_arr
+
+
+def compact_is_current(artifacts_dir: str) -> bool:
+    meta_path = os.path.join(artifacts_dir, COMPACT_DIRNAME, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return (
+        meta.get("format_version") == FORMAT_VERSION
+        and meta.get("source_fingerprint") == artifacts_fingerprint(artifacts_dir)
+    )
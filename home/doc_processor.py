@@ -4,14 +4,22 @@ import re
 import csv
 import json
 import datetime
-from typing import Dict, Any, List, Tuple
-
-import pandas as pd
-import PyPDF2
-import docx
-import numpy as np
-from joblib import load
-import google.generativeai as genai
+import zipfile
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Heavy third-party modules are imported inside the functions that use them, so
+# web-only processes (views, migrate, autoreload) never pay for them.
+# pipeline.warm_up() imports them ahead of time for ingest workers.
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "PyPDF2",
+    "lxml.etree",
+    "joblib",
+    "sklearn.feature_extraction.text",
+    "sklearn.multiclass",
+    "google.generativeai",
+]
 
 
 # -----------------------
@@ -31,25 +39,136 @@ BOOST_VALUE = 0.15
 # -----------------------
 # FILE EXTRACTION
 # -----------------------
-def extract_text_from_pdf(file_path: str) -> Tuple[str, int]:
-    """Extract text from PDF and return text + page count"""
-    text = []
-    pages = 0
+def extract_pdf_pages(file_path: str) -> List[str]:
+    """Text of every PDF page, in order; pages without a text layer are ''."""
+    import PyPDF2
+
+    pages = []
     try:
         with open(file_path, "rb") as f:
             reader = PyPDF2.PdfReader(f)
-            pages = len(reader.pages)
             for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text.append(page_text)
+                pages.append(page.extract_text() or "")
     except Exception:
         pass
-    return "\n".join(text), pages
+    return pages
+
+def join_pages(pages: List[str]) -> Tuple[str, List[int]]:
+    """Join page texts like extract_text_from_pdf, plus each page's start offset."""
+    text, offsets, pos = [], [], 0
+    for page_text in pages:
+        offsets.append(pos)
+        if page_text:
+            text.append(page_text)
+            pos += len(page_text) + 1
+    return "\n".join(text), offsets
+
+def extract_text_from_pdf(file_path: str) -> Tuple[str, int]:
+    """Extract text from PDF and return text + page count"""
+    pages = extract_pdf_pages(file_path)
+    return join_pages(pages)[0], len(pages)
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_T, W_TAB, W_BR, W_CR = (W_NS + t for t in ("p", "t", "tab", "br", "cr"))
+W_TBL, W_TR, W_TC = (W_NS + t for t in ("tbl", "tr", "tc"))
+W_SDT, W_SDT_CONTENT = W_NS + "sdt", W_NS + "sdtContent"
+W_TXBX_CONTENT = W_NS + "txbxContent"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+DOCX_CELL_SEP = " | "
+DOCX_PART_RE = re.compile(r"word/(header|footer)(\d*)\.xml$")
+DOCX_BREAKS = {W_TAB: "\t", W_BR: "\n", W_CR: "\n"}
+
+def _docx_paragraph_text(p) -> str:
+    return "".join(
+        (el.text or "") if el.tag == W_T else DOCX_BREAKS[el.tag]
+        for el in p.iter(W_T, W_TAB, W_BR, W_CR)
+    )
+
+def _docx_cell_text(container) -> str:
+    """A cell's paragraphs on one line; nested tables are flattened into it."""
+    texts = []
+    for child in container:
+        if child.tag == W_P:
+            texts.append(_docx_paragraph_text(child))
+        elif child.tag == W_TBL:
+            texts.extend(_docx_row_text(tr) for tr in child.iterchildren(W_TR))
+        elif child.tag in (W_SDT, W_SDT_CONTENT):
+            texts.append(_docx_cell_text(child))  # content controls
+    return " ".join(t for t in texts if t.strip())
+
+def _docx_row_text(tr) -> str:
+    cells = []
+    for child in tr:
+        if child.tag == W_TC:
+            cells.append(_docx_cell_text(child))
+        elif child.tag == W_SDT:
+            # Content control wrapping whole cells
+            cells.extend(_docx_cell_text(tc) for tc in child.iter(W_TC) if tc.getparent().tag == W_SDT_CONTENT)
+    return DOCX_CELL_SEP.join(cells) if any(cells) else ""
+
+def _docx_is_nested(el) -> bool:
+    """Inside a table cell or text box, so read as part of its container."""
+    for ancestor in el.iterancestors():
+        if ancestor.tag in (W_TC, W_TXBX_CONTENT):
+            return True
+    return False
+
+def iter_docx_part(stream) -> Iterator[str]:
+    """
+    Lines of one WordprocessingML part in document order: a line per
+    paragraph and per table row, cells joined with DOCX_CELL_SEP. Only end
+    events are handled and finished elements are dropped straight away, so
+    memory stays flat however long the part or its tables are.
+    """
+    from lxml import etree
+
+    for _, el in etree.iterparse(stream, events=("end",), tag=(W_P, W_TR, MC_FALLBACK), huge_tree=True):
+        if el.tag == MC_FALLBACK:
+            # Legacy copy of the mc:Choice content (e.g. VML text boxes)
+            el.getparent().remove(el)
+            continue
+        if _docx_is_nested(el):
+            continue
+
+        if el.tag == W_P:
+            yield _docx_paragraph_text(el)
+        else:
+            line = _docx_row_text(el)
+            if line:
+                yield line
+
+        el.clear()
+        parent = el.getparent()
+        while el.getprevious() is not None:
+            del parent[0]
 
 def extract_text_from_docx(file_path: str) -> str:
-    doc = docx.Document(file_path)
-    return "\n".join([para.text for para in doc.paragraphs])
+    """
+    Body text plus tables, with page headers first and footers last. Headers
+    and footers that repeat across sections are kept once.
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        parts = {"header": [], "footer": []}
+        for name in zf.namelist():
+            match = DOCX_PART_RE.match(name)
+            if match:
+                parts[match.group(1)].append((int(match.group(2) or 0), name))
+
+        def read(names):
+            seen, lines = set(), []
+            for _, name in sorted(names):
+                with zf.open(name) as f:
+                    text = "\n".join(line for line in iter_docx_part(f) if line.strip())
+                if text and text not in seen:
+                    seen.add(text)
+                    lines.append(text)
+            return lines
+
+        headers = read(parts["header"])
+        with zf.open("word/document.xml") as f:
+            body = list(iter_docx_part(f))
+        footers = read(parts["footer"])
+    return "\n".join(headers + body + footers)
 
 def extract_text_from_csv(file_path: str) -> str:
     text = []
@@ -63,6 +182,8 @@ def extract_text_from_csv(file_path: str) -> str:
     return "\n".join(text)
 
 def extract_text_from_excel(file_path: str) -> str:
+    import pandas as pd
+
     text = []
     try:
         dfs = pd.read_excel(file_path, sheet_name=None)
@@ -88,25 +209,42 @@ def extract_text_from_txt(file_path: str) -> str:
     except Exception:
         return ""
 
+TEXT_EXTRACTORS = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+    ".csv": extract_text_from_csv,
+    ".xls": extract_text_from_excel,
+    ".xlsx": extract_text_from_excel,
+    ".json": extract_text_from_json,
+    ".txt": extract_text_from_txt,
+}
+
 def extract_document(file_path: str) -> Dict[str, Any]:
-    """Extract text and metadata from any supported file type."""
+    """
+    Extract text and metadata from any supported file type. "errors" lists
+    scanned pages that could not be OCR'd, so the caller can retry them.
+    """
     ext = os.path.splitext(file_path)[1].lower()
-    text_extractors = {
-        ".pdf": extract_text_from_pdf,
-        ".docx": extract_text_from_docx,
-        ".csv": extract_text_from_csv,
-        ".xls": extract_text_from_excel,
-        ".xlsx": extract_text_from_excel,
-        ".json": extract_text_from_json,
-        ".txt": extract_text_from_txt,
-    }
+    text_extractors = TEXT_EXTRACTORS
 
     if ext not in text_extractors:
         raise ValueError(f"Unsupported file type: {ext}")
 
-    # Extract text and optional PDF page count
+    # Extract text, plus page count and page boundaries for PDFs
+    page_offsets = None
+    ocr = None
+    errors = []
     if ext == ".pdf":
-        text, pages = text_extractors[ext](file_path)
+        from .ocr import ocr_errors, ocr_missing_pages
+
+        # Only pages without a text layer are OCR'd; the rest keep the fast path
+        page_texts, ocr = ocr_missing_pages(file_path, extract_pdf_pages(file_path))
+        errors = ocr_errors(ocr)
+        text, page_offsets = join_pages(page_texts)
+        pages = len(page_texts)
+        # Offsets must stay valid once leading whitespace is stripped below
+        lead = len(text) - len(text.lstrip())
+        page_offsets = [max(0, o - lead) for o in page_offsets]
     else:
         text = text_extractors[ext](file_path)
         pages = None
@@ -117,36 +255,129 @@ def extract_document(file_path: str) -> Dict[str, Any]:
         "size_bytes": os.path.getsize(file_path),
         "extraction_timestamp_utc": datetime.datetime.utcnow().isoformat(),
         "pages": pages,
+        "page_offsets": page_offsets,
     }
+    if ocr:
+        metadata["ocr"] = ocr  # {"engine": ..., "pages": {"3": {"confidence": 91.2, "seconds": 1.8, ...}}}
 
-    return {"text": text.strip(), "metadata": metadata}
+    return {"text": text.strip(), "metadata": metadata, "errors": errors}
 
 # -----------------------
 # GEMINI TRANSLATION / SUMMARIZATION
 # -----------------------
 def setup_gemini(api_key: str, model_name="gemini-2.5-flash-lite"):
+    import google.generativeai as genai
+
     genai.configure(api_key=api_key)
     return genai.GenerativeModel(model_name)
 
-def translate_to_english(model, text: str) -> str:
-    prompt = (
+def translation_prompt(text: str) -> str:
+    return (
         "Translate the following text to English. "
         "Return only the translated text without any extra commentary:\n\n"
         f"{text}"
     )
-    response = model.generate_content(prompt)
-    return response.text.strip()
 
-def summarise_text(model, text: str) -> str:
-    prompt = (
+PAGE_MARKER = "<<<PAGE {}>>>"
+
+def pages_translation_prompt(pages: List[Tuple[int, str]]) -> str:
+    """One prompt for several (page number, text) pairs, each after its marker line."""
+    body = "\n".join(f"{PAGE_MARKER.format(n)}\n{text}" for n, text in pages)
+    return (
+        "Translate the following pages to English. Keep every "
+        f"{PAGE_MARKER.format('N')} line exactly as it is, and return only the "
+        "marker lines and the translated text without any extra commentary:\n\n"
+        f"{body}"
+    )
+
+def split_translated_pages(text: str, numbers: List[int]) -> Optional[List[str]]:
+    """The translated pages in ``numbers`` order, or None if the markers did not survive."""
+    parts = re.split(r"^\s*<<<PAGE (\d+)>>>\s*$", text, flags=re.MULTILINE)
+    found = {int(n): page.strip() for n, page in zip(parts[1::2], parts[2::2])}
+    if sorted(found) != sorted(numbers):
+        return None
+    return [found[n] for n in numbers]
+
+def summary_prompt(text: str) -> str:
+    return (
         "Summarise the following document into 10 concise sentences. "
         "Include all key points (events, actions, financials, responsibilities, etc.). "
         "Avoid filler, repetition, or extra commentary.\n\n"
         f"{text}"
     )
-    response = model.generate_content(prompt)
+
+def revision_summary_prompt(previous_summary: str, changed_text: str, removed: int) -> str:
+    removed_note = f" {removed} page(s) of the previous version were removed." if removed else ""
+    return (
+        "A document has been revised. Below are the summary of the previous version "
+        "and the text of the pages that changed or were added." + removed_note + " "
+        "Update the summary to reflect the revision, keeping it to 10 concise sentences. "
+        "Return only the updated summary:\n\n"
+        f"Previous summary:\n{previous_summary}\n\n"
+        f"Changed pages:\n{changed_text}"
+    )
+
+def translate_to_english(model, text: str) -> str:
+    response = model.generate_content(translation_prompt(text))
+    return response.text.strip()
+
+def summarise_text(model, text: str) -> str:
+    response = model.generate_content(summary_prompt(text))
     return response.text.strip()
 
+# -----------------------
+# EXTRACTIVE SUMMARISATION (OFFLINE)
+# -----------------------
+MAX_RANKED_SENTENCES = 2000  # bounds TextRank's n^2 similarity matrix
+
+def split_sentences(text: str) -> List[str]:
+    sentences = (clean_text(s) for s in re.split(r"(?<=[.!?])\s+|\n{2,}", text))
+    return [s for s in sentences if s]
+
+def rank_sentences(sentences: List[str], vect, method: str = "centroid") -> "np.ndarray":
+    """
+    Score sentences in the classifier's TF-IDF space.
+    "centroid": similarity to the document's mean TF-IDF vector.
+    "textrank": PageRank over the sentence cosine-similarity graph.
+    """
+    import numpy as np
+
+    X = vect.transform(sentences)  # rows are L2-normalised
+    if method == "textrank":
+        n = X.shape[0]
+        sim = X @ X.T
+        sim = sim.toarray() if hasattr(sim, "toarray") else np.array(sim)
+        np.fill_diagonal(sim, 0.0)
+        row_sums = sim.sum(axis=1, keepdims=True)
+        row_sums[row_sums == 0] = 1.0
+        transition = sim / row_sums
+        scores = np.full(n, 1.0 / n)
+        for _ in range(50):
+            updated = 0.15 / n + 0.85 * transition.T @ scores
+            if np.abs(updated - scores).sum() < 1e-6:
+                break
+            scores = updated
+        return scores
+
+    centroid = np.asarray(X.mean(axis=0)).ravel()
+    return np.asarray(X @ centroid).ravel()
+
+def extractive_summary(text: str, vect=None, max_sentences: int = 10, method: str = "centroid") -> str:
+    """
+    Offline stand-in for summarise_text: the top-ranked sentences in document
+    order, or simply the leading sentences when no vectorizer is given.
+    """
+    import numpy as np
+
+    sentences = split_sentences(text)
+    if vect is None or len(sentences) <= max_sentences:
+        return " ".join(sentences[:max_sentences])
+
+    candidates = sentences[:MAX_RANKED_SENTENCES]
+    scores = rank_sentences(candidates, vect, method)
+    top = sorted(np.argsort(scores)[::-1][:max_sentences])
+    return " ".join(candidates[i] for i in top)
+
 # -----------------------
 # CLASSIFIER
 # -----------------------
@@ -158,6 +389,9 @@ def clean_text(s: str) -> str:
     return s.strip()
 
 def load_artifacts(artifacts_dir: str):
+    import numpy as np
+    from joblib import load
+
     vect = load(os.path.join(artifacts_dir, "tfidf_vectorizer.joblib"))
     clf = load(os.path.join(artifacts_dir, "ovr_logreg.joblib"))
     mlb = load(os.path.join(artifacts_dir, "label_binarizer.joblib"))
@@ -173,9 +407,9 @@ def load_artifacts(artifacts_dir: str):
     thr_arr = np.array([float(thresholds.get(l, 0.5)) for l in labels], dtype=float)
     return vect, clf, mlb, labels, thr_arr
 
-def classify_text(text: str, vect, clf, labels, thr_arr, top_k_fallback=2):
-    t = clean_text(text)
-    probs_arr = clf.predict_proba(vect.transform([t]))[0]
+def apply_boosts_and_thresholds(t: str, probs_arr, labels, thr_arr, top_k_fallback=2):
+    """Turn one row of classifier probabilities into (chosen labels, sorted probs)."""
+    import numpy as np
 
     # --- Keyword boosting ---
     lower_text = t.lower()
@@ -197,51 +431,82 @@ def classify_text(text: str, vect, clf, labels, thr_arr, top_k_fallback=2):
     sorted_probs = sorted(probs_map.items(), key=lambda x: x[1], reverse=True)
     return chosen, sorted_probs
 
+def classify_texts(texts: List[str], vect, clf, labels, thr_arr, top_k_fallback=2):
+    """Vectorised classify_text: one transform and one predict_proba for the batch."""
+    cleaned = [clean_text(t) for t in texts]
+    probs = clf.predict_proba(vect.transform(cleaned))
+    return [
+        apply_boosts_and_thresholds(t, row, labels, thr_arr, top_k_fallback)
+        for t, row in zip(cleaned, probs)
+    ]
+
+def classify_text(text: str, vect, clf, labels, thr_arr, top_k_fallback=2):
+    return classify_texts([text], vect, clf, labels, thr_arr, top_k_fallback)[0]
+
 # -----------------------
-# FULL PIPELINE FOR DJANGO
+# SECTION-LEVEL CLASSIFICATION
 # -----------------------
-def process_and_classify(
-    file_path: str,
-    artifacts_dir: str,
-    gemini_api_key: str,
-    translate: bool = False
-) -> Dict[str, Any]:
+PAGE_CHARS = 3000          # pseudo-page size for formats without real pages
+MIN_SECTION_SHARE = 0.15   # a label must cover this share of the text to reach the document
+MIXED_LABEL = "Mixed"
+
+def split_pages(text: str, page_offsets: List[int] = None) -> List[str]:
+    """Page texts from extraction's boundaries, or PAGE_CHARS pseudo-pages."""
+    text = text or ""
+    if page_offsets:
+        ends = page_offsets[1:] + [len(text)]
+        return [text[start:end].strip() for start, end in zip(page_offsets, ends)]
+    return [text[i:i + PAGE_CHARS].strip() for i in range(0, max(len(text), 1), PAGE_CHARS)]
+
+def classify_sections(pages: List[str], vect, clf, labels, thr_arr, top_k_fallback=2):
     """
-    Extracts, optionally translates, summarises, classifies, and returns all fields.
-    Returns dictionary suitable for saving to Document model.
+    Classify every non-empty page in one batch, merge runs of pages with the
+    same labels into sections, and aggregate to document level.
+
+    Document scores are the length-weighted mean of page scores. A label is
+    kept when its sections cover at least MIN_SECTION_SHARE of the text, and
+    MIXED_LABEL is added when several labels each lead such a share.
+    Returns (chosen labels, sorted probs, sections) where each section is
+    ``{"pages": [first, last], "labels": [...], "scores": {...}}``.
     """
-    # Step 1: Extract
-    doc_result = extract_document(file_path)
-    raw_text = doc_result["text"]
-    metadata = doc_result["metadata"]
-
-    # Step 2: Setup Gemini
-    model = setup_gemini(gemini_api_key)
-
-    translated_text = None
-    if translate:
-        try:
-            translated_text = translate_to_english(model, raw_text)
-        except Exception:
-            translated_text = raw_text  # fallback
-
-    # Step 3: Summarise
-    try:
-        text_for_summary = translated_text if translated_text else raw_text
-        summary = summarise_text(model, text_for_summary)
-    except Exception:
-        summary = text_for_summary
-
-    # Step 4: Load artifacts + classify
-    vect, clf, mlb, labels, thr_arr = load_artifacts(artifacts_dir)
-    chosen_labels, sorted_probs = classify_text(summary, vect, clf, labels, thr_arr)
-
-    # Prepare final dict for saving to Document model
-    return {
-        "extracted_text": raw_text,
-        "translated_text": translated_text,
-        "summary": summary,
-        "predicted_labels": chosen_labels,
-        "probabilities": sorted_probs,
-        "metadata": metadata
-    }
+    import numpy as np
+
+    numbered = [(n, t) for n, t in enumerate(pages, start=1) if t.strip()]
+    if not numbered:
+        return [], [(label, 0.0) for label in labels], []
+    results = classify_texts([t for _, t in numbered], vect, clf, labels, thr_arr, top_k_fallback)
+
+    sections = []
+    for (n, t), (chosen, sorted_probs) in zip(numbered, results):
+        scores = dict(sorted_probs)
+        last = sections[-1] if sections else None
+        if last and last["labels"] == chosen and last["pages"][1] == n - 1:
+            weight = last["chars"] + len(t)
+            for label in labels:
+                last["scores"][label] = (last["scores"][label] * last["chars"] + scores[label] * len(t)) / weight
+            last["pages"][1] = n
+            last["chars"] = weight
+        else:
+            sections.append({"pages": [n, n], "labels": chosen, "scores": scores, "chars": len(t)})
+
+    total = sum(s["chars"] for s in sections)
+    doc_scores = np.zeros(len(labels))
+    coverage, leading = {}, {}
+    for s in sections:
+        share = s["chars"] / total
+        doc_scores += share * np.array([s["scores"][label] for label in labels])
+        for label in s["labels"]:
+            coverage[label] = coverage.get(label, 0.0) + share
+        top = max(s["labels"], key=lambda label: s["scores"][label])
+        leading[top] = leading.get(top, 0.0) + share
+
+    chosen = [label for label in labels if coverage.get(label, 0.0) >= MIN_SECTION_SHARE]
+    if not chosen:
+        chosen = [max(coverage, key=coverage.get)]
+    if sum(1 for share in leading.values() if share >= MIN_SECTION_SHARE) > 1:
+        chosen.append(MIXED_LABEL)
+
+    sorted_probs = sorted(zip(labels, doc_scores.tolist()), key=lambda x: x[1], reverse=True)
+    for s in sections:
+        del s["chars"]
+    return chosen, sorted_probs, sections
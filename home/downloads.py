@@ -0,0 +1,215 @@
+# downloads.py
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import (
+    content_disposition_header,
+    http_date,
+    parse_http_date_safe,
+    quote_etag,
+)
+
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+# -----------------------
+# VALIDATORS (ETAG / LAST-MODIFIED)
+# -----------------------
+def file_sha256(file_path: str) -> str:
+    """Hash a file in fixed-size chunks so large PDFs never sit in memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stored_sha256(doc) -> Optional[str]:
+    """The content hash cached in a Document's metadata, or None once the file's size or mtime no longer match."""
+    meta = doc.metadata or {}
+    if (
+        meta.get("sha256")
+        and meta.get("sha256_size") == doc.file.size
+        and meta.get("sha256_mtime") == document_last_modified(doc)
+    ):
+        return meta["sha256"]
+    return None
+
+
+def remember_sha256(doc, digest: str) -> None:
+    """Cache a freshly computed content hash in the Document's metadata."""
+    meta = dict(doc.metadata or {})
+    meta["sha256"] = digest
+    meta["sha256_size"] = doc.file.size
+    meta["sha256_mtime"] = document_last_modified(doc)
+    type(doc).objects.filter(pk=doc.pk).update(metadata=meta)
+    doc.metadata = meta
+
+
+def document_sha256(doc) -> str:
+    """
+    Content hash for a Document, cached in its metadata.
+    The hash is recomputed when the file's size or modified time changes.
+    """
+    digest = stored_sha256(doc)
+    if digest is None:
+        digest = file_sha256(doc.file.path)
+        remember_sha256(doc, digest)
+    return digest
+
+
+def document_last_modified(doc) -> Optional[float]:
+    try:
+        return doc.file.storage.get_modified_time(doc.file.name).timestamp()
+    except (OSError, NotImplementedError):
+        return None
+
+
+# -----------------------
+# RANGE HANDLING
+# -----------------------
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range`` header into an inclusive (start, end) pair.
+    Returns None when the whole file should be sent (no header, unknown unit or
+    a multi-range request) and raises RangeNotSatisfiable for ranges past EOF.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag: str, last_modified: Optional[float]) -> bool:
+    """A Range is honoured only if If-Range (when sent) still names this version."""
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    parsed = parse_http_date_safe(if_range)
+    return parsed is not None and last_modified is not None and int(last_modified) <= parsed
+
+
+class RangeFileWrapper:
+    """Iterate over ``length`` bytes of an open file, closing it when done."""
+
+    def __init__(self, filelike, offset: int, length: int, chunk_size: int = CHUNK_SIZE):
+        self.filelike = filelike
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.filelike.seek(offset)
+
+    def __iter__(self):
+        while self.remaining > 0:
+            data = self.filelike.read(min(self.chunk_size, self.remaining))
+            if not data:
+                break
+            self.remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.filelike.close()
+
+
+# -----------------------
+# RESPONSE BUILDING
+# -----------------------
+def _sendfile_response(doc, content_type: str) -> Optional[HttpResponse]:
+    """Hand the transfer to the front-end server when DOCUMENT_SENDFILE_BACKEND is set."""
+    backend = getattr(settings, "DOCUMENT_SENDFILE_BACKEND", None)
+    if not backend:
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if backend == "xaccel":
+        prefix = getattr(settings, "DOCUMENT_SENDFILE_PREFIX", "/protected/")
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + doc.file.name
+    elif backend == "xsendfile":
+        response["X-Sendfile"] = doc.file.path
+    else:
+        raise ValueError(f"Unknown DOCUMENT_SENDFILE_BACKEND: {backend}")
+    return response
+
+
+def document_file_response(request, doc):
+    """
+    Serve a Document's file with ETag/Last-Modified validators and single
+    byte-range support, or delegate to X-Sendfile / X-Accel-Redirect.
+    """
+    etag = quote_etag(document_sha256(doc))
+    last_modified = document_last_modified(doc)
+
+    not_modified = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified) if last_modified else None,
+    )
+    if not_modified is not None:
+        return not_modified
+
+    filename = os.path.basename(doc.file.name)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    size = doc.file.size
+
+    response = _sendfile_response(doc, content_type)
+    if response is None:
+        try:
+            byte_range = None
+            if if_range_matches(request, etag, last_modified):
+                byte_range = parse_range(request.META.get("HTTP_RANGE"), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        if byte_range is None:
+            response = FileResponse(doc.file.open("rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                RangeFileWrapper(doc.file.open("rb"), start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Length"] = str(length)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    max_age = getattr(settings, "DOCUMENT_DOWNLOAD_MAX_AGE", 3600)
+    response["Cache-Control"] = f"private, max-age={max_age}"
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
@@ -0,0 +1,214 @@
+# exports.py
+import csv
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+
+from .models import Document
+
+
+EXPORT_FORMATS = ["ndjson", "csv", "parquet"]
+EXPORT_CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+COLUMNS = [
+    "id",
+    "title",
+    "file",
+    "extension",
+    "size_bytes",
+    "pages",
+    "upload_date",
+    "uploaded_by",
+    "department",
+    "original_language",
+    "processed",
+    "last_processed",
+    "categories",
+    "confidence_scores",
+    "summary",
+]
+
+
+class ExportFilterError(ValueError):
+    pass
+
+
+# -----------------------
+# QUERY
+# -----------------------
+def filter_documents(
+    qs,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[str] = None,
+    department: Optional[str] = None,
+):
+    """
+    Dates are inclusive YYYY-MM-DD upload dates; category and department
+    match by name. Raises ExportFilterError on a malformed date.
+    """
+    for value, lookup in ((date_from, "upload_date__date__gte"), (date_to, "upload_date__date__lte")):
+        if value:
+            try:
+                parsed = parse_date(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise ExportFilterError(f"Invalid date: {value!r} (expected YYYY-MM-DD)")
+            qs = qs.filter(**{lookup: parsed})
+    if category:
+        qs = qs.filter(categories__name=category).distinct()
+    if department:
+        qs = qs.filter(department__name=department)
+    return qs
+
+
+def export_queryset(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[str] = None,
+    department: Optional[str] = None,
+):
+    """
+    Documents to export, oldest first, filtered as in filter_documents. The
+    extracted and translated text columns are deferred: they are the bulk
+    of each row and are not exported.
+    """
+    qs = (
+        Document.objects.select_related("uploaded_by", "department")
+        .prefetch_related("categories")
+        .defer(
+            "extracted_text", "translated_text", "page_translations",
+            "text_signature", "pipeline_state", "section_scores",
+        )
+        .order_by("id")
+    )
+    return filter_documents(qs, date_from, date_to, category, department)
+
+
+def export_row(doc) -> Dict[str, Any]:
+    metadata = doc.metadata or {}
+    return {
+        "id": doc.id,
+        "title": doc.title,
+        "file": doc.file.name,
+        "extension": metadata.get("extension") or os.path.splitext(doc.file.name)[1].lower(),
+        "size_bytes": metadata.get("size_bytes"),
+        "pages": metadata.get("pages"),
+        "upload_date": doc.upload_date,
+        "uploaded_by": doc.uploaded_by.username if doc.uploaded_by else None,
+        "department": doc.department.name if doc.department else None,
+        "original_language": doc.original_language,
+        "processed": doc.processed,
+        "last_processed": doc.last_processed,
+        # prefetched per chunk, so .all() does not query
+        "categories": sorted(c.name for c in doc.categories.all()),
+        "confidence_scores": doc.confidence_scores or {},
+        "summary": doc.summary,
+    }
+
+
+def iter_rows(qs, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Rows fetched chunk_size at a time, so memory stays flat however many there are."""
+    for doc in qs.iterator(chunk_size=chunk_size):
+        yield export_row(doc)
+
+
+# -----------------------
+# ENCODERS
+# -----------------------
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for row in rows:
+        yield (json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _Echo:
+    """File-like object whose write returns the line, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ";".join(value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Categories are ';'-joined and confidence scores JSON-encoded. The header
+    row is yielded before the first query runs, so clients get bytes at once.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS).encode("utf-8")
+    for row in rows:
+        yield writer.writerow([_csv_value(row[c]) for c in COLUMNS]).encode("utf-8")
+
+
+def write_parquet(rows: Iterable[Dict[str, Any]], path, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Append rows to a Parquet file one pandas chunk at a time (needs pyarrow).
+    Parquet's footer is written last, so this goes to a file, not a stream.
+    Returns the number of rows written.
+    """
+    try:
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow") from e
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("title", pa.string()),
+        ("file", pa.string()),
+        ("extension", pa.string()),
+        ("size_bytes", pa.int64()),
+        ("pages", pa.int64()),
+        ("upload_date", pa.timestamp("us", tz="UTC")),
+        ("uploaded_by", pa.string()),
+        ("department", pa.string()),
+        ("original_language", pa.string()),
+        ("processed", pa.bool_()),
+        ("last_processed", pa.timestamp("us", tz="UTC")),
+        ("categories", pa.list_(pa.string())),
+        ("confidence_scores", pa.string()),  # JSON: the label set can change between models
+        ("summary", pa.string()),
+    ])
+
+    def flush(chunk):
+        frame = pd.DataFrame(chunk, columns=COLUMNS)
+        frame["confidence_scores"] = frame["confidence_scores"].map(json.dumps)
+        writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+    total = 0
+    chunk = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                total += len(chunk)
+                chunk = []
+        if chunk or not total:
+            flush(chunk)
+            total += len(chunk)
+    return total
+
+
+STREAM_ENCODERS = {
+    "ndjson": iter_ndjson,
+    "csv": iter_csv,
+}
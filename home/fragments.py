@@ -0,0 +1,115 @@
+# fragments.py
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .models import Document
+
+
+# Bump when a fragment template changes, so stale renders are not served
+FRAGMENT_VERSION = 2
+# Stands in for {% csrf_token %}: the token is per request, the fragment is not
+CSRF_PLACEHOLDER = "<!--csrf-token-->"
+
+ADMIN_FRAGMENTS = {
+    "card": "fragments/admin_document_card.html",
+    "data": "fragments/admin_document_data.html",
+}
+DASHBOARD_FRAGMENTS = {
+    "card": "fragments/dashboard_document_card.html",
+    "data": "fragments/dashboard_document_data.html",
+}
+
+
+def get_fragment_cache():
+    return caches["fragments"]
+
+
+def fragment_key(name: str, doc, variant: str = "") -> str:
+    stamp = int(doc.updated_at.timestamp() * 1_000_000)
+    return f"docfrag:{FRAGMENT_VERSION}:{name}:{variant}:{doc.pk}:{stamp}"
+
+
+def csrf_input(request) -> str:
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request))
+
+
+def section_pages(sections, category_name):
+    """[first, last] page ranges of the sections labelled with category_name."""
+    return [s["pages"] for s in sections or [] if category_name in s["labels"]]
+
+
+def highlight_pages(category_name: str) -> Callable:
+    """``prepare`` for dashboard fragments: the pages classified for the viewer's category."""
+    def prepare(doc):
+        doc.relevant_pages = section_pages(doc.section_scores, category_name)
+    return prepare
+
+
+# -----------------------
+# PAGE ASSEMBLY
+# -----------------------
+def render_fragments(
+    docs,
+    templates: Dict[str, str],
+    variant: str = "",
+    prepare: Optional[Callable] = None,
+) -> Dict[Tuple[str, int], str]:
+    """
+    Rendered fragments by (name, document pk), from the cache where the
+    document's updated_at still matches. ``docs`` only needs pk and
+    updated_at loaded; the documents with a cache miss are fetched in full
+    with one query, passed through ``prepare`` and rendered. ``variant``
+    separates renders that depend on the viewer (e.g. the category whose
+    pages are highlighted). Fragments still hold CSRF_PLACEHOLDER.
+    """
+    cache = get_fragment_cache()
+    keys = {(name, doc.pk): fragment_key(name, doc, variant) for doc in docs for name in templates}
+    found = cache.get_many(keys.values())
+
+    missing = {doc_pk for (_, doc_pk), key in keys.items() if key not in found}
+    if missing:
+        rendered = {}
+        full_docs = (
+            Document.objects.filter(pk__in=missing)
+            .select_related("uploaded_by")
+            .prefetch_related("categories")
+            .defer("translated_text", "page_translations", "text_signature", "pipeline_state")
+        )
+        for doc in full_docs:
+            if prepare:
+                prepare(doc)
+            for name, template in templates.items():
+                key = keys[(name, doc.pk)]
+                if key not in found:
+                    rendered[key] = render_to_string(template, {"doc": doc})
+        cache.set_many(rendered, settings.DOCUMENT_FRAGMENT_TIMEOUT)
+        found.update(rendered)
+
+    # Documents deleted since the id list was read have no render
+    return {ref: found[key] for ref, key in keys.items() if key in found}
+
+
+def document_fragments(
+    request,
+    docs,
+    templates: Dict[str, str],
+    variant: str = "",
+    prepare: Optional[Callable] = None,
+) -> Dict[str, List[str]]:
+    """Fragments for each document, in ``docs`` order and keyed by the names in ``templates``."""
+    docs = list(docs)
+    found = render_fragments(docs, templates, variant, prepare)
+    token = csrf_input(request)
+    fragments = {name: [] for name in templates}
+    for doc in docs:
+        for name in templates:
+            html = found.get((name, doc.pk))
+            if html is not None:
+                fragments[name].append(mark_safe(html.replace(CSRF_PLACEHOLDER, token)))
+    return fragments
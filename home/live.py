@@ -0,0 +1,544 @@
+# live.py
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections, transaction
+from django.http import HttpRequest, QueryDict
+from django.http.cookie import parse_cookie
+from django.utils import timezone
+
+from .fragments import ADMIN_FRAGMENTS, DASHBOARD_FRAGMENTS, highlight_pages, render_fragments
+from .models import Document, DocumentEvent
+
+
+logger = logging.getLogger(__name__)
+
+# -----------------------
+# CHANNELS
+# -----------------------
+# Admins follow every document; users follow their role's category; an
+# uploader also follows the progress of their own uploads.
+ADMIN_CHANNEL = "admin"
+CATEGORY_PREFIX = "category:"
+
+def category_channel(name: str) -> str:
+    return f"{CATEGORY_PREFIX}{name}"
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def channel_fragments(channel: str, doc_ids: Iterable[int]) -> Dict[int, Dict[str, str]]:
+    """The cards a channel's dashboards show for these documents; none for user channels."""
+    if channel == ADMIN_CHANNEL:
+        templates, variant, prepare = ADMIN_FRAGMENTS, "", None
+    elif channel.startswith(CATEGORY_PREFIX):
+        variant = channel[len(CATEGORY_PREFIX):]
+        templates, prepare = DASHBOARD_FRAGMENTS, highlight_pages(variant)
+    else:
+        return {}
+    docs = Document.objects.filter(pk__in=list(doc_ids)).only("id", "updated_at")
+    fragments = defaultdict(dict)
+    for (name, doc_pk), html in render_fragments(docs, templates, variant, prepare).items():
+        fragments[doc_pk][name] = html
+    return fragments
+
+
+# -----------------------
+# PUBLISHING
+# -----------------------
+_bulk = contextvars.ContextVar("live_bulk", default=False)
+
+def live_enabled() -> bool:
+    """False inside bulk_changes(), where per-document signals stay quiet."""
+    return settings.LIVE_EVENTS_ENABLED and not _bulk.get()
+
+
+@contextmanager
+def bulk_changes():
+    """
+    Silence the per-document live signals (and their per-instance queries)
+    for a set-based operation, which then publishes with publish_many.
+    """
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+def publish(kind: str, doc_id: int, channels: Iterable[str], data: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Record an event for the open dashboards. The row is the hand-off between
+    processes (ingest workers, management commands, web workers); this
+    process's hub is also woken as soon as the row is committed.
+    """
+    channels = list(dict.fromkeys(c for c in channels if c))
+    if not settings.LIVE_EVENTS_ENABLED or not channels:
+        return
+    DocumentEvent.objects.create(kind=kind, document_id=doc_id, channels=channels, data=data or {})
+    transaction.on_commit(lambda: _hub.notify() if _hub is not None else None)
+
+
+def publish_many(kind: str, channels_by_doc: Dict[int, Iterable[str]]) -> None:
+    """
+    One event per document in a single insert. Past LIVE_REPLAY_LIMIT
+    documents, the affected dashboards are told to reload instead: a fresh
+    render is cheaper than patching that many cards.
+    """
+    if not settings.LIVE_EVENTS_ENABLED or not channels_by_doc:
+        return
+    if len(channels_by_doc) > settings.LIVE_REPLAY_LIMIT:
+        channels = list(dict.fromkeys(c for cs in channels_by_doc.values() for c in cs if c))
+        events = [DocumentEvent(kind="reload", document_id=0, channels=channels, data={})]
+    else:
+        events = [
+            DocumentEvent(kind=kind, document_id=doc_id, channels=list(dict.fromkeys(c for c in channels if c)), data={})
+            for doc_id, channels in channels_by_doc.items()
+        ]
+    DocumentEvent.objects.bulk_create(events)
+    transaction.on_commit(lambda: _hub.notify() if _hub is not None else None)
+
+
+def publish_progress(doc) -> None:
+    """A pipeline stage finished: tell the admins and the uploader."""
+    state = doc.pipeline_state or {}
+    stage = max(state, key=lambda s: state[s].get("finished_at") or "", default=None)
+    publish("progress", doc.pk, [ADMIN_CHANNEL, doc.uploaded_by_id and user_channel(doc.uploaded_by_id)], {
+        "title": doc.title,
+        "stage": stage,
+        "status": state[stage]["status"] if stage else None,
+        "stages": {s: entry.get("status") for s, entry in state.items()},
+        "processed": doc.processed,
+    })
+
+
+def publish_document(doc) -> None:
+    """A document was uploaded or (re)classified: push its card to every dashboard listing it."""
+    categories = list(doc.categories.values_list("name", flat=True))
+    channels = [ADMIN_CHANNEL, *(category_channel(name) for name in categories)]
+    if doc.uploaded_by_id:
+        channels.append(user_channel(doc.uploaded_by_id))
+    publish("document", doc.pk, channels, {"title": doc.title, "categories": categories, "processed": doc.processed})
+
+
+def publish_removed(doc_id: int, categories: Iterable[str], everywhere: bool = True) -> None:
+    """A document was deleted (everywhere) or left some categories."""
+    channels = [category_channel(name) for name in categories]
+    if everywhere:
+        channels.insert(0, ADMIN_CHANNEL)
+    publish("removed", doc_id, channels)
+
+
+# -----------------------
+# FAN-OUT
+# -----------------------
+class Subscriber:
+    """
+    One open stream. Delivery happens on the hub's thread: an asyncio
+    subscriber is handed events through its loop, a sync one (WSGI) through
+    a thread-safe queue. A subscriber that falls more than ``limit`` events
+    behind is cut off with None and resumes from the event log on reconnect.
+    """
+
+    def __init__(self, channels: List[str], loop: Optional[asyncio.AbstractEventLoop] = None, limit: int = 100):
+        self.channels = channels
+        self.loop = loop
+        self.limit = limit
+        self.queue = asyncio.Queue() if loop is not None else queue.Queue()
+        self.overflowed = False
+
+    def deliver(self, message: Optional[Dict[str, Any]]) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put, message)
+        else:
+            self._put(message)
+
+    def _put(self, message):
+        if self.overflowed:
+            return
+        if message is not None and self.queue.qsize() >= self.limit:
+            self.overflowed, message = True, None
+        self.queue.put_nowait(message)
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next message for a sync stream; raises queue.Empty after ``timeout`` seconds."""
+        return self.queue.get(timeout=timeout)
+
+    async def aget(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next message for an async stream; raises asyncio.TimeoutError after ``timeout`` seconds."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class LiveHub:
+    """
+    Per-process fan-out of DocumentEvent rows to open streams.
+
+    One thread polls the event log every ``poll_interval`` seconds, or at
+    once when this process published, and only while someone is connected:
+    the database sees one small indexed query per worker however many
+    dashboards are open. Document cards are rendered once per channel and
+    batch (and land in the fragment cache for the next page load), not once
+    per connection.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, batch_size: int = 200, retention: float = 3600):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.retention = retention
+
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers: Dict[str, set] = defaultdict(set)
+        self._count = 0
+        self._thread = None
+        self._pid = None
+        self._last_prune = 0.0
+        self.last_id = None
+
+        self.counters = {"connections": 0, "peak_connections": 0, "polls": 0, "events": 0, "delivered": 0, "overflowed": 0}
+
+    # -----------------------
+    # PUBLIC API
+    # -----------------------
+    def subscribe(self, channels: List[str], loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscriber:
+        subscriber = Subscriber(channels, loop, limit=settings.LIVE_QUEUE_SIZE)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscriber)
+            self._count += 1
+            self.counters["connections"] = self._count
+            self.counters["peak_connections"] = max(self.counters["peak_connections"], self._count)
+        self._ensure_thread()
+        self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            for channel in subscriber.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[channel]
+            self._count -= 1
+            self.counters["connections"] = self._count
+            if subscriber.overflowed:
+                self.counters["overflowed"] += 1
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def prime(self) -> None:
+        """
+        Start from the newest event when nobody is connected yet. Streams
+        call this before they subscribe and replay, so their backlog and the
+        live feed overlap (duplicates are dropped by id) instead of leaving
+        a gap.
+        """
+        with self._poll_lock:
+            if self.last_id is None or self._count == 0:
+                self.last_id = latest_event_id()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self.counters)
+            data["by_channel"] = {c: len(s) for c, s in self._subscribers.items()}
+        data["pid"] = os.getpid()
+        data["last_event_id"] = self.last_id
+        return data
+
+    # -----------------------
+    # POLLING
+    # -----------------------
+    def poll_once(self) -> int:
+        """Fetch the events after last_id and deliver them; returns how many were read."""
+        if self.last_id is None:
+            return 0
+        events = list(DocumentEvent.objects.filter(id__gt=self.last_id).order_by("id")[:self.batch_size])
+        self.counters["polls"] += 1
+        if not events:
+            return 0
+        self.last_id = events[-1].id
+        self.counters["events"] += len(events)
+
+        with self._lock:
+            listeners = {c: set(self._subscribers.get(c, ())) for e in events for c in e.channels}
+        # Cards are rendered after the whole batch is read, so they are current
+        fragments = {}
+        for channel, subscribers in listeners.items():
+            doc_ids = {e.document_id for e in events if e.kind == "document" and channel in e.channels}
+            if subscribers and doc_ids:
+                fragments[channel] = channel_fragments(channel, doc_ids)
+
+        delivered = 0
+        for event in events:
+            # A stream on several channels gets each event once, rendered for its first channel
+            seen = set()
+            for channel in event.channels:
+                for subscriber in listeners.get(channel, ()):
+                    if subscriber in seen:
+                        continue
+                    seen.add(subscriber)
+                    subscriber.deliver(event_message(event, fragments.get(channel, {}).get(event.document_id)))
+                    delivered += 1
+        self.counters["delivered"] += delivered
+        return len(events)
+
+    def prune(self) -> None:
+        cutoff = timezone.now() - timedelta(seconds=self.retention)
+        DocumentEvent.objects.filter(created_at__lt=cutoff).delete()
+
+    def _ensure_thread(self):
+        # Threads started before a fork do not exist in the child
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="live-hub", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            # Nobody listening: sleep until a stream subscribes, pruning now and then
+            self._wake.wait(self.poll_interval if self._count else self.retention / 10)
+            self._wake.clear()
+            try:
+                if self._count:
+                    with self._poll_lock:
+                        while self.poll_once() >= self.batch_size:
+                            pass
+                if time.monotonic() - self._last_prune > self.retention / 10:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                # e.g. the database restarted; the next poll retries
+                logger.warning("Live event poll failed: %s", e)
+            finally:
+                close_old_connections()
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+def get_live_hub() -> LiveHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = LiveHub(
+                poll_interval=settings.LIVE_POLL_INTERVAL,
+                retention=settings.LIVE_EVENT_RETENTION,
+            )
+    return _hub
+
+
+def live_metrics() -> Dict[str, Any]:
+    return _hub.snapshot() if _hub is not None else {}
+
+
+# -----------------------
+# EVENT STREAM
+# -----------------------
+def latest_event_id() -> int:
+    return DocumentEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def event_message(event: DocumentEvent, fragments: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {"id": event.id, "kind": event.kind, "doc": event.document_id, "data": event.data, "fragments": fragments}
+
+
+def replay(channels: List[str], after_id: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Events after ``after_id`` for these channels, rendered for the first
+    matching one, or None when the page should simply reload: more than
+    LIVE_REPLAY_LIMIT were missed, or the last one seen was already pruned.
+    A stream without an id (not opened from a page) starts live.
+    """
+    if after_id is None:
+        return []
+    if after_id and not DocumentEvent.objects.filter(id=after_id).exists():
+        return None
+    events = list(DocumentEvent.objects.filter(id__gt=after_id).order_by("id")[:settings.LIVE_REPLAY_LIMIT + 1])
+    if len(events) > settings.LIVE_REPLAY_LIMIT:
+        return None
+    matched = []
+    for event in events:
+        channel = next((c for c in channels if c in event.channels), None)
+        if channel is not None:
+            matched.append((channel, event))
+    fragments = {}
+    for channel in {c for c, _ in matched}:
+        doc_ids = {e.document_id for c, e in matched if c == channel and e.kind == "document"}
+        if doc_ids:
+            fragments[channel] = channel_fragments(channel, doc_ids)
+    return [event_message(e, fragments.get(c, {}).get(e.document_id)) for c, e in matched]
+
+
+def format_event(message: Dict[str, Any]) -> str:
+    """
+    One SSE frame; the id lets EventSource resume with Last-Event-ID. Cards
+    keep CSRF_PLACEHOLDER, which the page fills with its own token.
+    """
+    payload = {"doc": message["doc"], **message["data"], **(message.get("fragments") or {})}
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {message['id']}\nevent: {message['kind']}\ndata: {data}\n\n"
+
+
+def stream_preamble(hub: LiveHub) -> str:
+    hello = json.dumps({"worker": os.getpid(), "connections": hub.counters["connections"]})
+    return f"retry: {settings.LIVE_RETRY_MS}\nevent: hello\ndata: {hello}\n\n"
+
+RELOAD_EVENT = "event: reload\ndata: {}\n\n"
+HEARTBEAT = ": keepalive\n\n"
+
+
+async def aevent_stream(channels: List[str], after_id: Optional[int]):
+    """SSE frames for an ASGI stream: a coroutine, not a thread, per open dashboard."""
+    hub = get_live_hub()
+    await sync_to_async(hub.prime, thread_sensitive=False)()
+    subscriber = hub.subscribe(channels, loop=asyncio.get_running_loop())
+    try:
+        yield stream_preamble(hub)
+        # Subscribed first, so nothing falls between the backlog and the live feed
+        backlog = await sync_to_async(replay, thread_sensitive=False)(channels, after_id)
+        if backlog is None:
+            yield RELOAD_EVENT
+            return
+        after_id = after_id or 0
+        for message in backlog:
+            after_id = message["id"]
+            yield format_event(message)
+        while True:
+            try:
+                message = await subscriber.aget(settings.LIVE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            if message is None:
+                return  # fell behind: the browser reconnects and replays
+            if message["id"] > after_id:
+                yield format_event(message)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def event_stream(channels: List[str], after_id: Optional[int]):
+    """SSE frames for a WSGI response; holds a worker thread while the dashboard is open."""
+    hub = get_live_hub()
+    hub.prime()
+    subscriber = hub.subscribe(channels)
+    try:
+        yield stream_preamble(hub)
+        backlog = replay(channels, after_id)
+        close_old_connections()
+        if backlog is None:
+            yield RELOAD_EVENT
+            return
+        after_id = after_id or 0
+        for message in backlog:
+            after_id = message["id"]
+            yield format_event(message)
+        while True:
+            try:
+                message = subscriber.get(settings.LIVE_HEARTBEAT)
+            except queue.Empty:
+                yield HEARTBEAT
+                continue
+            if message is None:
+                return
+            if message["id"] > after_id:
+                yield format_event(message)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+# -----------------------
+# ASGI ENDPOINT
+# -----------------------
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    """The stream position from Last-Event-ID or ?last_event_id=; raises ValueError."""
+    return int(value) if value else None
+
+
+def session_channels(session_key: Optional[str]) -> Tuple[Any, List[str]]:
+    """The user behind a session cookie and the channels their dashboard follows."""
+    from .views import live_channels
+
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    try:
+        user = get_user(request)
+        return user, live_channels(user) if user.is_authenticated else []
+    finally:
+        close_old_connections()
+
+
+async def live_asgi(scope, receive, send) -> None:
+    """
+    The live endpoint served straight from ASGI (see KMRLDoc/asgi.py).
+    Django's handler gives every request a thread of its own for its
+    middleware until the response ends, which for a stream is as long as
+    the dashboard stays open; here the session is read in the shared pool
+    and an open stream costs one coroutine and a queue.
+    """
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+    cookies = parse_cookie(headers.get("cookie", ""))
+    query = QueryDict(scope.get("query_string", b"").decode("latin-1"))
+
+    async def respond(status, body=b""):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": body})
+
+    if not settings.LIVE_EVENTS_ENABLED:
+        return await respond(404)
+    try:
+        after_id = parse_event_id(headers.get("last-event-id") or query.get("last_event_id"))
+    except ValueError:
+        return await respond(400, b"Invalid event id.")
+    user, channels = await sync_to_async(session_channels, thread_sensitive=False)(
+        cookies.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not user.is_authenticated:
+        return await respond(403)
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),  # nginx: pass frames through unbuffered
+    ]})
+
+    async def stream():
+        frames = aevent_stream(channels, after_id)
+        try:
+            async for frame in frames:
+                await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+        finally:
+            await frames.aclose()
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    streaming, listening = asyncio.create_task(stream()), asyncio.create_task(disconnected())
+    done, _ = await asyncio.wait([streaming, listening], return_when=asyncio.FIRST_COMPLETED)
+    for task in (streaming, listening):
+        task.cancel()
+    await asyncio.gather(streaming, listening, return_exceptions=True)
+    if streaming in done and listening not in done:
+        # Told to reload or fell behind: end the response so the browser reconnects
+        await send({"type": "http.response.body", "body": b""})
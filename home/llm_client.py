@@ -0,0 +1,342 @@
+# llm_client.py
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from .doc_processor import setup_gemini
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class LLMHTTPError(LLMError):
+    def __init__(self, status: int, body: str = ""):
+        super().__init__(f"LLM API returned HTTP {status}: {body[:200]}")
+        self.status = status
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, dropped connections and 429/5xx responses are worth retrying."""
+    if isinstance(exc, (LLMTimeout, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, LLMHTTPError):
+        return exc.status == 429 or exc.status >= 500
+    try:
+        from google.api_core import exceptions as gexc
+    except ImportError:
+        return False
+    return isinstance(exc, (gexc.ServerError, gexc.TooManyRequests, gexc.DeadlineExceeded))
+
+
+def jittered_backoff(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter delay before retry number ``attempt`` (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# -----------------------
+# METRICS
+# -----------------------
+class LLMMetrics:
+    """Thread-safe counters plus a window of recent call latencies."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+        }
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = dict(self.counters)
+        if latencies:
+            data["latency_p50"] = latencies[len(latencies) // 2]
+            data["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            data["latency_max"] = latencies[-1]
+        return data
+
+
+# -----------------------
+# CIRCUIT BREAKER
+# -----------------------
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures, rejects calls for
+    ``reset_timeout`` seconds, then lets a single trial call through (half-open).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """End a call that says nothing about provider health, leaving the state as it was."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+            self._trial_in_flight = False
+
+
+# -----------------------
+# CLIENT
+# -----------------------
+CALL = "call"    # the retry loop wants one model call with this timeout
+SLEEP = "sleep"  # ...or a backoff pause of this many seconds
+
+
+class BaseLLMClient:
+    """
+    Deadlines, jittered backoff, the circuit breaker and metrics, written once
+    as a generator (see attempts) that the sync and async clients drive.
+    """
+
+    def __init__(
+        self,
+        model,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        metrics: Optional[LLMMetrics] = None,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or LLMMetrics()
+
+    def backoff(self, attempt: int) -> float:
+        return jittered_backoff(attempt, self.backoff_base, self.backoff_cap)
+
+    def attempts(self, deadline: Optional[float] = None):
+        """
+        Retry transient errors until ``deadline`` seconds (default: timeout *
+        (max_retries + 1)) have passed. Yields (CALL, timeout), answered with
+        the response or thrown the call's exception, and (SLEEP, delay).
+        Returns the response.
+        """
+        budget = deadline if deadline is not None else self.timeout * (self.max_retries + 1)
+        give_up_at = time.monotonic() + budget
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow():
+                self.metrics.incr("short_circuited")
+                raise CircuitOpenError("LLM circuit breaker is open")
+
+            remaining = give_up_at - time.monotonic()
+            try:
+                response = yield CALL, min(self.timeout, max(remaining, 0.001))
+            except Exception as e:
+                self.metrics.incr("failures")
+                if not is_retryable(e):
+                    # Bad requests say nothing about provider health: a half-open
+                    # breaker stays half-open until a call really succeeds
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                delay = self.backoff(attempt)
+                attempt += 1
+                if attempt > self.max_retries or time.monotonic() + delay >= give_up_at:
+                    raise
+                self.metrics.incr("retries")
+                yield SLEEP, delay
+                continue
+
+            self.breaker.record_success()
+            self.metrics.incr("successes")
+            return response
+
+
+class LLMClient(BaseLLMClient):
+    """
+    Reusable wrapper around a ``generate_content`` model (Gemini or a fake).
+    Every call gets a hard deadline, jittered exponential backoff between
+    retries and a shared circuit breaker. It exposes ``generate_content`` so
+    it can stand in for the model in translate_to_english / summarise_text.
+    """
+
+    def __init__(
+        self,
+        model,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        max_workers: int = 8,
+        sleep: Callable[[float], None] = time.sleep,
+        metrics: Optional[LLMMetrics] = None,
+    ):
+        super().__init__(model, timeout, max_retries, backoff_base, backoff_cap, breaker, metrics)
+        self.sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    def _call_once(self, prompt: str, timeout: float):
+        self.metrics.incr("calls")
+        started = []
+        running = threading.Event()
+
+        def call():
+            started.append(time.monotonic())
+            running.set()
+            return self.model.generate_content(prompt, request_options={"timeout": timeout})
+
+        future = self._executor.submit(call)
+        # The deadline starts when a worker picks the call up, not while it
+        # queues; abandoned calls free their worker at their request timeout
+        running.wait()
+        try:
+            return future.result(timeout=max(0.0, started[0] + timeout - time.monotonic()))
+        except FutureTimeout:
+            # The worker thread is abandoned; the caller is released on time
+            self.metrics.incr("timeouts")
+            raise LLMTimeout(f"LLM call exceeded {timeout:.1f}s")
+        finally:
+            self.metrics.observe(time.monotonic() - started[0])
+
+    def generate_content(self, prompt: str, deadline: Optional[float] = None):
+        """Call the model, retrying as in BaseLLMClient.attempts."""
+        steps = self.attempts(deadline)
+        reply = error = None
+        while True:
+            try:
+                kind, value = steps.throw(error) if error is not None else steps.send(reply)
+            except StopIteration as stop:
+                return stop.value
+            reply = error = None
+            if kind == SLEEP:
+                self.sleep(value)
+                continue
+            try:
+                reply = self._call_once(prompt, value)
+            except Exception as e:
+                error = e
+
+
+_clients: Dict[str, LLMClient] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_metrics: Dict[str, LLMMetrics] = {}
+_clients_lock = threading.Lock()
+
+def client_key(api_key: str, model_name: str) -> str:
+    """Cache and metrics key per (key, model); the API key itself never appears in metrics."""
+    return f"{model_name}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}"
+
+def get_breaker(model_name: str) -> CircuitBreaker:
+    """One breaker per model, shared by the sync and async clients."""
+    with _clients_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=settings.LLM_BREAKER_THRESHOLD,
+                reset_timeout=settings.LLM_BREAKER_RESET,
+            )
+            _breakers[model_name] = breaker
+    return breaker
+
+def get_metrics(api_key: str, model_name: str) -> LLMMetrics:
+    """One set of counters per (key, model), shared by the sync and async clients."""
+    with _clients_lock:
+        return _metrics.setdefault(client_key(api_key, model_name), LLMMetrics())
+
+def get_llm_client(api_key: str, model_name: str = "gemini-2.5-flash-lite") -> LLMClient:
+    """Process-wide client per (key, model) so breaker state and metrics are shared."""
+    cache_key = client_key(api_key, model_name)
+    breaker, metrics = get_breaker(model_name), get_metrics(api_key, model_name)
+    with _clients_lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            client = LLMClient(
+                setup_gemini(api_key, model_name),
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES,
+                backoff_base=settings.LLM_BACKOFF_BASE,
+                backoff_cap=settings.LLM_BACKOFF_CAP,
+                breaker=breaker,
+                metrics=metrics,
+            )
+            _clients[cache_key] = client
+    return client
+
+
+def llm_metrics() -> Dict[str, Any]:
+    with _clients_lock:
+        metrics, breakers = dict(_metrics), dict(_breakers)
+    return {
+        key: {**counters.snapshot(), "breaker": breakers[key.split(":", 1)[0]].state}
+        for key, counters in metrics.items()
+    }
@@ -0,0 +1,94 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Runs one extractor in a fresh interpreter; imports are paid before timing
+# starts. Peak RSS comes from VmHWM: ru_maxrss keeps the parent's peak across exec.
+PROBE = """
+import json, time
+import docx, lxml.etree
+from home.doc_processor import extract_text_from_docx
+
+def peak_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+path = {path!r}
+baseline = peak_kb()
+started = time.perf_counter()
+text = {call}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "peak_mb": (peak_kb() - baseline) / 1024,
+    "chars": len(text),
+}}))
+"""
+
+EXTRACTORS = {
+    # What extract_text_from_docx did before: full object model, paragraphs only
+    "python-docx paragraphs": '"\\n".join(p.text for p in docx.Document(path).paragraphs)',
+    "streaming (iterparse)": "extract_text_from_docx(path)",
+}
+
+
+def build_sample(path, paragraphs, table_rows):
+    """A roster-style document: body paragraphs with a table every 50 of them."""
+    import docx
+
+    doc = docx.Document()
+    section = doc.sections[0]
+    section.header.paragraphs[0].text = "KMRL - Internal"
+    section.footer.paragraphs[0].text = "Generated for benchmarking"
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Paragraph {i}: maintenance schedule for depot line {i % 7}, shift {i % 3}.")
+        if table_rows and i % 50 == 49:
+            table = doc.add_table(rows=table_rows, cols=4)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"R{r}C{c} item {i}"
+    doc.save(path)
+
+
+class Command(BaseCommand):
+    help = "Compare time, peak memory (Linux) and extracted text of the DOCX extractors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="*", help="DOCX files to measure (default: a generated sample)")
+        parser.add_argument("--paragraphs", type=int, default=20000)
+        parser.add_argument("--table-rows", type=int, default=40, help="Rows per table in the sample")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def probe(self, path, call):
+        code = PROBE.format(path=path, call=call)
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    def measure(self, path, repeat):
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        self.stdout.write(f"\n{os.path.basename(path)} ({size_mb:.1f} MB), median of {repeat} runs")
+        for name, call in EXTRACTORS.items():
+            runs = [self.probe(path, call) for _ in range(repeat)]
+            seconds = statistics.median(r["seconds"] for r in runs)
+            peak = statistics.median(r["peak_mb"] for r in runs)
+            self.stdout.write(
+                f"{name:<26} {seconds * 1000:8.0f} ms {peak:8.1f} MB peak   {runs[-1]['chars']:>10} chars"
+            )
+
+    def handle(self, *args, **options):
+        files = options["files"]
+        with tempfile.TemporaryDirectory() as tmp:
+            if not files:
+                files = [os.path.join(tmp, "sample.docx")]
+                build_sample(files[0], options["paragraphs"], options["table_rows"])
+            for path in files:
+                self.measure(os.path.abspath(path), options["repeat"])
@@ -0,0 +1,67 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from home.doc_processor import HEAVY_MODULES
+
+
+# Runs in a fresh interpreter and reports its own startup cost
+PROBE = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+{body}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_loaded": sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+"""
+
+SCENARIOS = {
+    # What every WSGI worker, autoreload and manage.py command pays
+    "web": "import {urlconf}",
+    # What an ingest worker pays with DOCUMENT_WORKER_WARMUP enabled
+    "ingest (warm-up)": "import {urlconf}\nfrom home.pipeline import warm_up\nwarm_up()",
+}
+
+
+class Command(BaseCommand):
+    help = "Measure cold-start import time and memory of web vs ingest processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--modules", action="store_true", help="Also time each heavy module alone")
+
+    def probe(self, body):
+        env = dict(os.environ)
+        env.pop("DOCUMENT_WORKER_WARMUP", None)
+        code = PROBE.format(body=body, heavy=HEAVY_MODULES)
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+    def report(self, name, body, repeat):
+        runs = [self.probe(body) for _ in range(repeat)]
+        seconds = statistics.median(r["seconds"] for r in runs)
+        rss = statistics.median(r["rss_mb"] for r in runs)
+        loaded = ", ".join(runs[-1]["heavy_loaded"]) or "none"
+        self.stdout.write(f"{name:<36} {seconds * 1000:8.0f} ms {rss:8.1f} MB   heavy: {loaded}")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        self.stdout.write(f"Median of {repeat} fresh interpreters\n")
+        for name, body in SCENARIOS.items():
+            self.report(name, body.format(urlconf=settings.ROOT_URLCONF), repeat)
+
+        if options["modules"]:
+            for module in HEAVY_MODULES:
+                self.report(f"import {module}", f"import {module}", repeat)
@@ -0,0 +1,120 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.bulk_actions import (
+    BULK_ACTIONS,
+    BulkActionError,
+    bulk_delete,
+    bulk_recategorise,
+    bulk_set_department,
+    get_file_sweeper,
+    orphaned_files,
+    select_documents,
+)
+from home.bulk_import import DUPLICATE, Checkpoint
+from home.exports import ExportFilterError
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete, recategorise or reassign the department of every document matching the "
+        "filters, with set-based queries; sweep-files removes stored files no document references."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=[*BULK_ACTIONS, "sweep-files"])
+        parser.add_argument("--from", dest="date_from", help="Uploaded on or after YYYY-MM-DD")
+        parser.add_argument("--to", dest="date_to", help="Uploaded on or before YYYY-MM-DD")
+        parser.add_argument("--category", help="Only documents with this category")
+        parser.add_argument("--department", help="Only documents from this department")
+        parser.add_argument("--uploaded-by", help="Only documents uploaded by this username")
+        parser.add_argument("--ids", help="Only these comma-separated document ids")
+        parser.add_argument(
+            "--checkpoint", help="Only the documents an import_documents run recorded in this checkpoint file"
+        )
+        parser.add_argument("--all", action="store_true", help="Select every document when no filter is given")
+        parser.add_argument("--add", action="append", default=[], help="recategorise: category to add (repeatable)")
+        parser.add_argument("--remove", action="append", default=[], help="recategorise: category to remove (repeatable)")
+        parser.add_argument(
+            "--set", action="append", dest="replace", help="recategorise: exact categories to keep (repeatable)"
+        )
+        parser.add_argument("--new-department", help="set-department: target department (omit to clear)")
+        parser.add_argument("--min-age", type=float, default=3600, help="sweep-files: skip files younger than this (s)")
+        parser.add_argument("--chunk-size", type=int, help="Documents per transaction (default: BULK_CHUNK_SIZE)")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+
+    def selected_ids(self, options):
+        ids = None
+        if options["ids"]:
+            try:
+                ids = [int(i) for i in options["ids"].split(",") if i.strip()]
+            except ValueError:
+                raise CommandError("--ids must be comma-separated numbers")
+        if options["checkpoint"]:
+            if not os.path.exists(options["checkpoint"]):
+                raise CommandError(f"No checkpoint at {options['checkpoint']}")
+            checkpoint = Checkpoint(options["checkpoint"])
+            checkpoint.close()
+            # Duplicates point at documents imported earlier, not by this run
+            imported = [e["doc_id"] for e in checkpoint.entries.values() if e.get("doc_id") and e["status"] != DUPLICATE]
+            ids = imported if ids is None else sorted(set(ids) & set(imported))
+        try:
+            return select_documents(
+                date_from=options["date_from"],
+                date_to=options["date_to"],
+                category=options["category"],
+                department=options["department"],
+                uploaded_by=options["uploaded_by"],
+                ids=ids,
+                everything=options["all"],
+            )
+        except (BulkActionError, ExportFilterError) as e:
+            raise CommandError(str(e))
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        sweeper = get_file_sweeper()
+        started = time.monotonic()
+
+        if action == "sweep-files":
+            orphans = list(orphaned_files(min_age=options["min_age"]))
+            self.stdout.write(f"{len(orphans)} stored files are not referenced by any document")
+            if not options["dry_run"]:
+                sweeper.submit(orphans)
+        else:
+            ids = self.selected_ids(options)
+            self.stdout.write(f"{len(ids)} documents match")
+            if options["dry_run"] or not ids:
+                return
+            chunk_size = options["chunk_size"]
+            try:
+                if action == "delete":
+                    count = bulk_delete(ids, chunk_size=chunk_size)
+                    self.stdout.write(f"Deleted {count} documents")
+                elif action == "recategorise":
+                    if not (options["add"] or options["remove"] or options["replace"]):
+                        raise CommandError("recategorise needs --add, --remove or --set")
+                    result = bulk_recategorise(
+                        ids, add=options["add"], remove=options["remove"], replace=options["replace"],
+                        chunk_size=chunk_size,
+                    )
+                    self.stdout.write(
+                        f"Recategorised {result['documents']} documents "
+                        f"({result['added']} categories added, {result['removed']} removed)"
+                    )
+                else:
+                    count = bulk_set_department(ids, options["new_department"], chunk_size=chunk_size)
+                    self.stdout.write(f"Updated the department of {count} documents")
+            except BulkActionError as e:
+                raise CommandError(str(e))
+
+        # The sweeper is a daemon thread: finish its queue before the process exits
+        sweeper.drain()
+        swept = sweeper.snapshot()
+        if swept["queued"]:
+            self.stdout.write(
+                f"Files: {swept['deleted']} deleted, {swept['kept']} still referenced, {swept['failed']} failed"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s"))
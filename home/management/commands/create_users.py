@@ -0,0 +1,31 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.bulk_actions import create_role_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users from a CSV with email, password and department columns, with their "
+        "role rows, in bulk inserts. Existing emails are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file", help="CSV with a header row: email,password,department")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["csv_file"], newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                missing = {"email", "password", "department"} - set(reader.fieldnames or ())
+                if missing:
+                    raise CommandError(f"Missing columns: {', '.join(sorted(missing))}")
+                rows = [(r["email"].strip(), r["password"], r["department"].strip()) for r in reader]
+        except OSError as e:
+            raise CommandError(str(e))
+
+        created, existing = create_role_users(rows)
+        for email in existing:
+            self.stdout.write(f"Skipped {email}: already exists")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} users, skipped {len(existing)}"))
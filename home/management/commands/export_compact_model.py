@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from home.compact_model import COMPACT_DIRNAME, export_compact_model
+from home.pipeline import DEFAULT_ARTIFACTS_DIR
+
+
+class Command(BaseCommand):
+    help = "Export the sklearn classifier artifacts to the compact, memory-mappable format."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--artifacts-dir", default=DEFAULT_ARTIFACTS_DIR)
+        parser.add_argument("--out", help=f"Output directory (default: <artifacts-dir>/{COMPACT_DIRNAME})")
+
+    def handle(self, *args, **options):
+        meta = export_compact_model(options["artifacts_dir"], options["out"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {meta['n_features']} features x {len(meta['labels'])} labels "
+            f"(source {meta['source_fingerprint']})"
+        ))
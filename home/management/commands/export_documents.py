@@ -0,0 +1,65 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.exports import (
+    EXPORT_CHUNK_SIZE,
+    EXPORT_FORMATS,
+    STREAM_ENCODERS,
+    ExportFilterError,
+    export_queryset,
+    iter_rows,
+    write_parquet,
+)
+
+
+class Command(BaseCommand):
+    help = "Export documents, categories, confidence scores and summaries as NDJSON, CSV or Parquet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout; required for parquet)")
+        parser.add_argument("--from", dest="date_from", help="Uploaded on or after YYYY-MM-DD")
+        parser.add_argument("--to", dest="date_to", help="Uploaded on or before YYYY-MM-DD")
+        parser.add_argument("--category", help="Only documents with this category")
+        parser.add_argument("--department", help="Only documents from this department")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            qs = export_queryset(
+                date_from=options["date_from"],
+                date_to=options["date_to"],
+                category=options["category"],
+                department=options["department"],
+            )
+        except ExportFilterError as e:
+            raise CommandError(str(e))
+
+        fmt, output = options["format"], options["output"]
+        rows = iter_rows(qs, chunk_size=options["chunk_size"])
+
+        if fmt == "parquet":
+            if output == "-":
+                raise CommandError("Parquet export needs --output: the format cannot be streamed")
+            try:
+                count = write_parquet(rows, output, chunk_size=options["chunk_size"])
+            except ImportError as e:
+                raise CommandError(str(e))
+            self.stderr.write(self.style.SUCCESS(f"Wrote {count} documents to {output}"))
+            return
+
+        out = sys.stdout.buffer if output == "-" else open(output, "wb")
+        count = 0
+        try:
+            for chunk in STREAM_ENCODERS[fmt](rows):
+                out.write(chunk)
+                count += 1
+        finally:
+            if output == "-":
+                out.flush()
+            else:
+                out.close()
+        if fmt == "csv":
+            count -= 1  # header row
+        self.stderr.write(self.style.SUCCESS(f"Wrote {count} documents to {output}"))
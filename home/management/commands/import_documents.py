@@ -0,0 +1,93 @@
+import hashlib
+import os
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from home.bulk_import import BulkImporter, Checkpoint
+from home.models import Department
+from home.pipeline import DEFAULT_ARTIFACTS_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        "Import every supported file under a directory. Already-imported content is "
+        "skipped by hash, and an interrupted run resumes from its checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("root", help="Directory to import")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Extraction processes")
+        parser.add_argument("--llm-concurrency", type=int, default=4, help="Documents in the LLM stages at once")
+        parser.add_argument("--batch-size", type=int, default=200, help="Documents inserted per transaction")
+        parser.add_argument("--checkpoint", help="Checkpoint file (default: one per directory in the current dir)")
+        parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed to hash or extract")
+        parser.add_argument(
+            "--extract-only", action="store_true",
+            help="Only extract; run reprocess_documents later for the remaining stages",
+        )
+        parser.add_argument("--no-translate", action="store_true", help="Skip the translation stage")
+        parser.add_argument("--department", help="Department name to assign")
+        parser.add_argument("--uploaded-by", help="Username recorded as the uploader")
+        parser.add_argument("--artifacts-dir", default=DEFAULT_ARTIFACTS_DIR)
+        parser.add_argument("--report-interval", type=float, default=5.0, help="Seconds between progress lines")
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(options["root"])
+        if not os.path.isdir(root):
+            raise CommandError(f"Not a directory: {root}")
+
+        department = None
+        if options["department"]:
+            department, _ = Department.objects.get_or_create(name=options["department"])
+        uploaded_by = None
+        if options["uploaded_by"]:
+            try:
+                uploaded_by = User.objects.get(username=options["uploaded_by"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['uploaded_by']}")
+
+        checkpoint_path = options["checkpoint"] or (
+            f".import_documents-{hashlib.sha1(root.encode('utf-8')).hexdigest()[:10]}.jsonl"
+        )
+        checkpoint = Checkpoint(checkpoint_path)
+        if checkpoint.entries:
+            self.stdout.write(f"Resuming from {checkpoint_path} ({len(checkpoint.entries)} files recorded)")
+
+        live = sys.stdout.isatty()
+
+        def report(line):
+            # Rewrite one line on a terminal; append lines when logging to a file
+            self.stdout.write(f"\r{line}\033[K" if live else line, ending="" if live else "\n")
+            self.stdout.flush()
+
+        importer = BulkImporter(
+            checkpoint,
+            workers=options["workers"],
+            llm_concurrency=options["llm_concurrency"],
+            batch_size=options["batch_size"],
+            extract_only=options["extract_only"],
+            retry_failed=options["retry_failed"],
+            translate=not options["no_translate"],
+            department=department,
+            uploaded_by=uploaded_by,
+            artifacts_dir=options["artifacts_dir"],
+            gemini_api_key=settings.GEMINI_API_KEY,
+            report=report,
+            report_interval=options["report_interval"],
+        )
+        try:
+            progress = importer.run(root)
+        finally:
+            checkpoint.close()
+            if live:
+                self.stdout.write("")
+
+        counts = progress.counts
+        style = self.style.WARNING if counts["failed"] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Imported {counts['imported']}, skipped {counts['duplicate']} duplicates, "
+            f"{counts['failed']} failed (see {checkpoint_path})"
+        ))
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import ssl
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from home.live import ADMIN_CHANNEL, publish
+from home.models import DocumentEvent
+
+
+LOADTEST_USERNAME = "loadtest-live"
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class Client:
+    """One EventSource-like connection: SSE frames in, hello and latency recorded."""
+
+    def __init__(self):
+        self.worker = None
+        self.connected_in = None
+        self.latencies = {}
+        self.buffer = ""
+
+    def feed(self, text, started):
+        self.buffer += text
+        while "\n\n" in self.buffer:
+            frame, self.buffer = self.buffer.split("\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in frame.splitlines() if ": " in line and not line.startswith(":"))
+            if fields.get("event") == "hello":
+                self.worker = json.loads(fields["data"])["worker"]
+                self.connected_in = time.perf_counter() - started
+            elif fields.get("event") == "progress":
+                data = json.loads(fields["data"])
+                if "loadtest_seq" in data:
+                    self.latencies[data["loadtest_seq"]] = time.time() - data["sent_at"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many live dashboard streams, publish events and report connections per "
+        "worker and delivery latency. Without --url the ASGI app is driven in-process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument("--connections", type=int, default=500)
+        parser.add_argument("--events", type=int, default=20)
+        parser.add_argument("--interval", type=float, default=0.2, help="Seconds between published events")
+        parser.add_argument("--connect-rate", type=int, default=100, help="New connections per second")
+        parser.add_argument("--settle", type=float, default=3.0, help="Seconds to wait for the last deliveries")
+
+    # -----------------------
+    # TRANSPORTS
+    # -----------------------
+    async def http_stream(self, url, path, cookie, client, done):
+        """Plain HTTP/1.1, chunked or not, so any server (uvicorn, daphne, runserver) can be measured."""
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, parts.port or (443 if secure else 80), ssl=ssl.create_default_context() if secure else None
+        )
+        started = time.perf_counter()
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: text/event-stream\r\n"
+            f"Cookie: {cookie}\r\n\r\n".encode()
+        )
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        if " 200 " not in head.split("\r\n", 1)[0]:
+            raise CommandError(f"Stream refused: {head.splitlines()[0]}")
+        chunked = "transfer-encoding: chunked" in head.lower()
+        try:
+            while not done.is_set():
+                if chunked:
+                    size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+                    data = await reader.readexactly(size + 2)
+                    data = data[:-2]
+                else:
+                    data = await reader.read(65536)
+                if not data:
+                    break
+                client.feed(data.decode("utf-8"), started)
+        finally:
+            writer.close()
+
+    async def asgi_stream(self, app, path, cookie, client, done):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"testserver"), (b"accept", b"text/event-stream"), (b"cookie", cookie.encode())],
+            "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+        }
+        started = time.perf_counter()
+        sent_request = False
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start" and message["status"] != 200:
+                raise CommandError(f"Stream refused: HTTP {message['status']}")
+            if message["type"] == "http.response.body" and message.get("body"):
+                client.feed(message["body"].decode("utf-8"), started)
+
+        await app(scope, receive, send)
+
+    # -----------------------
+    # RUN
+    # -----------------------
+    def session_cookie(self):
+        user, _ = User.objects.get_or_create(
+            username=LOADTEST_USERNAME, defaults={"is_superuser": True, "is_staff": True}
+        )
+        user.set_unusable_password()
+        user.save()
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return user, session, f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+    async def run(self, options, cookie):
+        if options["url"]:
+            app = None
+            open_stream = lambda client, done: self.http_stream(options["url"], reverse("live_events"), cookie, client, done)
+        else:
+            from KMRLDoc.asgi import application as app
+            open_stream = lambda client, done: self.asgi_stream(app, reverse("live_events"), cookie, client, done)
+
+        done = asyncio.Event()
+        clients = [Client() for _ in range(options["connections"])]
+        rss_before, threads_before = rss_mb(), threading.active_count()
+        tasks = []
+        for i, client in enumerate(clients):
+            tasks.append(asyncio.create_task(open_stream(client, done)))
+            if (i + 1) % options["connect_rate"] == 0:
+                await asyncio.sleep(1)
+
+        deadline = time.monotonic() + 30
+        while sum(c.worker is not None for c in clients) < len(clients) and time.monotonic() < deadline:
+            if any(t.done() and t.exception() for t in tasks):
+                raise next(t.exception() for t in tasks if t.done() and t.exception())
+            await asyncio.sleep(0.1)
+        connected = [c for c in clients if c.worker is not None]
+        rss_connected, threads_connected = rss_mb(), threading.active_count()
+
+        first_event = await sync_to_async(lambda: DocumentEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0)()
+        for seq in range(options["events"]):
+            await sync_to_async(publish)("progress", 0, [ADMIN_CHANNEL], {
+                "title": "load test", "stage": None, "loadtest_seq": seq, "sent_at": time.time(),
+            })
+            await asyncio.sleep(options["interval"])
+        await asyncio.sleep(options["settle"])
+
+        done.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await sync_to_async(lambda: DocumentEvent.objects.filter(id__gt=first_event, document_id=0).delete())()
+        return clients, connected, {
+            "rss_before": rss_before, "rss_connected": rss_connected,
+            "threads_before": threads_before, "threads_connected": threads_connected,
+            "in_process": app is not None,
+        }
+
+    def handle(self, *args, **options):
+        user, session, cookie = self.session_cookie()
+        try:
+            clients, connected, stats = asyncio.run(self.run(options, cookie))
+        finally:
+            session.delete()
+            user.delete()
+
+        expected = options["events"]
+        latencies = [v for c in connected for v in c.latencies.values()]
+        missed = sum(expected - len(c.latencies) for c in connected)
+        connect_times = [c.connected_in for c in connected]
+
+        mode = "in-process ASGI" if stats["in_process"] else options["url"]
+        self.stdout.write(f"\nLive streams against {mode}: {len(connected)}/{len(clients)} connected")
+        self.stdout.write("Connections per worker:")
+        for worker, count in sorted(Counter(c.worker for c in connected).items()):
+            self.stdout.write(f"  pid {worker:<10} {count:>6}")
+        if connect_times:
+            self.stdout.write(
+                f"Connect (to first frame): p50 {statistics.median(connect_times) * 1000:.0f} ms, "
+                f"p95 {percentile(connect_times, 0.95) * 1000:.0f} ms"
+            )
+        self.stdout.write(
+            f"Events: {expected} published, {len(latencies)} delivered, {missed} missed; latency "
+            f"p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, "
+            f"max {max(latencies, default=0) * 1000:.0f} ms"
+        )
+        if stats["in_process"] and connected:
+            per_connection = (stats["rss_connected"] - stats["rss_before"]) * 1024 / len(connected)
+            self.stdout.write(
+                f"Memory: {stats['rss_before']:.0f} -> {stats['rss_connected']:.0f} MB RSS "
+                f"({per_connection:.0f} KB per stream); threads {stats['threads_before']} -> {stats['threads_connected']}"
+            )
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from home.models import Document
+from home.pipeline import DEFAULT_ARTIFACTS_DIR, STAGES, pending_stages, process_document
+
+
+class Command(BaseCommand):
+    help = "Rerun only the stale or failed pipeline stages of existing documents."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="Document ids (default: all)")
+        parser.add_argument(
+            "--force", action="append", choices=STAGES, default=[],
+            help="Rerun this stage even if it is up to date (repeatable)",
+        )
+        parser.add_argument("--no-translate", action="store_true", help="Skip the translation stage")
+        parser.add_argument("--artifacts-dir", default=DEFAULT_ARTIFACTS_DIR)
+
+    def handle(self, *args, **options):
+        documents = Document.objects.order_by("id")
+        if options["ids"]:
+            documents = documents.filter(id__in=options["ids"])
+
+        totals = {stage: 0 for stage in STAGES}
+        for doc in documents.iterator():
+            if not doc.file or not doc.file.storage.exists(doc.file.name):
+                self.stderr.write(f"#{doc.id} {doc.title}: file missing, skipped")
+                continue
+
+            ran = process_document(
+                doc,
+                artifacts_dir=options["artifacts_dir"],
+                gemini_api_key=settings.GEMINI_API_KEY,
+                translate=not options["no_translate"],
+                force=options["force"],
+            )
+            for stage in ran:
+                totals[stage] += 1
+
+            pending = pending_stages(doc)
+            line = f"#{doc.id} {doc.title}: ran {', '.join(ran) or 'nothing'}"
+            if pending:
+                self.stdout.write(self.style.WARNING(f"{line} (retry: {', '.join(pending)})"))
+            else:
+                self.stdout.write(line)
+
+        summary = ", ".join(f"{stage}={count}" for stage, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Stage runs: {summary}"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_remove_namedentity_document_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='pipeline_state',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_document_pipeline_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='section_scores',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_document_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='page_translations',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='previous_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='home.document'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='revision_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_signature',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
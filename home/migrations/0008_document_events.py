@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_document_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('kind', models.CharField(max_length=20)),
+                ('document_id', models.BigIntegerField()),
+                ('channels', models.JSONField(default=list)),
+                ('data', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
@@ -95,6 +95,7 @@ class Document(models.Model):
     # Classification
     categories = models.ManyToManyField(Category, blank=True)  # multi-label from ML
     confidence_scores = models.JSONField(blank=True, null=True)  # {"Technical": 0.87, "Operational": 0.44, ...}
+    section_scores = models.JSONField(blank=True, null=True)     # [{"pages": [1, 3], "labels": ["Financial"], "scores": {...}}, ...]
 
     # Extracted & processed content
     extracted_text = models.TextField(blank=True, null=True)   # raw OCR / text extraction
@@ -104,11 +105,42 @@ class Document(models.Model):
     # Tracking / status
     processed = models.BooleanField(default=False)             # whether ML pipeline ran
     last_processed = models.DateTimeField(blank=True, null=True)
+    pipeline_state = models.JSONField(blank=True, null=True)   # {"summarise": {"version": "1", "status": "done", ...}, ...}
 
     # Metadata
     metadata = models.JSONField(blank=True, null=True)         # {"pages": 12, "file_type": "pdf", ...}
 
+    # Revisions: the upload this one supersedes, found by title and MinHash
+    previous_version = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='revisions'
+    )
+    revision_key = models.CharField(max_length=255, blank=True, default='', db_index=True)  # normalised title
+    text_signature = models.JSONField(blank=True, null=True)     # MinHash of word shingles
+    page_translations = models.JSONField(blank=True, null=True)  # [{"hash": ..., "text": ..., "ok": true}, ...]
+
+    # Version stamp for cached dashboard fragments
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # auto_now only applies to the fields being saved
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "updated_at" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "updated_at"]
+        super().save(*args, **kwargs)
+
 
+# -------------------------
+# Live Events (pushed to open dashboards, see home/live.py)
+# -------------------------
+class DocumentEvent(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    kind = models.CharField(max_length=20)           # "progress", "document" or "removed"
+    document_id = models.BigIntegerField()           # not a FK: "removed" outlives the row
+    channels = models.JSONField(default=list)        # ["admin", "category:Technical", "user:4"]
+    data = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.kind} #{self.document_id}"
@@ -0,0 +1,239 @@
+# ocr.py
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from .previews import PreviewCache
+
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------
+# SCANNED PAGE DETECTION
+# -----------------------
+def _page_resources(page):
+    """The page's /Resources, or the nearest ones inherited from its /Pages ancestors."""
+    node = page
+    while node is not None:
+        resources = node.get("/Resources")
+        if resources is not None:
+            return resources.get_object()
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    return None
+
+def page_images(page) -> Iterator[Any]:
+    """Image XObjects a page draws, including those nested in form XObjects; none are decoded."""
+    seen = set()
+    pending = [_page_resources(page)]
+    while pending:
+        try:
+            xobjects = pending.pop()["/XObject"].get_object()
+        except (KeyError, TypeError):
+            continue
+        for ref in xobjects.values():
+            xobject = ref.get_object()
+            if id(xobject) in seen:
+                continue
+            seen.add(id(xobject))
+            subtype = xobject.get("/Subtype")
+            if subtype == "/Image":
+                yield xobject
+            elif subtype == "/Form" and xobject.get("/Resources") is not None:
+                pending.append(xobject["/Resources"].get_object())
+
+def has_images(page) -> bool:
+    """Whether a PDF page draws any image XObject; read without decoding them."""
+    return next(page_images(page), None) is not None
+
+def needs_ocr(page_text: str, page) -> bool:
+    """No usable text layer, but the page carries an image to read it from."""
+    return len((page_text or "").strip()) < settings.OCR_MIN_CHARS and has_images(page)
+
+def page_scan(page) -> Optional[bytes]:
+    """
+    The page's scan as an encoded image: the largest image on the page, which
+    for scanner output is the whole page. Decoding needs Pillow.
+    """
+    # The decoder behind PyPDF2's page.images, which only sees the page's own resources
+    from PyPDF2.filters import _xobj_to_image
+
+    images = list(page_images(page))
+    if not images:
+        return None
+    largest = max(images, key=lambda image: int(image.get("/Width", 0)) * int(image.get("/Height", 0)))
+    return _xobj_to_image(largest)[1]
+
+
+# -----------------------
+# OCR (RUNS IN WORKER PROCESSES)
+# -----------------------
+@lru_cache(maxsize=None)
+def tesseract_version() -> str:
+    import pytesseract
+
+    return str(pytesseract.get_tesseract_version())
+
+@lru_cache(maxsize=None)
+def engine_available() -> bool:
+    try:
+        tesseract_version()
+    except Exception:
+        return False
+    return True
+
+def ocr_enabled() -> bool:
+    """OCR_ENABLED, where None means "when Tesseract is installed"."""
+    if settings.OCR_ENABLED is None:
+        return engine_available()
+    return bool(settings.OCR_ENABLED)
+
+def _init_worker():
+    # One Tesseract thread per worker; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def ocr_image(image_bytes: bytes, languages: str) -> Dict[str, Any]:
+    """Text, mean word confidence (0-100) and timing for one page image."""
+    import pytesseract
+    from PIL import Image
+
+    started = time.perf_counter()
+    data = pytesseract.image_to_data(
+        Image.open(io.BytesIO(image_bytes)), lang=languages, output_type=pytesseract.Output.DICT
+    )
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+        confidences.append(conf)
+    return {
+        "text": "\n".join(" ".join(words) for words in lines.values()),
+        "confidence": round(sum(confidences) / len(confidences), 1) if confidences else 0.0,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+    return _pool
+
+
+_cache = None
+
+def get_ocr_cache() -> PreviewCache:
+    global _cache
+    if _cache is None:
+        _cache = PreviewCache(
+            directory=str(settings.OCR_CACHE_DIR),
+            max_bytes=settings.OCR_CACHE_MAX_BYTES,
+        )
+    return _cache
+
+
+# -----------------------
+# ENTRY POINT
+# -----------------------
+def ocr_errors(meta: Optional[Dict[str, Any]]) -> List[str]:
+    """Why scanned pages were left empty: the engine being unavailable, or per-page failures."""
+    if not meta:
+        return []
+    if meta.get("error"):
+        return [f"OCR unavailable: {meta['error']}"]
+    return [f"OCR failed on page {page}: {entry['error']}" for page, entry in meta["pages"].items() if "error" in entry]
+
+
+def ocr_missing_pages(file_path: str, page_texts: List[str]) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+    """
+    OCR only the pages of a PDF that have no text layer, in parallel.
+    Returns the page texts with OCR output filled in, plus metadata for the
+    OCR'd pages, or None when every page had text. Failures are recorded in
+    the metadata (see ocr_errors) and leave those pages empty.
+
+    Results are cached by a hash of the page image, so a re-upload or a
+    reprocess never OCRs the same scan twice. Inside an extraction worker
+    process (bulk import, async ingest) pages are OCR'd in that process,
+    since the caller's pool already uses the cores.
+    """
+    import PyPDF2
+
+    if not ocr_enabled() or not page_texts:
+        return page_texts, None
+
+    started = time.perf_counter()
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        if len(reader.pages) != len(page_texts):
+            return page_texts, None
+        scanned = [i for i, page in enumerate(reader.pages) if needs_ocr(page_texts[i], page)]
+        if not scanned:
+            return page_texts, None
+
+        meta: Dict[str, Any] = {"languages": settings.OCR_LANGUAGES, "pages": {}}
+        try:
+            meta["engine"] = f"tesseract {tesseract_version()}"
+            scans = {i: page_scan(reader.pages[i]) for i in scanned}
+        except Exception as e:
+            # Missing pytesseract, Pillow or the tesseract binary: keep the text layer
+            logger.warning("OCR unavailable for %s: %s", os.path.basename(file_path), e)
+            meta["error"] = str(e)
+            meta["skipped_pages"] = [i + 1 for i in scanned]
+            return page_texts, meta
+
+    languages = settings.OCR_LANGUAGES
+    cache = get_ocr_cache()
+    results: Dict[int, Dict[str, Any]] = {}
+    todo = {}
+    for i, image_bytes in scans.items():
+        if not image_bytes:
+            continue
+        key = f"{hashlib.sha256(image_bytes).hexdigest()[:32]}-{languages}.json"
+        cached = cache.get(key)
+        if cached is not None:
+            results[i] = {**json.loads(cached), "cached": True}
+        else:
+            todo[i] = (key, image_bytes)
+
+    in_worker = multiprocessing.parent_process() is not None
+    pool = get_ocr_pool() if len(todo) > 1 and settings.OCR_WORKERS > 1 and not in_worker else None
+    futures = {i: pool.submit(ocr_image, image_bytes, languages) for i, (_, image_bytes) in todo.items()} if pool else {}
+    for i, (key, image_bytes) in todo.items():
+        try:
+            result = futures[i].result() if pool else ocr_image(image_bytes, languages)
+        except Exception as e:
+            # e.g. traineddata for one of the languages is not installed
+            logger.warning("OCR failed for page %d of %s: %s", i + 1, os.path.basename(file_path), e)
+            meta["pages"][str(i + 1)] = {"error": str(e)}
+            continue
+        cache.set(key, json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        results[i] = {**result, "cached": False}
+
+    page_texts = list(page_texts)
+    for i, result in results.items():
+        page_texts[i] = result["text"]
+        meta["pages"][str(i + 1)] = {k: result[k] for k in ("confidence", "seconds", "cached")}
+    meta["seconds"] = round(time.perf_counter() - started, 3)
+    return page_texts, meta
@@ -0,0 +1,437 @@
+# pipeline.py
+import hashlib
+import importlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .batching import ClassificationBatcher
+from .compact_model import (
+    COMPACT_DIRNAME,
+    artifacts_fingerprint,
+    compact_is_current,
+    load_compact_artifacts,
+)
+from .doc_processor import (
+    HEAVY_MODULES,
+    classify_sections,
+    extract_document,
+    extractive_summary,
+    load_artifacts,
+    pages_translation_prompt,
+    split_pages,
+    split_translated_pages,
+    summary_prompt,
+    translation_prompt,
+)
+from .downloads import file_sha256, remember_sha256, stored_sha256
+from .llm_client import get_llm_client
+from .models import Category
+from .ocr import ocr_enabled
+from .revisions import (
+    REVISION_FIELDS,
+    document_pages,
+    fingerprint_revision,
+    link_revision,
+    load_previous_version,
+    plan_translations,
+    summary_delta,
+)
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+
+# -----------------------
+# STAGES AND VERSIONS
+# -----------------------
+# Bump a stage's version whenever its logic or prompt changes; only that stage
+# (and any stage whose input it changes) is rerun on the next reprocess.
+STAGES = ["extract", "revision", "translate", "summarise", "classify"]
+STAGE_VERSIONS = {
+    "extract": "3",
+    "revision": "2",
+    "translate": "2",
+    "summarise": "1",
+    "classify": "1",
+}
+
+DONE = "done"
+FALLBACK = "fallback"   # stage raised; a stand-in output was stored and it will be retried
+FAILED = "failed"       # stage raised and nothing downstream could run
+SKIPPED = "skipped"     # stage disabled for this run (e.g. translate=False)
+
+
+def text_fingerprint(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def get_artifacts(artifacts_dir: str):
+    """
+    Load classifier artifacts once per process, plus a content fingerprint.
+    With CLASSIFIER_FORMAT = "compact" the memory-mapped export is used when
+    it is present and was built from the current sklearn artifacts.
+    """
+    fingerprint = artifacts_fingerprint(artifacts_dir)
+    if settings.CLASSIFIER_FORMAT == "compact":
+        if compact_is_current(artifacts_dir):
+            return load_compact_artifacts(os.path.join(artifacts_dir, COMPACT_DIRNAME)), fingerprint
+        logger.warning(
+            "Compact model in %s is missing or stale; run export_compact_model. "
+            "Falling back to the sklearn artifacts.", artifacts_dir
+        )
+    return load_artifacts(artifacts_dir), fingerprint
+
+
+_batchers: Dict[str, ClassificationBatcher] = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(artifacts_dir: str = DEFAULT_ARTIFACTS_DIR) -> ClassificationBatcher:
+    """Process-wide classifier shared by all concurrent requests."""
+    with _batchers_lock:
+        batcher = _batchers.get(artifacts_dir)
+        if batcher is None:
+            (vect, clf, mlb, labels, thr_arr), _ = get_artifacts(artifacts_dir)
+            batcher = ClassificationBatcher(
+                vect, clf, labels, thr_arr,
+                max_batch_size=settings.CLASSIFY_BATCH_SIZE,
+                max_wait=settings.CLASSIFY_BATCH_WAIT_MS / 1000,
+                timeout=settings.CLASSIFY_TIMEOUT,
+            )
+            _batchers[artifacts_dir] = batcher
+    return batcher
+
+
+def classifier_metrics() -> Dict[str, Any]:
+    with _batchers_lock:
+        batchers = dict(_batchers)
+    return {artifacts_dir: batcher.snapshot() for artifacts_dir, batcher in batchers.items()}
+
+
+def warm_up(artifacts_dir: str = DEFAULT_ARTIFACTS_DIR, gemini_api_key: str = "") -> None:
+    """
+    Pay the import and artifact-loading cost up front. Meant for ingest
+    workers (DOCUMENT_WORKER_WARMUP, or a server post-fork hook), not web-only
+    processes.
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    get_artifacts(artifacts_dir)
+    if gemini_api_key:
+        get_llm_client(gemini_api_key)
+
+
+def stage_version(stage: str, artifacts_dir: str = DEFAULT_ARTIFACTS_DIR) -> str:
+    version = STAGE_VERSIONS[stage]
+    if stage == "extract" and ocr_enabled():
+        # Turning OCR on or changing its languages re-extracts scanned PDFs
+        version = f"{version}+ocr:{settings.OCR_LANGUAGES}"
+    if stage == "summarise":
+        # Switching between LLM, extractive and pre-filtered summaries is a new version
+        version = f"{version}+{settings.SUMMARY_MODE}"
+    if stage == "classify":
+        # A retrained model changes the artifacts, which alone makes classify stale
+        version = f"{version}+{settings.CLASSIFY_MODE}+{get_artifacts(artifacts_dir)[1]}"
+    return version
+
+
+def classify_input(doc) -> str:
+    """Fingerprint of what classify reads: the summary, or the pages in "sections" mode."""
+    if settings.CLASSIFY_MODE == "sections":
+        offsets = (doc.metadata or {}).get("page_offsets") or []
+        return text_fingerprint(f"{doc.extracted_text or ''}\0{offsets}")
+    return text_fingerprint(doc.summary)
+
+
+def classify_document_sections(doc, artifacts_dir: str = DEFAULT_ARTIFACTS_DIR):
+    """
+    All pages in one vectorised batch; (chosen labels, sorted probs, sections).
+    Pages come from the extracted text: translation does not keep page breaks.
+    """
+    (vect, clf, _, labels, thr_arr), _ = get_artifacts(artifacts_dir)
+    pages = split_pages(doc.extracted_text, (doc.metadata or {}).get("page_offsets"))
+    return classify_sections(pages, vect, clf, labels, thr_arr)
+
+
+def is_stale(state: Dict[str, Any], stage: str, version: str, input_fp: str) -> bool:
+    entry = (state or {}).get(stage)
+    return (
+        not entry
+        or entry.get("status") not in (DONE, SKIPPED)
+        or entry.get("version") != version
+        or entry.get("input") != input_fp
+    )
+
+
+def extract_status(result: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """Extraction that left scanned pages empty is a fallback, so the stage is retried."""
+    errors = result.get("errors")
+    return (FALLBACK, "; ".join(errors)) if errors else (DONE, None)
+
+
+def _stamp(state, stage, version, input_fp, status, error=None):
+    state[stage] = {
+        "version": version,
+        "input": input_fp,
+        "status": status,
+        "error": error,
+        "finished_at": timezone.now().isoformat(),
+    }
+
+
+# -----------------------
+# INCREMENTAL PIPELINE
+# -----------------------
+# The stages are written once, in run_stages, as pure code. The slow calls
+# (extraction, the LLM, classification) and every query are yielded as requests
+# for a driver to answer: in process_document synchronously, in
+# async_pipeline.aprocess_document awaited, with only the queries on the sync thread.
+EXTRACT = "extract"    # payload: file path; answer: extract_document's result
+LLM = "llm"            # payload: prompts; answer: a response or an exception per prompt
+CLASSIFY = "classify"  # payload: the document; answer: (labels, sorted probs, sections)
+ORM = "orm"            # payload: a callable that touches the database; answer: its result
+
+
+def run_stages(
+    doc,
+    artifacts_dir: str = DEFAULT_ARTIFACTS_DIR,
+    translate: bool = False,
+    force: Iterable[str] = (),
+):
+    """
+    Generator over the stale or failed stages of a saved Document, persisting
+    each stage's output and stamp as soon as it finishes. Yields (kind,
+    payload) requests; a failed request is thrown back in. Runs no queries
+    itself. Returns the names of the stages that actually ran.
+    """
+    force = set(force)
+    state = dict(doc.pipeline_state or {})
+    ran = []
+    previous_loaded = []
+
+    def save(*fields):
+        doc.pipeline_state = state
+        yield ORM, partial(doc.save, update_fields=[*fields, "pipeline_state"])
+
+    def load_previous():
+        if doc.previous_version_id and not previous_loaded:
+            yield ORM, partial(load_previous_version, doc)
+            previous_loaded.append(True)
+
+    def generate(prompt):
+        response = (yield LLM, [prompt])[0]
+        if isinstance(response, Exception):
+            raise response
+        return response.text.strip()
+
+    # Step 1: Extract
+    version, input_fp = stage_version("extract"), stored_sha256(doc)
+    if input_fp is None:
+        input_fp = file_sha256(doc.file.path)
+        yield ORM, partial(remember_sha256, doc, input_fp)
+    if "extract" in force or is_stale(state, "extract", version, input_fp):
+        ran.append("extract")
+        try:
+            result = yield EXTRACT, doc.file.path
+        except Exception as e:
+            _stamp(state, "extract", version, input_fp, FAILED, str(e))
+            yield from save()
+            return ran
+        doc.extracted_text = result["text"]
+        doc.metadata = {**(doc.metadata or {}), **result["metadata"]}
+        _stamp(state, "extract", version, input_fp, *extract_status(result))
+        yield from save("extracted_text", "metadata")
+    raw_text = doc.extracted_text or ""
+
+    # Step 2: Link to the version this upload revises, with a page-level diff
+    version, input_fp = stage_version("revision"), text_fingerprint(raw_text)
+    if "revision" in force or is_stale(state, "revision", version, input_fp):
+        ran.append("revision")
+        fingerprint_revision(doc)
+        try:
+            yield ORM, partial(link_revision, doc)
+            _stamp(state, "revision", version, input_fp, DONE)
+        except Exception as e:
+            # Only costs the delta reuse; everything downstream runs in full
+            _stamp(state, "revision", version, input_fp, FALLBACK, str(e))
+        yield from save(*REVISION_FIELDS)
+
+    # Step 3: Translate (optional). A linked revision translates only its changed
+    # pages, one call each; otherwise the pages go out together in one call
+    version, input_fp = stage_version("translate"), text_fingerprint(raw_text)
+    if not translate:
+        if state.get("translate", {}).get("status") != SKIPPED:
+            doc.translated_text = None
+            doc.page_translations = None
+            _stamp(state, "translate", version, input_fp, SKIPPED)
+            yield from save("translated_text", "page_translations")
+    elif "translate" in force or is_stale(state, "translate", version, input_fp):
+        ran.append("translate")
+        yield from load_previous()
+        entries, todo = plan_translations(doc)
+        errors = []
+        one_by_one = todo if doc.previous_version_id else []
+        if todo and not one_by_one:
+            numbers = [i + 1 for i in todo]
+            response = (yield LLM, [pages_translation_prompt([(i + 1, entries[i]["text"]) for i in todo])])[0]
+            if isinstance(response, Exception):
+                errors.append(str(response))  # fallback: the pages stay untranslated
+            else:
+                translated = split_translated_pages(response.text, numbers)
+                if translated is None:
+                    # A page marker was dropped or merged: translate those pages one by one
+                    one_by_one = todo
+                else:
+                    for i, text in zip(todo, translated):
+                        entries[i].update(text=text, ok=True)
+        if one_by_one:
+            responses = yield LLM, [translation_prompt(entries[i]["text"]) for i in one_by_one]
+            for i, response in zip(one_by_one, responses):
+                if isinstance(response, Exception):
+                    errors.append(f"page {i + 1}: {response}")  # fallback: the page stays untranslated
+                else:
+                    entries[i].update(text=response.text.strip(), ok=True)
+        doc.page_translations = entries
+        doc.translated_text = "\n".join(entry["text"] for entry in entries)
+        if errors:
+            _stamp(state, "translate", version, input_fp, FALLBACK, "; ".join(errors))
+        else:
+            _stamp(state, "translate", version, input_fp, DONE)
+        yield from save("translated_text", "page_translations")
+    text_for_summary = doc.translated_text if translate and doc.translated_text else raw_text
+
+    # Step 4: Summarise
+    version, input_fp = stage_version("summarise"), text_fingerprint(text_for_summary)
+    if "summarise" in force or is_stale(state, "summarise", version, input_fp):
+        ran.append("summarise")
+        (vect, _, _, _, _), _ = get_artifacts(artifacts_dir)
+        if settings.SUMMARY_MODE == "extractive":
+            doc.summary = extractive_summary(text_for_summary, vect)
+            _stamp(state, "summarise", version, input_fp, DONE)
+        else:
+            pages = [e["text"] for e in doc.page_translations] if translate and doc.page_translations else document_pages(doc)
+            # A revision only sends its changed pages, against the previous summary
+            yield from load_previous()
+            delta = summary_delta(doc, pages, translate)
+            llm_input = text_for_summary
+            if settings.SUMMARY_MODE == "prefilter":
+                # Send only the most central sentences to cut token volume
+                llm_input = extractive_summary(
+                    text_for_summary, vect, max_sentences=settings.SUMMARY_PREFILTER_SENTENCES
+                )
+            try:
+                if delta is None:
+                    doc.summary = yield from generate(summary_prompt(llm_input))
+                elif delta[0] == "reuse":
+                    doc.summary = delta[1]
+                else:
+                    doc.summary = yield from generate(delta[1])
+                _stamp(state, "summarise", version, input_fp, DONE)
+            except Exception as e:
+                doc.summary = extractive_summary(text_for_summary, vect)  # fallback
+                _stamp(state, "summarise", version, input_fp, FALLBACK, str(e))
+        yield from save("summary")
+
+    # Step 5: Classify
+    version, input_fp = stage_version("classify", artifacts_dir), classify_input(doc)
+    if "classify" in force or is_stale(state, "classify", version, input_fp):
+        ran.append("classify")
+        try:
+            chosen_labels, sorted_probs, sections = yield CLASSIFY, doc
+        except Exception as e:
+            _stamp(state, "classify", version, input_fp, FAILED, str(e))
+            yield from save()
+            return ran
+        yield ORM, partial(set_categories, doc, chosen_labels)
+        doc.confidence_scores = dict(sorted_probs)
+        doc.section_scores = sections
+        doc.processed = True
+        doc.last_processed = timezone.now()
+        _stamp(state, "classify", version, input_fp, DONE)
+        yield from save("confidence_scores", "section_scores", "processed", "last_processed")
+
+    return ran
+
+
+def advance(stages, reply=None, error: Optional[BaseException] = None) -> Tuple[Optional[tuple], Optional[List[str]]]:
+    """One step of run_stages: (next request, None), or (None, stages that ran) once it is done."""
+    try:
+        return (stages.throw(error) if error is not None else stages.send(reply)), None
+    except StopIteration as stop:
+        return None, stop.value
+
+
+def set_categories(doc, labels: List[str]) -> None:
+    doc.categories.set([Category.objects.get_or_create(name=label)[0] for label in labels])
+
+
+def classify_document(doc, artifacts_dir: str = DEFAULT_ARTIFACTS_DIR):
+    """(chosen labels, sorted probs, sections or None) for the configured CLASSIFY_MODE."""
+    if settings.CLASSIFY_MODE == "sections":
+        return classify_document_sections(doc, artifacts_dir)
+    chosen_labels, sorted_probs = get_batcher(artifacts_dir).classify(doc.summary or "")
+    return chosen_labels, sorted_probs, None
+
+
+def generate_all(model, prompts: List[str]) -> List[Any]:
+    """A response or the exception raised for each prompt, several pages at a time."""
+    def call(prompt):
+        try:
+            return model.generate_content(prompt)
+        except Exception as e:
+            return e
+
+    if len(prompts) == 1:
+        return [call(prompts[0])]
+    with ThreadPoolExecutor(max_workers=settings.TRANSLATE_PAGE_CONCURRENCY) as pool:
+        return list(pool.map(call, prompts))
+
+
+def process_document(
+    doc,
+    artifacts_dir: str = DEFAULT_ARTIFACTS_DIR,
+    gemini_api_key: str = "",
+    translate: bool = False,
+    force: Iterable[str] = (),
+) -> List[str]:
+    """
+    Run the stale or failed stages for a saved Document, persisting each
+    stage's output and stamp as soon as it finishes.
+    Returns the names of the stages that actually ran.
+    """
+    stages = run_stages(doc, artifacts_dir, translate, force)
+    model = None
+    reply = error = None
+    while True:
+        request, ran = advance(stages, reply, error)
+        if request is None:
+            return ran
+        kind, payload = request
+        reply = error = None
+        try:
+            if kind == ORM:
+                reply = payload()
+            elif kind == EXTRACT:
+                reply = extract_document(payload)
+            elif kind == CLASSIFY:
+                reply = classify_document(payload, artifacts_dir)
+            else:
+                if model is None:
+                    model = get_llm_client(gemini_api_key)
+                reply = generate_all(model, payload)
+        except Exception as e:
+            error = e
+
+
+def pending_stages(doc) -> List[str]:
+    """Stages whose last run failed or fell back and should be retried."""
+    state = doc.pipeline_state or {}
+    return [s for s in STAGES if state.get(s, {}).get("status") in (FAILED, FALLBACK)]
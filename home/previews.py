@@ -0,0 +1,205 @@
+# previews.py
+import html
+import json
+import math
+import os
+import tempfile
+import textwrap
+import threading
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from .doc_processor import PAGE_CHARS, split_pages
+from .downloads import document_sha256
+
+
+THUMB_LINES = 18
+THUMB_LINE_CHARS = 42
+
+
+# -----------------------
+# DISK CACHE (LRU BY TOTAL SIZE)
+# -----------------------
+class PreviewCache:
+    """
+    Flat directory of rendered previews. Reads bump a file's mtime so eviction
+    can drop the least recently used entries once the directory grows past
+    ``max_bytes``. The size is counted in memory from the last scan, so the
+    directory is only scanned when a write takes it over the cap (and once
+    on the first write); other processes' writes are picked up by that scan.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # bytes on disk as of the last scan plus our writes
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data) - replaced
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.set(key, data)
+        return data
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        with self._lock:
+            self._size = total
+
+
+_cache = None
+
+def get_preview_cache() -> PreviewCache:
+    global _cache
+    if _cache is None:
+        _cache = PreviewCache(
+            directory=str(settings.PREVIEW_CACHE_DIR),
+            max_bytes=settings.PREVIEW_CACHE_MAX_BYTES,
+        )
+    return _cache
+
+
+# -----------------------
+# PAGE TEXT
+# -----------------------
+def _is_pdf(doc) -> bool:
+    return doc.file.name.lower().endswith(".pdf")
+
+def page_count(doc) -> int:
+    if _is_pdf(doc):
+        pages = (doc.metadata or {}).get("pages")
+        if pages:
+            return pages
+        import PyPDF2
+
+        with doc.file.open("rb") as f:
+            return len(PyPDF2.PdfReader(f).pages)
+    text = doc.extracted_text or ""
+    return max(1, math.ceil(len(text) / PAGE_CHARS))
+
+def extract_page_text(doc, page: int) -> str:
+    """Text of a single 1-based page; only that page of a PDF is parsed."""
+    if _is_pdf(doc):
+        import PyPDF2
+
+        metadata = doc.metadata or {}
+        if str(page) in (metadata.get("ocr") or {}).get("pages", {}):
+            # Scanned page: its text only exists in the stored OCR output
+            return split_pages(doc.extracted_text, metadata.get("page_offsets"))[page - 1].strip()
+
+        with doc.file.open("rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            if not 1 <= page <= len(reader.pages):
+                raise IndexError(page)
+            return (reader.pages[page - 1].extract_text() or "").strip()
+
+    text = doc.extracted_text or ""
+    if not 1 <= page <= page_count(doc):
+        raise IndexError(page)
+    return text[(page - 1) * PAGE_CHARS:page * PAGE_CHARS].strip()
+
+
+# -----------------------
+# RENDERERS
+# -----------------------
+def render_page_preview(doc, page: int) -> bytes:
+    payload = {
+        "page": page,
+        "pages": page_count(doc),
+        "text": extract_page_text(doc, page),
+    }
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+def render_thumbnail_svg(title: str, text: str) -> bytes:
+    """A page-shaped SVG sketch of the first lines of text; no raster deps needed."""
+    lines = []
+    for paragraph in text.splitlines():
+        lines.extend(textwrap.wrap(paragraph, THUMB_LINE_CHARS) or [""])
+        if len(lines) >= THUMB_LINES:
+            break
+    lines = lines[:THUMB_LINES]
+
+    rows = [
+        f'<text x="12" y="{44 + i * 11}">{html.escape(line)}</text>'
+        for i, line in enumerate(lines)
+    ]
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="200" height="260" viewBox="0 0 200 260">'
+        '<rect width="200" height="260" fill="#fff" stroke="#d1d5db"/>'
+        f'<text x="12" y="24" font-family="sans-serif" font-size="11" font-weight="bold" fill="#111827">'
+        f'{html.escape(textwrap.shorten(title, 32))}</text>'
+        '<g font-family="sans-serif" font-size="7" fill="#4b5563">'
+        + "".join(rows)
+        + "</g></svg>"
+    )
+    return svg.encode("utf-8")
+
+
+# -----------------------
+# CACHED ENTRY POINTS
+# -----------------------
+def preview_version(doc) -> str:
+    return document_sha256(doc)[:16]
+
+def get_page_preview(doc, page: int) -> bytes:
+    key = f"{doc.pk}-{preview_version(doc)}-p{page}.json"
+    return get_preview_cache().get_or_render(key, lambda: render_page_preview(doc, page))
+
+def get_thumbnail(doc) -> bytes:
+    key = f"{doc.pk}-{preview_version(doc)}-thumb.svg"
+    return get_preview_cache().get_or_render(
+        key, lambda: render_thumbnail_svg(doc.title, extract_page_text(doc, 1))
+    )
@@ -0,0 +1,231 @@
+# revisions.py
+import difflib
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .doc_processor import revision_summary_prompt, split_pages
+
+
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+MINHASH_PRIME = (1 << 31) - 1
+MINHASH_SEED = 20250901
+
+# Revision markers stripped from titles: "v2", "rev. 3", "(1)", "final", dates...
+# Other numbers stay: "Circular 12" and "Circular 13" are different documents
+TITLE_NOISE_RE = re.compile(
+    r"\b(v|ver|version|rev|revision|r|amendment|amended|draft|final|copy)\.?\s*\d*\b"
+    r"|\(\d+\)|\b\d{1,4}[-_.]\d{1,2}[-_.]\d{1,4}\b"
+)
+
+
+# -----------------------
+# FINGERPRINTS
+# -----------------------
+def revision_key(title: str) -> str:
+    """Title with extension, version markers, dates and copy numbering removed."""
+    stem = os.path.splitext(title or "")[0].lower()
+    stem = TITLE_NOISE_RE.sub(" ", stem)
+    return " ".join(re.findall(r"[^\W_]+", stem))[:255]
+
+def _normalise(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+def page_hash(text: str) -> str:
+    return hashlib.sha1(_normalise(text).encode("utf-8")).hexdigest()[:16]
+
+def _permutations():
+    import numpy as np
+
+    rng = np.random.default_rng(MINHASH_SEED)
+    a = rng.integers(1, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+    b = rng.integers(0, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+    return a, b
+
+def minhash_signature(text: str) -> List[int]:
+    """
+    MinHash over word shingles of SHINGLE_WORDS words. Two signatures agree
+    in about the Jaccard similarity of the shingle sets, position by position.
+    """
+    import numpy as np
+
+    words = _normalise(text).split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") % MINHASH_PRIME
+         for s in shingles],
+        dtype=np.uint64,
+    )
+    a, b = _permutations()
+    signature = np.full(MINHASH_PERMUTATIONS, MINHASH_PRIME, dtype=np.uint64)
+    # Values stay below 2**62, so (a * x + b) cannot overflow uint64
+    for start in range(0, len(hashes), 4096):
+        values = (hashes[start:start + 4096, None] * a + b) % np.uint64(MINHASH_PRIME)
+        signature = np.minimum(signature, values.min(axis=0))
+    return [int(v) for v in signature]
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+# -----------------------
+# PAGE DIFF
+# -----------------------
+def document_pages(doc) -> List[str]:
+    return split_pages(doc.extracted_text, (doc.metadata or {}).get("page_offsets"))
+
+def diff_pages(old_hashes: List[str], new_hashes: List[str]) -> Dict[str, List[int]]:
+    """1-based new pages that changed or were inserted, and old pages that were removed."""
+    changed, removed = [], []
+    matcher = difflib.SequenceMatcher(a=old_hashes, b=new_hashes, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        changed.extend(range(j1 + 1, j2 + 1))
+        removed.extend(range(i1 + 1, i2 + 1) if op == "delete" else range(i1 + 1 + (j2 - j1), i2 + 1))
+    return {"changed_pages": changed, "removed_pages": removed}
+
+
+# -----------------------
+# LINKING
+# -----------------------
+def find_previous_version(doc, signature: List[int]) -> Tuple[Optional[Any], float]:
+    """
+    The earlier upload this document revises: same revision key, MinHash
+    similarity of at least REVISION_MIN_SIMILARITY, most similar first and
+    most recent on ties. Returns (document or None, similarity).
+    """
+    from .models import Document
+
+    key = revision_key(doc.title)
+    if not key:
+        return None, 0.0
+    candidates = (
+        Document.objects.filter(revision_key=key, pk__lt=doc.pk, text_signature__isnull=False)
+        .only("id", "text_signature")
+        .order_by("-pk")[:settings.REVISION_CANDIDATES]
+    )
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        score = similarity(signature, candidate.text_signature)
+        if score >= settings.REVISION_MIN_SIMILARITY and score > best_score:
+            best, best_score = candidate, score
+    return best, best_score
+
+def fingerprint_revision(doc) -> None:
+    """
+    The revision key, MinHash signature and page hashes of a freshly
+    extracted document, set on ``doc``. Pure computation: link_revision does
+    the queries.
+    """
+    doc.revision_key = revision_key(doc.title)
+    # Every empty text has the same signature: no text, nothing to match on
+    doc.text_signature = minhash_signature(doc.extracted_text) if (doc.extracted_text or "").strip() else None
+    metadata = dict(doc.metadata or {})
+    metadata["page_hashes"] = [page_hash(p) for p in document_pages(doc)]
+    metadata.pop("revision", None)
+    doc.metadata = metadata
+    doc.previous_version = None
+
+def link_revision(doc) -> Optional[Dict[str, Any]]:
+    """
+    Link a fingerprinted document (see fingerprint_revision) to the version
+    it revises, with the page-level diff in metadata["revision"]. Sets the
+    fields on ``doc``; the caller saves them (see REVISION_FIELDS).
+    """
+    if not doc.text_signature:
+        return None
+    previous, score = find_previous_version(doc, doc.text_signature)
+    if previous is not None:
+        from .models import Document
+
+        previous = Document.objects.only("id", "extracted_text", "metadata").get(pk=previous.pk)
+        old_hashes = (previous.metadata or {}).get("page_hashes") or [page_hash(p) for p in document_pages(previous)]
+        new_hashes = doc.metadata["page_hashes"]
+        doc.metadata["revision"] = {
+            "previous_id": previous.pk,
+            "similarity": round(score, 3),
+            "pages": len(new_hashes),
+            **diff_pages(old_hashes, new_hashes),
+        }
+        doc.previous_version = previous
+    return doc.metadata.get("revision")
+
+def load_previous_version(doc) -> None:
+    """Fetch the fields of the previous version that translate and summarise reuse."""
+    if doc.previous_version_id:
+        from .models import Document
+
+        doc.previous_version = Document.objects.only(
+            "id", "summary", "pipeline_state", "page_translations"
+        ).get(pk=doc.previous_version_id)
+
+REVISION_FIELDS = ["revision_key", "text_signature", "previous_version", "metadata"]
+
+
+# -----------------------
+# DELTA REPROCESSING
+# -----------------------
+def reusable_translations(doc) -> Dict[str, str]:
+    """Page translations by page hash, from the previous version and this document."""
+    reuse = {}
+    sources = [doc.previous_version.page_translations if doc.previous_version_id else None, doc.page_translations]
+    for entries in sources:
+        for entry in entries or []:
+            if entry.get("ok"):
+                reuse[entry["hash"]] = entry["text"]
+    return reuse
+
+def plan_translations(doc) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    One entry per page, ``{"hash", "text", "ok"}``, with translations reused
+    from the previous version wherever a page is unchanged. Also returns the
+    indexes of the pages that still need the LLM; their text is the original.
+    """
+    reuse = reusable_translations(doc)
+    entries, todo = [], []
+    for i, text in enumerate(document_pages(doc)):
+        digest = page_hash(text)
+        if not text.strip():
+            entries.append({"hash": digest, "text": "", "ok": True})
+        elif digest in reuse:
+            entries.append({"hash": digest, "text": reuse[digest], "ok": True})
+        else:
+            entries.append({"hash": digest, "text": text, "ok": False})
+            todo.append(i)
+    return entries, todo
+
+def summary_delta(doc, pages: List[str], translated: bool = False) -> Optional[Tuple[str, str]]:
+    """
+    How to summarise a revision without rereading it, or None to summarise
+    in full: ("reuse", previous summary) when no page changed, or ("update",
+    prompt) when few enough pages changed. The previous summary only counts
+    if it was made by the current summarise version from text translated
+    (or not) the same way.
+    """
+    revision = (doc.metadata or {}).get("revision")
+    previous = doc.previous_version if doc.previous_version_id else None
+    if not revision or previous is None or not previous.summary:
+        return None
+    from .pipeline import DONE, stage_version
+
+    state = previous.pipeline_state or {}
+    summarised = state.get("summarise", {})
+    if summarised.get("status") != DONE or summarised.get("version") != stage_version("summarise"):
+        return None
+    if (state.get("translate", {}).get("status") == DONE) != translated:
+        return None
+
+    changed = revision["changed_pages"]
+    if not changed and not revision["removed_pages"]:
+        return "reuse", previous.summary
+    if len(changed) > max(1, revision["pages"]) * settings.REVISION_MAX_CHANGED_SHARE:
+        return None
+    changed_text = "\n\n".join(f"[Page {n}]\n{pages[n - 1]}" for n in changed if n <= len(pages))
+    return "update", revision_summary_prompt(previous.summary, changed_text, len(revision["removed_pages"]))
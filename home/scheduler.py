@@ -0,0 +1,208 @@
+# scheduler.py
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# Highest first. Aging promotes waiting jobs one class at a time, but never
+# into the top class, so urgent work only ever queues behind urgent work.
+PRIORITY_CLASSES = ["urgent", "normal", "bulk"]
+DEFAULT_PRIORITY = "normal"
+
+
+class Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "priority", "klass", "department", "enqueued_at", "tag")
+
+    def __init__(self, fn, args, kwargs, priority, department, enqueued_at):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.priority = priority      # class it was submitted with (metrics are keyed by this)
+        self.klass = priority         # class it currently waits in
+        self.department = department
+        self.enqueued_at = enqueued_at
+        self.tag = 0.0
+
+
+class IngestScheduler:
+    """
+    Worker pool for document processing jobs.
+
+    Classes are served in strict priority order. Within a class, departments
+    share the workers by weighted fair queuing: each job gets a virtual start
+    tag ``max(class clock, department's last tag) + 1 / weight``, and the
+    smallest tag runs next, so a department that queues 500 files does not
+    delay another department's single file. A job that has waited
+    ``aging_seconds`` per level moves up one class, so bulk work cannot
+    starve.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        aging_seconds: float = 60.0,
+        department_weights: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.workers = max(1, workers)
+        self.aging_seconds = aging_seconds
+        self.department_weights = department_weights or {}
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._queues = {k: defaultdict(deque) for k in PRIORITY_CLASSES}
+        self._last_tag = {k: defaultdict(float) for k in PRIORITY_CLASSES}
+        self._vtime = {k: 0.0 for k in PRIORITY_CLASSES}
+        self._threads = []
+        self._pid = None
+
+        self._waits = {k: deque(maxlen=1000) for k in PRIORITY_CLASSES}
+        self.counters = {k: {"submitted": 0, "completed": 0, "failed": 0, "promoted": 0} for k in PRIORITY_CLASSES}
+
+    # -----------------------
+    # PUBLIC API
+    # -----------------------
+    def submit(self, fn, *args, priority: str = DEFAULT_PRIORITY, department: str = "", **kwargs) -> Future:
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        self._ensure_workers()
+        job = Job(fn, args, kwargs, priority, department or "", self.clock())
+        with self._cond:
+            self._enqueue(job, priority)
+            self.counters[priority]["submitted"] += 1
+            self._cond.notify()
+        return job.future
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per class: queue depth (by current class), counters and wait times (by submitted class)."""
+        with self._cond:
+            data = {}
+            for klass in PRIORITY_CLASSES:
+                queues = self._queues[klass]
+                waits = sorted(self._waits[klass])
+                entry = dict(self.counters[klass])
+                entry["queue_depth"] = sum(len(q) for q in queues.values())
+                entry["queue_depth_by_department"] = {d: len(q) for d, q in queues.items() if q}
+                if waits:
+                    entry["wait_p50"] = waits[len(waits) // 2]
+                    entry["wait_p95"] = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+                    entry["wait_max"] = waits[-1]
+                data[klass] = entry
+        return data
+
+    # -----------------------
+    # QUEUEING (CALLERS HOLD self._cond)
+    # -----------------------
+    def _enqueue(self, job: Job, klass: str) -> None:
+        weight = float(self.department_weights.get(job.department, 1.0))
+        job.klass = klass
+        job.tag = max(self._vtime[klass], self._last_tag[klass][job.department]) + 1.0 / weight
+        self._last_tag[klass][job.department] = job.tag
+        self._queues[klass][job.department].append(job)
+
+    def _promote(self, now: float) -> None:
+        # Department queues are FIFO, so only their heads can be the oldest
+        for level in range(len(PRIORITY_CLASSES) - 1, 1, -1):
+            klass, higher = PRIORITY_CLASSES[level], PRIORITY_CLASSES[level - 1]
+            for queue in self._queues[klass].values():
+                while queue:
+                    job = queue[0]
+                    levels_up = PRIORITY_CLASSES.index(job.priority) - level + 1
+                    if now - job.enqueued_at < self.aging_seconds * levels_up:
+                        break
+                    queue.popleft()
+                    self._enqueue(job, higher)
+                    self.counters[job.priority]["promoted"] += 1
+
+    def _pop(self) -> Optional[Job]:
+        if self.aging_seconds:
+            self._promote(self.clock())
+        for klass in PRIORITY_CLASSES:
+            heads = [q for q in self._queues[klass].values() if q]
+            if heads:
+                queue = min(heads, key=lambda q: q[0].tag)
+                job = queue.popleft()
+                self._vtime[klass] = job.tag
+                return job
+        return None
+
+    # -----------------------
+    # WORKERS
+    # -----------------------
+    def _ensure_workers(self):
+        # Threads started before a fork do not exist in the child
+        with self._cond:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._threads = []
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._pop()
+                while job is None:
+                    self._cond.wait()
+                    job = self._pop()
+                self._waits[job.priority].append(self.clock() - job.enqueued_at)
+
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+                outcome = "failed"
+            else:
+                job.future.set_result(result)
+                outcome = "completed"
+            finally:
+                close_old_connections()
+            with self._cond:
+                self.counters[job.priority][outcome] += 1
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_ingest_scheduler() -> IngestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = IngestScheduler(
+                workers=settings.INGEST_WORKERS,
+                aging_seconds=settings.INGEST_AGING_SECONDS,
+                department_weights=settings.INGEST_DEPARTMENT_WEIGHTS,
+            )
+    return _scheduler
+
+
+def ingest_metrics() -> Dict[str, Any]:
+    return _scheduler.snapshot() if _scheduler is not None else {}
+
+
+def job_priority(role: str, declared: str = None, batch_size: int = 1, is_superuser: bool = False) -> str:
+    """
+    A declared class is honoured only from superusers and INGEST_URGENT_ROLES,
+    so other uploaders cannot jump the queue; otherwise the uploader's role,
+    then the batch size, decide.
+    """
+    trusted = is_superuser or role in settings.INGEST_URGENT_ROLES
+    if trusted and declared in PRIORITY_CLASSES:
+        return declared
+    if role in settings.INGEST_URGENT_ROLES:
+        return "urgent"
+    if batch_size > settings.INGEST_BULK_THRESHOLD:
+        return "bulk"
+    return DEFAULT_PRIORITY
@@ -0,0 +1,107 @@
+# signals.py
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .live import live_enabled, publish_document, publish_progress, publish_removed
+from .models import Category, Document
+
+
+# -----------------------
+# FRAGMENT INVALIDATION
+# -----------------------
+# Cached dashboard fragments are keyed on Document.updated_at, so anything a
+# fragment renders that lives outside the Document row has to bump it.
+def touch_documents(pks) -> None:
+    Document.objects.filter(pk__in=list(pks)).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Document.categories.through)
+def touch_on_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            touch_documents([instance.pk])
+        return
+    # category.document_set.<op>(): pk_set holds document ids, except for clear()
+    if action == "pre_clear":
+        instance._cleared_document_pks = list(instance.document_set.values_list("pk", flat=True))
+    elif action == "post_clear":
+        touch_documents(getattr(instance, "_cleared_document_pks", []))
+    elif action in ("post_add", "post_remove") and pk_set:
+        touch_documents(pk_set)
+
+
+@receiver(post_save, sender=Category)
+def touch_on_category_renamed(sender, instance, created, **kwargs):
+    if not created:
+        touch_documents(instance.document_set.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_documents(sender, instance, **kwargs):
+    instance._deleted_document_pks = list(instance.document_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def touch_on_category_deleted(sender, instance, **kwargs):
+    touch_documents(getattr(instance, "_deleted_document_pks", []))
+
+
+# Fragments show the uploader's username; login only saves last_login
+@receiver(post_save, sender=User)
+def touch_on_uploader_saved(sender, instance, created, update_fields, **kwargs):
+    if not created and (update_fields is None or "username" in update_fields):
+        touch_documents(instance.document_set.values_list("pk", flat=True))
+
+
+# Deleting the uploader nulls uploaded_by with a queryset update, which skips auto_now
+@receiver(pre_delete, sender=User)
+def remember_uploader_documents(sender, instance, **kwargs):
+    instance._uploaded_document_pks = list(instance.document_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=User)
+def touch_on_uploader_deleted(sender, instance, **kwargs):
+    touch_documents(getattr(instance, "_uploaded_document_pks", []))
+
+
+# -----------------------
+# LIVE EVENTS
+# -----------------------
+# Pipeline stages save their stamp with update_fields, so each finished stage
+# is one progress event, and the final classify save pushes the card. Bulk
+# operations (home/bulk_actions.py) silence these and publish in one batch.
+@receiver(post_save, sender=Document)
+def publish_on_document_saved(sender, instance, created, update_fields, **kwargs):
+    if not live_enabled():
+        return
+    if update_fields is not None and "pipeline_state" in update_fields:
+        publish_progress(instance)
+    if update_fields is None or ("processed" in update_fields and instance.processed):
+        publish_document(instance)
+
+
+@receiver(pre_delete, sender=Document)
+def remember_document_categories(sender, instance, **kwargs):
+    if live_enabled():
+        instance._deleted_category_names = list(instance.categories.values_list("name", flat=True))
+
+
+@receiver(post_delete, sender=Document)
+def publish_on_document_deleted(sender, instance, **kwargs):
+    if live_enabled():
+        publish_removed(instance.pk, getattr(instance, "_deleted_category_names", []))
+
+
+@receiver(m2m_changed, sender=Document.categories.through)
+def publish_on_categories_removed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Dashboards of a category the document left drop its card
+    if action != "post_remove" or not pk_set or not live_enabled():
+        return
+    if reverse:
+        for doc_pk in pk_set:
+            publish_removed(doc_pk, [instance.name], everywhere=False)
+    else:
+        names = Category.objects.filter(pk__in=pk_set).values_list("name", flat=True)
+        publish_removed(instance.pk, names, everywhere=False)
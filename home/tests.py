@@ -1,3 +1,1835 @@
-from django.test import TestCase
+import asyncio
+import copy
+import csv
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PyPDF2.generic import DictionaryObject, NameObject, StreamObject
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock
+
+from .async_llm import AsyncGeminiModel, AsyncLLMClient, get_async_llm_client
+from .async_pipeline import aprocess_document
+from .batching import ClassificationBatcher
+from .bulk_actions import (
+    FileSweeper,
+    bulk_delete,
+    bulk_recategorise,
+    bulk_set_department,
+    create_role_users,
+    select_documents,
+)
+from .bulk_import import COMMITTED, DUPLICATE, FAILED, IMPORTED, BulkImporter, Checkpoint
+from .compact_model import export_compact_model, load_compact_artifacts
+from .doc_processor import (
+    KEYWORD_BOOSTS,
+    MIXED_LABEL,
+    PAGE_CHARS,
+    classify_sections,
+    classify_texts,
+    extract_document,
+    extract_text_from_docx,
+    extractive_summary,
+    iter_docx_part,
+    join_pages,
+    load_artifacts,
+    rank_sentences,
+    split_pages,
+    split_sentences,
+)
+from .exports import export_queryset, iter_csv, iter_ndjson, iter_rows
+from .fragments import CSRF_PLACEHOLDER, get_fragment_cache
+from . import ocr
+from .live import LiveHub, Subscriber, live_asgi
+from .llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMClient,
+    LLMHTTPError,
+    LLMTimeout,
+    client_key,
+    get_breaker,
+    get_llm_client,
+    get_metrics,
+    llm_metrics,
+)
+from .models import Category, Department, Document, DocumentEvent, FinanceUser
+from .pipeline import DEFAULT_ARTIFACTS_DIR, pending_stages, process_document
+from .previews import PreviewCache
+from .scheduler import IngestScheduler, job_priority
+from .views import live_channels
+
+
+# -------------------------
+# LLM Client
+# -------------------------
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Local stand-in for GenerativeModel that injects latency and failures."""
+
+    def __init__(self, latency=0.0, failures=0, error=ConnectionError):
+        self.latency = latency
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, prompt, request_options=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.calls <= self.failures:
+            raise self.error("injected failure")
+        return FakeResponse(f"ok: {prompt}")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LLMClientTests(SimpleTestCase):
+    def make_client(self, model, **kwargs):
+        kwargs.setdefault("timeout", 1.0)
+        kwargs.setdefault("sleep", lambda seconds: None)
+        return LLMClient(model, **kwargs)
+
+    def test_retries_transient_failures(self):
+        model = FakeModel(failures=2)
+        client = self.make_client(model, max_retries=3)
+
+        response = client.generate_content("hello")
+
+        self.assertEqual(response.text, "ok: hello")
+        self.assertEqual(model.calls, 3)
+        metrics = client.metrics.snapshot()
+        self.assertEqual(metrics["retries"], 2)
+        self.assertEqual(metrics["successes"], 1)
+        self.assertIn("latency_p95", metrics)
+
+    def test_gives_up_after_max_retries(self):
+        model = FakeModel(failures=10)
+        client = self.make_client(model, max_retries=2)
+
+        with self.assertRaises(ConnectionError):
+            client.generate_content("hello")
+        self.assertEqual(model.calls, 3)
+
+    def test_non_retryable_errors_are_raised_immediately(self):
+        model = FakeModel(failures=1, error=ValueError)
+        client = self.make_client(model, max_retries=3)
+
+        with self.assertRaises(ValueError):
+            client.generate_content("hello")
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_slow_call_is_cut_off_at_timeout(self):
+        client = self.make_client(FakeModel(latency=0.5), timeout=0.05, max_retries=0)
+
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeout):
+            client.generate_content("hello")
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(client.metrics.snapshot()["timeouts"], 1)
+
+    def test_waiting_for_a_worker_does_not_count_against_the_timeout(self):
+        client = self.make_client(FakeModel(latency=0.15), timeout=0.3, max_retries=0, max_workers=1)
+        with ThreadPoolExecutor(max_workers=4) as callers:
+            responses = list(callers.map(client.generate_content, [f"doc {i}" for i in range(4)]))
+
+        self.assertEqual([r.text for r in responses], [f"ok: doc {i}" for i in range(4)])
+        self.assertEqual(client.metrics.snapshot()["timeouts"], 0)
+
+    def test_backoff_is_jittered_and_capped(self):
+        client = self.make_client(FakeModel(), backoff_base=1.0, backoff_cap=4.0)
+        delays = [client.backoff(attempt) for attempt in range(10) for _ in range(20)]
+        self.assertTrue(all(0 <= d <= 4.0 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_breaker_opens_then_recovers_after_reset(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        model = FakeModel(failures=2)
+        client = self.make_client(model, max_retries=0, breaker=breaker)
+
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                client.generate_content("hello")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            client.generate_content("hello")
+        self.assertEqual(model.calls, 2)
+        self.assertEqual(client.metrics.snapshot()["short_circuited"], 1)
+
+        clock.now += 30
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(client.generate_content("hello").text, "ok: hello")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_half_open_trial_reopens_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        client = self.make_client(FakeModel(failures=2), max_retries=0, breaker=breaker)
+
+        with self.assertRaises(ConnectionError):
+            client.generate_content("hello")
+        clock.now += 10
+        with self.assertRaises(ConnectionError):
+            client.generate_content("hello")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_bad_request_as_half_open_trial_does_not_close_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        model = FakeModel(failures=1)
+        client = self.make_client(model, max_retries=0, breaker=breaker)
+        with self.assertRaises(ConnectionError):
+            client.generate_content("hello")
+
+        clock.now += 10
+        model.error, model.failures = ValueError, 2
+        with self.assertRaises(ValueError):
+            client.generate_content("bad request")
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # The trial slot is free again for a call that can prove recovery
+        self.assertEqual(client.generate_content("hello").text, "ok: hello")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_metrics_are_kept_per_api_key(self):
+        with mock.patch("home.llm_client.setup_gemini", lambda api_key, model_name: FakeModel()):
+            first = get_llm_client("key-one", "metrics-model")
+            second = get_llm_client("key-two", "metrics-model")
+        first.generate_content("hello")
+        metrics = llm_metrics()
+
+        self.assertIsNot(first.metrics, second.metrics)
+        self.assertEqual(metrics[client_key("key-one", "metrics-model")]["successes"], 1)
+        self.assertEqual(metrics[client_key("key-two", "metrics-model")]["successes"], 0)
+        self.assertNotIn("key-one", json.dumps(metrics))
+
+
+# -------------------------
+# Async LLM Client
+# -------------------------
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    """Emulates generateContent; the server's ``script`` injects latency and errors."""
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            status = server.script.pop(0) if server.script else 200
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.api_keys.add(self.headers.get("x-goog-api-key"))
+        if server.latency:
+            time.sleep(server.latency)
+
+        if status == 200:
+            prompt = body["contents"][0]["parts"][0]["text"]
+            payload = {"candidates": [{"content": {"parts": [{"text": f"ok: {prompt}"}]}}]}
+        else:
+            payload = {"error": {"code": status}}
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and hung up
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # listen backlog for the concurrency test
+
+
+class AsyncLLMClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubGeminiServer(("127.0.0.1", 0), StubGeminiHandler)
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.script = []
+        self.server.latency = 0.0
+        self.server.api_keys = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault("timeout", 2.0)
+        kwargs.setdefault("backoff_base", 0.0)
+        return AsyncLLMClient(AsyncGeminiModel("test-key", base_url=self.base_url), **kwargs)
+
+    def test_generates_content(self):
+        response = asyncio.run(self.make_client().generate_content("hello"))
+        self.assertEqual(response.text, "ok: hello")
+        self.assertEqual(self.server.api_keys, {"test-key"})
+
+    def test_retries_server_errors(self):
+        self.server.script = [503, 429]
+        client = self.make_client(max_retries=3)
+
+        response = asyncio.run(client.generate_content("hello"))
+
+        self.assertEqual(response.text, "ok: hello")
+        self.assertEqual(self.server.calls, 3)
+        self.assertEqual(client.metrics.snapshot()["retries"], 2)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.script = [400]
+        client = self.make_client(max_retries=3)
+
+        with self.assertRaises(LLMHTTPError):
+            asyncio.run(client.generate_content("hello"))
+        self.assertEqual(self.server.calls, 1)
+
+    def test_slow_call_is_cut_off_at_timeout(self):
+        self.server.latency = 0.5
+        client = self.make_client(timeout=0.05, max_retries=0)
+
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeout):
+            asyncio.run(client.generate_content("hello"))
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_shares_the_sync_clients_breaker_and_metrics(self):
+        with override_settings(LLM_TIMEOUT=2.0, LLM_BACKOFF_BASE=0.0, GEMINI_API_BASE=self.base_url):
+            client = get_async_llm_client("shared-key", "stub-model")
+            asyncio.run(client.generate_content("hello"))
+        self.assertIs(client.breaker, get_breaker("stub-model"))
+        self.assertIs(client.metrics, get_metrics("shared-key", "stub-model"))
+        self.assertEqual(client.metrics.snapshot()["successes"], 1)
+
+    def test_many_in_flight_calls_overlap(self):
+        self.server.latency = 0.2
+        client = self.make_client()
+
+        async def run_all():
+            return await asyncio.gather(*(client.generate_content(f"doc {i}") for i in range(100)))
+
+        started = time.monotonic()
+        responses = asyncio.run(run_all())
+        elapsed = time.monotonic() - started
+
+        self.assertEqual([r.text for r in responses], [f"ok: doc {i}" for i in range(100)])
+        # Serially this would take 20s; concurrently it is a few round trips
+        self.assertLess(elapsed, 3.0)
+
+
+# -------------------------
+# Section Classification
+# -------------------------
+HR_PAGE = "HR policy circular: holiday leave rules for employees and payroll approval. "
+DEPOT_PAGE = "Trip inspection of TS-14 traction inverter; maintenance schedule revised for the depot shift. "
+
+
+class SectionClassificationTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.artifacts = load_artifacts(DEFAULT_ARTIFACTS_DIR)
+
+    def classify(self, pages):
+        vect, clf, _, labels, thr_arr = self.artifacts
+        return classify_sections(pages, vect, clf, labels, thr_arr)
+
+    def test_page_offsets_round_trip(self):
+        pages = ["first page", "", "third page", "fourth"]
+        text, offsets = join_pages(pages)
+        self.assertEqual(split_pages(text, offsets), pages)
+
+    def test_consecutive_pages_merge_into_sections(self):
+        chosen, sorted_probs, sections = self.classify([HR_PAGE * 3] * 2 + [DEPOT_PAGE * 3] * 2)
+
+        self.assertEqual([s["pages"] for s in sections], [[1, 2], [3, 4]])
+        self.assertEqual(sections[0]["labels"], ["Administrative"])
+        self.assertEqual(sections[1]["labels"], ["Operational"])
+        self.assertIn(MIXED_LABEL, chosen)
+        self.assertEqual(len(sorted_probs), len(self.artifacts[3]))
+
+    def test_single_topic_document_is_not_mixed(self):
+        chosen, _, sections = self.classify([HR_PAGE * 3, "", HR_PAGE * 2])
+
+        self.assertEqual(chosen, ["Administrative"])
+        self.assertEqual(sections[0]["pages"][0], 1)
+        self.assertNotIn(2, [p for s in sections for p in range(s["pages"][0], s["pages"][1] + 1)])
+
+    def test_empty_document(self):
+        chosen, _, sections = self.classify(["", "  "])
+        self.assertEqual((chosen, sections), ([], []))
+
+
+# -------------------------
+# DOCX Extraction
+# -------------------------
+class DocxExtractionTests(SimpleTestCase):
+    def test_tables_headers_and_footers_in_document_order(self):
+        import docx
+
+        document = docx.Document()
+        document.sections[0].header.paragraphs[0].text = "KMRL Confidential"
+        document.sections[0].footer.paragraphs[0].text = "Procurement cell"
+        document.add_paragraph("Shift roster")
+        paragraph = document.add_paragraph("Line one")
+        paragraph.add_run().add_break()
+        paragraph.add_run("line\ttwo")
+        table = document.add_table(rows=3, cols=2)
+        for r, row in enumerate(table.rows[:2]):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"r{r}c{c}"
+        nested = table.rows[1].cells[1].add_table(rows=1, cols=2)
+        nested.rows[0].cells[0].text = "in1"
+        nested.rows[0].cells[1].text = "in2"
+        document.add_paragraph("After table")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "roster.docx")
+            document.save(path)
+            text = extract_text_from_docx(path)
+
+        self.assertEqual(text.split("\n"), [
+            "KMRL Confidential",
+            "Shift roster",
+            "Line one",
+            "line\ttwo",
+            "r0c0 | r0c1",
+            "r1c0 | r1c1 in1 | in2",  # nested table flattened into its cell; empty row dropped
+            "After table",
+            "Procurement cell",
+        ])
+
+    def test_text_box_fallback_is_not_read_twice(self):
+        xml = b"""<w:document
+            xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+            xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"><w:body>
+          <w:p><w:r><w:t>Anchor</w:t></w:r><w:r><mc:AlternateContent>
+            <mc:Choice><w:txbxContent><w:p><w:r><w:t xml:space="preserve"> boxed</w:t></w:r></w:p></w:txbxContent></mc:Choice>
+            <mc:Fallback><w:txbxContent><w:p><w:r><w:t>boxed</w:t></w:r></w:p></w:txbxContent></mc:Fallback>
+          </mc:AlternateContent></w:r></w:p>
+          <w:p><w:r><w:t>Next</w:t></w:r></w:p>
+        </w:body></w:document>"""
+        self.assertEqual(list(iter_docx_part(io.BytesIO(xml))), ["Anchor boxed", "Next"])
+
+
+# -------------------------
+# OCR Routing
+# -------------------------
+def build_pdf(path, pages):
+    """A PDF whose pages are either text (str) or a bare grey image (bytes), like a scan."""
+    from PyPDF2 import PageObject, PdfWriter
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for content in pages:
+        page = PageObject.create_blank_page(width=300, height=300)
+        stream = DecodedStreamObject()
+        if isinstance(content, str):
+            stream.set_data(f"BT /F1 12 Tf 20 150 Td ({content}) Tj ET".encode("latin-1"))
+            resources = {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        else:
+            image = DecodedStreamObject()
+            image.set_data(content)
+            image.update({
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Image"),
+                NameObject("/Width"): NumberObject(len(content)),
+                NameObject("/Height"): NumberObject(1),
+                NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+                NameObject("/BitsPerComponent"): NumberObject(8),
+            })
+            stream.set_data(b"q 300 0 0 300 0 0 cm /Im0 Do Q")
+            resources = {NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): writer._add_object(image)})}
+        page[NameObject("/Contents")] = writer._add_object(stream)
+        page[NameObject("/Resources")] = DictionaryObject(resources)
+        writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+class OcrRoutingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.path = os.path.join(tmp, "circular.pdf")
+        build_pdf(self.path, ["Depot maintenance schedule for the week", b"\x10" * 8, b"\x20" * 8])
+
+        ocr_settings = override_settings(OCR_ENABLED=True, OCR_CACHE_DIR=os.path.join(tmp, "ocr"), OCR_WORKERS=1)
+        ocr_settings.enable()
+        self.addCleanup(ocr_settings.disable)
+        ocr._cache = None
+        self.addCleanup(setattr, ocr, "_cache", None)
+
+        # The scan bytes stand in for the decoded image (Pillow) and for Tesseract's output
+        self.ocr_calls = []
+
+        def fake_ocr(image_bytes, languages):
+            self.ocr_calls.append(image_bytes)
+            return {"text": f"scanned {image_bytes[0]}", "confidence": 88.5, "seconds": 0.01}
+
+        for name, replacement in [
+            ("tesseract_version", lambda: "5.3.0"),
+            ("page_scan", lambda page: page["/Resources"]["/XObject"]["/Im0"].get_object().get_data()),
+            ("ocr_image", fake_ocr),
+        ]:
+            patcher = mock.patch.object(ocr, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_only_pages_without_text_are_ocrd_and_results_are_cached(self):
+        result = extract_document(self.path)
+        self.assertEqual(self.ocr_calls, [b"\x10" * 8, b"\x20" * 8])
+        pages = split_pages(result["text"], result["metadata"]["page_offsets"])
+        self.assertEqual(pages, ["Depot maintenance schedule for the week", "scanned 16", "scanned 32"])
+
+        meta = result["metadata"]["ocr"]
+        self.assertEqual(meta["engine"], "tesseract 5.3.0")
+        self.assertEqual(sorted(meta["pages"]), ["2", "3"])
+        self.assertEqual(meta["pages"]["2"], {"confidence": 88.5, "seconds": 0.01, "cached": False})
+
+        # Same scans again (a re-upload or reprocess): served from the page-hash cache
+        result = extract_document(self.path)
+        self.assertEqual(len(self.ocr_calls), 2)
+        self.assertTrue(result["metadata"]["ocr"]["pages"]["3"]["cached"])
+
+    def test_missing_engine_keeps_the_text_layer(self):
+        def unavailable():
+            raise EnvironmentError("tesseract is not installed or it's not in your PATH")
+
+        with mock.patch.object(ocr, "tesseract_version", unavailable), self.assertLogs("home.ocr", "WARNING"):
+            result = extract_document(self.path)
+        self.assertEqual(result["text"], "Depot maintenance schedule for the week")
+        self.assertEqual(result["metadata"]["ocr"]["skipped_pages"], [2, 3])
+        self.assertIn("not installed", result["metadata"]["ocr"]["error"])
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertIn("OCR unavailable", result["errors"][0])
+
+    def test_without_tesseract_ocr_is_off_by_default(self):
+        with override_settings(OCR_ENABLED=None), mock.patch.object(ocr, "engine_available", lambda: False):
+            result = extract_document(self.path)
+        self.assertEqual(self.ocr_calls, [])
+        self.assertEqual(result["errors"], [])
+        self.assertNotIn("ocr", result["metadata"])
+
+    def test_images_are_found_in_inherited_resources_and_form_xobjects(self):
+        image = StreamObject()
+        image[NameObject("/Subtype")] = NameObject("/Image")
+        form = StreamObject()
+        form.update({
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/Resources"): DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): image}),
+            }),
+        })
+        pages = DictionaryObject({
+            NameObject("/Resources"): DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({NameObject("/Fm0"): form}),
+            }),
+        })
+        page = DictionaryObject({NameObject("/Parent"): pages})
+        self.assertTrue(ocr.has_images(page))
+        self.assertEqual(list(ocr.page_images(page)), [image])
+        self.assertFalse(ocr.has_images(DictionaryObject({NameObject("/Parent"): DictionaryObject()})))
+
+    def test_failed_page_is_reported(self):
+        def flaky(image_bytes, languages):
+            if image_bytes[0] == 0x20:
+                raise RuntimeError("traineddata for mal is missing")
+            return {"text": "scanned", "confidence": 90.0, "seconds": 0.01}
+
+        with mock.patch.object(ocr, "ocr_image", flaky), self.assertLogs("home.ocr", "WARNING"):
+            result = extract_document(self.path)
+        self.assertEqual(result["errors"], ["OCR failed on page 3: traineddata for mal is missing"])
+
+
+# -------------------------
+# Revisions
+# -------------------------
+class RecordingModel:
+    """Fake LLM that records every prompt it is sent."""
+
+    def __init__(self):
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, request_options=None):
+        with self.lock:
+            self.prompts.append(prompt)
+        if prompt.startswith("Translate the following pages"):
+            # Keep the page markers and translate the line under each
+            lines = prompt.split("\n\n", 1)[1].splitlines()
+            return FakeResponse("\n".join(line if line.startswith("<<<PAGE") else f"EN[{line}]" for line in lines))
+        return FakeResponse(f"EN[{prompt.rsplit(chr(10), 1)[-1]}]")
+
+
+MANUAL_PAGES = [
+    f"Section {n} of the rolling stock manual covers {topic} for every trainset in the Kochi fleet"
+    for n, topic in enumerate(
+        ["bogie inspection", "brake testing", "door maintenance", "traction motors", "HVAC filters"], 1
+    )
+]
+
+
+class RevisionTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media, SUMMARY_MODE="llm")
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.model = RecordingModel()
+        patcher = mock.patch("home.pipeline.get_llm_client", lambda api_key: self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, title, pages, translate=True):
+        path = os.path.join(self.media, "build.pdf")
+        build_pdf(path, pages)
+        doc = Document(title=title)
+        with open(path, "rb") as f:
+            doc.file.save(title, ContentFile(f.read()), save=False)
+        doc.save()
+        process_document(doc, translate=translate)
+        return doc
+
+    def test_amendment_costs_one_page_of_llm_work(self):
+        v1 = self.upload("Rolling Stock Manual v1.pdf", MANUAL_PAGES)
+        self.assertIsNone(v1.previous_version)
+        self.assertEqual(len(self.model.prompts), 1 + 1)  # one translation for every page, one summary
+        self.assertEqual(v1.page_translations[2]["text"], f"EN[{MANUAL_PAGES[2]}]")
+
+        self.model.prompts.clear()
+        amended = list(MANUAL_PAGES)
+        amended[2] = "Section 3 of the rolling stock manual now requires door sensors to be recalibrated monthly"
+        v2 = self.upload("Rolling Stock Manual v2.pdf", amended)
+
+        self.assertEqual(v2.previous_version, v1)
+        self.assertEqual(v2.metadata["revision"]["changed_pages"], [3])
+        self.assertEqual(v2.metadata["revision"]["removed_pages"], [])
+
+        translations, updates = self.model.prompts[:-1], self.model.prompts[-1]
+        self.assertEqual(len(translations), 1)
+        self.assertIn("recalibrated monthly", translations[0])
+        self.assertIn(v1.summary, updates)
+        self.assertIn("recalibrated monthly", updates)
+        self.assertNotIn("bogie inspection", updates)
+        self.assertEqual(v2.page_translations[0], v1.page_translations[0])
+
+    def test_unchanged_revision_reuses_the_summary(self):
+        v1 = self.upload("Rolling Stock Manual v1.pdf", MANUAL_PAGES)
+        self.model.prompts.clear()
+        v2 = self.upload("Rolling Stock Manual v2.pdf", MANUAL_PAGES)
+        self.assertEqual(self.model.prompts, [])
+        self.assertEqual(v2.summary, v1.summary)
+
+    def test_summary_from_an_older_summarise_version_is_not_reused(self):
+        self.upload("Rolling Stock Manual v1.pdf", MANUAL_PAGES)
+        self.model.prompts.clear()
+        with mock.patch.dict("home.pipeline.STAGE_VERSIONS", summarise="99"):
+            self.upload("Rolling Stock Manual v2.pdf", MANUAL_PAGES)
+        self.assertEqual(len(self.model.prompts), 1)
+        self.assertTrue(self.model.prompts[0].startswith("Summarise the following document"))
+
+    def test_summary_of_untranslated_text_is_not_reused_when_translating(self):
+        self.upload("Rolling Stock Manual v1.pdf", MANUAL_PAGES, translate=False)
+        self.model.prompts.clear()
+        self.upload("Rolling Stock Manual v2.pdf", MANUAL_PAGES)
+        self.assertTrue(self.model.prompts[-1].startswith("Summarise the following document"))
+        self.assertIn("EN[", self.model.prompts[-1])
+
+    def test_dropped_page_marker_falls_back_to_page_by_page_translation(self):
+        batched = self.model.generate_content
+
+        def drop_second_marker(prompt, request_options=None):
+            response = batched(prompt)
+            return FakeResponse(response.text.replace("<<<PAGE 2>>>\n", ""))
+
+        self.model.generate_content = drop_second_marker
+        doc = self.upload("Rolling Stock Manual.pdf", MANUAL_PAGES)
+
+        self.assertEqual(len(self.model.prompts), 1 + 5 + 1)  # the batch, each page again, the summary
+        self.assertEqual(doc.pipeline_state["translate"]["status"], "done")
+        self.assertEqual([e["text"] for e in doc.page_translations], [f"EN[{page}]" for page in MANUAL_PAGES])
+
+    def test_numbered_titles_and_empty_documents_are_not_revisions(self):
+        self.upload("Circular 12.pdf", MANUAL_PAGES)
+        other = self.upload("Circular 13.pdf", MANUAL_PAGES)
+        self.assertIsNone(other.previous_version)
+        self.assertNotEqual(other.revision_key, "circular")
+
+        blank = self.upload("Blank form.pdf", [""])
+        again = self.upload("Blank form v2.pdf", [""])
+        self.assertIsNone(blank.text_signature)
+        self.assertIsNone(again.previous_version)
+
+    def test_same_title_with_different_text_is_not_a_revision(self):
+        self.upload("Rolling Stock Manual.pdf", MANUAL_PAGES)
+        other = self.upload("Rolling Stock Manual (1).pdf", [
+            "Quarterly revenue and ridership figures for the metro with fare box collections by station",
+        ])
+        self.assertIsNone(other.previous_version)
+        self.assertNotIn("revision", other.metadata)
+
+
+# -------------------------
+# Bulk Export
+# -------------------------
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        finance = Department.objects.create(name="Finance/Procurement")
+        technical = Category.objects.create(name="Technical")
+        for i in range(5):
+            doc = Document.objects.create(
+                title=f"Report {i}",
+                uploaded_by=cls.admin,
+                department=finance if i % 2 else None,
+                file=f"documents/report_{i}.pdf",
+                summary=f"Summary, with \"quotes\" {i}",
+                confidence_scores={"Technical": 0.5 + i / 10},
+            )
+            if i < 3:
+                doc.categories.add(technical)
+
+    def test_csv_header_is_sent_before_querying(self):
+        stream = iter_csv(iter_rows(export_queryset()))
+        with self.assertNumQueries(0):
+            header = next(stream)
+        self.assertTrue(header.startswith(b"id,title,"))
+
+        rows = list(csv.DictReader(io.StringIO((header + b"".join(stream)).decode("utf-8"))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["categories"], "Technical")
+        self.assertEqual(rows[0]["summary"], 'Summary, with "quotes" 0')
+        self.assertEqual(json.loads(rows[4]["confidence_scores"]), {"Technical": 0.9})
+
+    def test_queries_scale_with_chunks_not_rows(self):
+        # One streamed query for the documents, then a category prefetch per chunk of 2
+        with self.assertNumQueries(4):
+            rows = list(iter_ndjson(iter_rows(export_queryset(), chunk_size=2)))
+        self.assertEqual(len(rows), 5)
+
+    def test_filters(self):
+        titles = lambda qs: sorted(doc.title for doc in qs)
+        self.assertEqual(titles(export_queryset(category="Technical")), ["Report 0", "Report 1", "Report 2"])
+        self.assertEqual(titles(export_queryset(department="Finance/Procurement")), ["Report 1", "Report 3"])
+        self.assertEqual(len(export_queryset(date_to="2000-01-01")), 0)
+
+    def test_endpoint_streams_ndjson_and_rejects_bad_dates(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get("/documents/export/ndjson/", {"category": "Technical"})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["title"] for row in rows], ["Report 0", "Report 1", "Report 2"])
+
+        response = self.client.get("/documents/export/csv/", {"from": "2025-13-01"})
+        self.assertEqual(response.status_code, 400)
+
+
+# -------------------------
+# Bulk Import
+# -------------------------
+# Marker file for fail_first_extraction, patched per test (forked workers inherit it)
+FAIL_ONCE_MARKER = None
+
+
+def fail_first_extraction(path):
+    """extract_document that raises the first time it is called in any worker."""
+    try:
+        os.close(os.open(FAIL_ONCE_MARKER, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return extract_document(path)
+    raise ValueError("unreadable")
+
+
+class BulkImportTests(TransactionTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.media = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.media, "checkpoint.jsonl")
+        os.makedirs(os.path.join(self.root, "nested"))
+        for i in range(5):
+            with open(os.path.join(self.root, f"note{i}.txt"), "w") as f:
+                f.write(f"Maintenance note {i}: inspection schedule for the depot shift.")
+        shutil.copy(os.path.join(self.root, "note0.txt"), os.path.join(self.root, "nested", "copy.txt"))
+        os.symlink(os.path.join(self.root, "missing.txt"), os.path.join(self.root, "nested", "dangling.txt"))
+        with open(os.path.join(self.root, "ignored.bin"), "wb") as f:
+            f.write(b"unsupported")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.media)
+
+    def run_import(self, **kwargs):
+        kwargs.setdefault("extract_only", True)
+        checkpoint = Checkpoint(self.checkpoint_path)
+        try:
+            with override_settings(MEDIA_ROOT=self.media):
+                BulkImporter(
+                    checkpoint, workers=2, batch_size=2, report=lambda line: None, **kwargs
+                ).run(self.root)
+        finally:
+            checkpoint.close()
+        return {os.path.relpath(path, self.root): e["status"] for path, e in Checkpoint(self.checkpoint_path).entries.items()}
+
+    def test_imports_tree_and_skips_duplicate_content(self):
+        statuses = self.run_import()
+
+        self.assertEqual(sorted(statuses), ["nested/copy.txt", "nested/dangling.txt"] + [f"note{i}.txt" for i in range(5)])
+        self.assertEqual(statuses["nested/dangling.txt"], FAILED)
+        self.assertEqual(statuses["nested/copy.txt"], DUPLICATE)
+        self.assertEqual(Document.objects.count(), 5)
+
+        doc = Document.objects.get(title="note3.txt")
+        self.assertIn("Maintenance note 3", doc.extracted_text)
+        self.assertEqual(doc.pipeline_state["extract"]["status"], "done")
+        self.assertTrue(os.path.exists(os.path.join(self.media, doc.file.name)))
+
+    def test_rerun_finishes_committed_documents(self):
+        self.run_import()
+        # Crash after the inserts but before the later stages: entries stay COMMITTED
+        with open(self.checkpoint_path) as f:
+            entries = [json.loads(line) for line in f]
+        with open(self.checkpoint_path, "w") as f:
+            for entry in entries:
+                if entry["status"] == IMPORTED:
+                    entry["status"] = COMMITTED
+                f.write(json.dumps(entry) + "\n")
+            f.write('{"path": "torn')
+
+        with override_settings(SUMMARY_MODE="extractive"):
+            statuses = self.run_import(extract_only=False, translate=False, llm_concurrency=1)
+
+        self.assertEqual(Document.objects.count(), 5)
+        self.assertEqual(list(statuses.values()).count(IMPORTED), 5)
+        self.assertNotIn(COMMITTED, statuses.values())
+        self.assertTrue(all(doc.processed for doc in Document.objects.all()))
+
+    def test_failed_insert_deletes_copied_files(self):
+        with mock.patch.object(Document.objects, "bulk_create", side_effect=IntegrityError("boom")):
+            with self.assertRaises(IntegrityError):
+                self.run_import()
+
+        stored = [name for _, _, names in os.walk(self.media) for name in names]
+        self.assertEqual(stored, ["checkpoint.jsonl"])
+
+    def test_copy_is_extracted_when_original_fails(self):
+        self.run_import()
+        Document.objects.all().delete()
+        os.remove(self.checkpoint_path)
+        # Only note0.txt and nested/copy.txt share content; whichever is extracted first fails
+        for i in range(1, 5):
+            os.remove(os.path.join(self.root, f"note{i}.txt"))
+
+        with mock.patch(f"{__name__}.FAIL_ONCE_MARKER", os.path.join(self.media, "failed-once")), \
+                mock.patch("home.bulk_import.extract_document", fail_first_extraction):
+            statuses = self.run_import()
+
+        self.assertEqual(sorted([statuses["note0.txt"], statuses["nested/copy.txt"]]), sorted([FAILED, IMPORTED]))
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_retry_failed_resumes_documents_whose_later_stages_failed(self):
+        self.run_import()
+        with open(self.checkpoint_path) as f:
+            entries = [json.loads(line) for line in f]
+        with open(self.checkpoint_path, "w") as f:
+            for entry in entries:
+                if entry["status"] == IMPORTED:
+                    entry.update(status=FAILED, error="summary failed")
+                f.write(json.dumps(entry) + "\n")
+
+        with override_settings(SUMMARY_MODE="extractive"):
+            statuses = self.run_import(extract_only=False, translate=False, llm_concurrency=1, retry_failed=True)
+
+        self.assertEqual(Document.objects.count(), 5)
+        self.assertEqual(list(statuses.values()).count(IMPORTED), 5)
+        self.assertTrue(all(doc.processed for doc in Document.objects.all()))
+
+
+# -------------------------
+# Ingest Scheduler
+# -------------------------
+class IngestSchedulerTests(SimpleTestCase):
+    def run_gated(self, scheduler, submit_jobs, before_release=None):
+        """Block the only worker, queue jobs, then release it and return the run order."""
+        gate = threading.Event()
+        order = []
+        scheduler.submit(gate.wait, department="gate")
+        time.sleep(0.05)  # let the worker pick up the gate job
+        futures = submit_jobs(lambda name: (lambda: order.append(name)))
+        if before_release:
+            before_release()
+        gate.set()
+        for future in futures:
+            future.result(timeout=5)
+        return order
+
+    def test_higher_class_runs_first(self):
+        scheduler = IngestScheduler(workers=1)
+        order = self.run_gated(scheduler, lambda job: [
+            *(scheduler.submit(job(f"bulk{i}"), priority="bulk", department="Finance") for i in range(5)),
+            scheduler.submit(job("normal"), priority="normal", department="HR"),
+            scheduler.submit(job("urgent"), priority="urgent", department="Compliance"),
+        ])
+        self.assertEqual(order[:2], ["urgent", "normal"])
+
+    def test_departments_share_a_class_fairly(self):
+        scheduler = IngestScheduler(workers=1, department_weights={"Operations": 2})
+        order = self.run_gated(scheduler, lambda job: [
+            *(scheduler.submit(job(f"finance{i}"), department="Finance") for i in range(10)),
+            *(scheduler.submit(job(f"hr{i}"), department="HR") for i in range(2)),
+            *(scheduler.submit(job(f"ops{i}"), department="Operations") for i in range(4)),
+        ])
+        # HR's two files interleave with Finance's backlog instead of waiting behind it
+        self.assertLessEqual(order.index("hr1"), 6)
+        # Operations has twice the weight, so it gets through its jobs twice as fast
+        self.assertLess(order.index("ops3"), order.index("finance3"))
+
+    def test_waiting_bulk_jobs_are_promoted(self):
+        clock = FakeClock()
+        scheduler = IngestScheduler(workers=1, aging_seconds=60, clock=clock)
+
+        def advance():
+            clock.now += 60
+
+        order = self.run_gated(scheduler, lambda job: [
+            scheduler.submit(job("bulk"), priority="bulk", department="Finance"),
+            *(scheduler.submit(job(f"normal{i}"), priority="normal", department="HR") for i in range(5)),
+        ], before_release=advance)
+        self.assertLess(order.index("bulk"), 2)
+        self.assertEqual(scheduler.snapshot()["bulk"]["promoted"], 1)
+
+    def test_urgent_wait_stays_bounded_under_bulk_load(self):
+        scheduler = IngestScheduler(workers=4)
+        job = lambda: time.sleep(0.005)
+        futures = [scheduler.submit(job, priority="bulk", department="Finance") for _ in range(400)]
+        for _ in range(20):
+            time.sleep(0.02)
+            futures.append(scheduler.submit(job, priority="urgent", department="Compliance"))
+        for future in futures:
+            future.result(timeout=10)
+
+        metrics = scheduler.snapshot()
+        self.assertEqual(metrics["urgent"]["completed"], 20)
+        self.assertEqual(metrics["bulk"]["queue_depth"], 0)
+        # An urgent job waits at most for one running job to finish, not for the backlog
+        self.assertLess(metrics["urgent"]["wait_max"], 0.05)
+        self.assertGreater(metrics["bulk"]["wait_max"], 0.2)
+
+    def test_declared_priority_is_only_trusted_from_privileged_uploaders(self):
+        self.assertEqual(job_priority("Finance", "urgent"), "normal")
+        self.assertEqual(job_priority("Finance", "urgent", batch_size=50), "bulk")
+        self.assertEqual(job_priority("Finance", "urgent", is_superuser=True), "urgent")
+        self.assertEqual(job_priority("Compliance", "bulk"), "bulk")
+        self.assertEqual(job_priority("Compliance"), "urgent")
+
+
+# -------------------------
+# Compact Model
+# -------------------------
+class CompactModelParityTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.out_dir = tempfile.mkdtemp()
+        export_compact_model(DEFAULT_ARTIFACTS_DIR, cls.out_dir)
+        cls.sklearn = load_artifacts(DEFAULT_ARTIFACTS_DIR)
+        cls.compact = load_compact_artifacts(cls.out_dir)
+
+        vocabulary = sorted(cls.sklearn[0].vocabulary_)
+        cls.texts = [
+            "",
+            "The the and of",  # stop words only
+            "Quarterly budget, invoice and audit summary for the Finance department.",
+            "Board minutes: the chairman approved the new HR policy on holiday leave.",
+            "Trip inspection of TS-14 traction inverter; maintenance schedule revised.",
+            "Compliance notice: licence renewal, penalty of Rs 5,000 and court dispute.",
+            " ".join(vocabulary[::7]),
+        ] + [" ".join(words) for words in KEYWORD_BOOSTS.values()]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+        super().tearDownClass()
+
+    def test_arrays_are_memory_mapped(self):
+        vect, clf, _, _, _ = self.compact
+        for array in (vect.vocab, vect.idf, clf.coef, clf.intercept):
+            self.assertIsNotNone(getattr(array, "filename", None))
+            self.assertFalse(array.flags.writeable)
+
+    def test_probabilities_match_sklearn(self):
+        vect, clf, _, _, _ = self.sklearn
+        c_vect, c_clf, _, _, _ = self.compact
+
+        expected = clf.predict_proba(vect.transform(self.texts))
+        actual = c_clf.predict_proba(c_vect.transform(self.texts))
+        self.assertEqual(actual.shape, expected.shape)
+        self.assertLess(abs(actual - expected).max(), 1e-5)
+
+    def test_labels_match_sklearn(self):
+        vect, clf, _, labels, thr_arr = self.sklearn
+        c_vect, c_clf, _, c_labels, c_thr_arr = self.compact
+
+        expected = classify_texts(self.texts, vect, clf, labels, thr_arr)
+        actual = classify_texts(self.texts, c_vect, c_clf, c_labels, c_thr_arr)
+        self.assertEqual([chosen for chosen, _ in actual], [chosen for chosen, _ in expected])
+
+    def test_options_the_runtime_cannot_reproduce_are_rejected(self):
+        vect, *rest = self.sklearn
+        for params in (
+            {"binary": True},
+            {"strip_accents": "unicode"},
+            {"preprocessor": str.upper},
+            {"tokenizer": str.split},
+            {"token_pattern": r"(\w)(\w+)"},
+        ):
+            with self.subTest(params=params):
+                changed = copy.deepcopy(vect).set_params(**params)
+                with mock.patch("home.doc_processor.load_artifacts", return_value=(changed, *rest)), \
+                        tempfile.TemporaryDirectory() as out_dir:
+                    with self.assertRaisesRegex(ValueError, "can be exported"):
+                        export_compact_model(DEFAULT_ARTIFACTS_DIR, out_dir)
+
+
+# -------------------------
+# Dashboard Fragments
+# -------------------------
+class DocumentFragmentTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        get_fragment_cache().clear()
+
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.technical = Category.objects.create(name="Technical")
+        self.docs = []
+        for i in range(3):
+            doc = Document(title=f"Manual {i}", uploaded_by=self.admin, summary=f"Summary {i}")
+            doc.file.save(f"manual_{i}.txt", ContentFile(b"text"), save=False)
+            doc.save()
+            self.docs.append(doc)
+        self.client.force_login(self.admin)
+
+    def load_admin_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin_dashboard/")
+        full_fetches = [q for q in queries if "summary" in q["sql"] and "home_document" in q["sql"]]
+        return response.content.decode("utf-8"), len(full_fetches)
+
+    def test_warm_page_is_assembled_from_cache(self):
+        html, full_fetches = self.load_admin_dashboard()
+        self.assertEqual(full_fetches, 1)
+        self.assertIn("Manual 2", html)
+
+        html, full_fetches = self.load_admin_dashboard()
+        self.assertEqual(full_fetches, 0)
+        self.assertEqual(html.count('class="document-card'), 3)
+        self.assertNotIn(CSRF_PLACEHOLDER, html)
+        # Each delete form gets this request's token
+        token_inputs = re.findall(r'class="inline">\s*<input type="hidden" name="csrfmiddlewaretoken" value="\w+">', html)
+        self.assertEqual(len(token_inputs), 3)
+
+    def test_category_changes_invalidate_only_that_document(self):
+        self.load_admin_dashboard()
+
+        self.docs[0].categories.add(self.technical)
+        with CaptureQueriesContext(connection) as queries:
+            html, _ = self.load_admin_dashboard()
+        refetch = [q["sql"] for q in queries if "summary" in q["sql"] and "home_document" in q["sql"]]
+        self.assertEqual(len(refetch), 1)
+        self.assertIn(f"IN ({self.docs[0].pk})", refetch[0])
+        self.assertIn('data-category="technical"', html)
+
+        self.technical.name = "Engineering"
+        self.technical.save()
+        html, full_fetches = self.load_admin_dashboard()
+        self.assertEqual(full_fetches, 1)
+        self.assertIn('data-category="engineering"', html)
+
+    def test_uploader_rename_and_delete_invalidate_their_documents(self):
+        uploader = User.objects.create_user("inspector", password="pw")
+        doc = self.docs[0]
+        doc.uploaded_by = uploader
+        doc.save()
+        html, _ = self.load_admin_dashboard()
+        self.assertIn("inspector", html)
+
+        self.client.logout()
+        self.client.login(username="inspector", password="pw")  # saves last_login only
+        self.client.force_login(self.admin)
+        _, full_fetches = self.load_admin_dashboard()
+        self.assertEqual(full_fetches, 0)
+
+        uploader.username = "depot-inspector"
+        uploader.save()
+        html, full_fetches = self.load_admin_dashboard()
+        self.assertEqual(full_fetches, 1)
+        self.assertIn("depot-inspector", html)
+
+        uploader.delete()
+        html, full_fetches = self.load_admin_dashboard()
+        self.assertEqual(full_fetches, 1)
+        self.assertNotIn("depot-inspector", html)
+
+    def test_pipeline_saves_bump_the_stamp(self):
+        doc = self.docs[1]
+        before = doc.updated_at
+        doc.summary = "Revised"
+        doc.save(update_fields=["summary"])
+        doc.refresh_from_db()
+        self.assertGreater(doc.updated_at, before)
+
+
+# -------------------------
+# Live Updates
+# -------------------------
+class LiveEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.finance_user = User.objects.create_user("finance", "finance@example.com", "pw")
+        FinanceUser.objects.create(user=cls.finance_user)
+        cls.financial = Category.objects.create(name="Financial")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        get_fragment_cache().clear()
+
+        # The hub is polled by hand: a polling thread would not see the test transaction
+        patcher = mock.patch.object(LiveHub, "_ensure_thread")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hub = LiveHub()
+
+    def upload(self, title):
+        doc = Document(title=title, uploaded_by=self.admin)
+        doc.file.save(title, ContentFile(b"text"), save=False)
+        doc.save()
+        return doc
+
+    def classify(self, doc, categories):
+        # What the last pipeline stage saves
+        doc.categories.set(categories)
+        doc.processed = True
+        doc.pipeline_state = {"classify": {"status": "done", "finished_at": timezone.now().isoformat()}}
+        doc.save(update_fields=["pipeline_state", "processed"])
+
+    def drain(self, subscriber):
+        messages = []
+        while True:
+            try:
+                messages.append(subscriber.get(0))
+            except queue.Empty:
+                return messages
+
+    def test_classified_document_is_pushed_to_its_category(self):
+        self.hub.prime()
+        finance = [self.hub.subscribe(live_channels(self.finance_user)) for _ in range(2)]
+        admin = self.hub.subscribe(live_channels(self.admin))
+
+        doc = self.upload("Budget 2025.pdf")
+        self.classify(doc, [self.financial])
+        self.hub.poll_once()
+
+        admin_messages = self.drain(admin)
+        self.assertEqual([m["kind"] for m in admin_messages], ["document", "progress", "document"])
+        self.assertEqual(admin_messages[1]["data"]["stage"], "classify")
+        self.assertIn(CSRF_PLACEHOLDER, admin_messages[2]["fragments"]["card"])
+
+        first, second = (self.drain(subscriber) for subscriber in finance)
+        self.assertEqual([m["kind"] for m in first], ["document"])  # progress is for admins and the uploader
+        self.assertIn(f'data-doc-id="{doc.pk}"', first[0]["fragments"]["card"])
+        # Rendered once for the channel, not once per stream
+        self.assertIs(first[0]["fragments"], second[0]["fragments"])
+
+        doc.categories.remove(self.financial)
+        self.hub.poll_once()
+        self.assertEqual([m["kind"] for m in self.drain(finance[0])], ["removed"])
+        self.assertEqual(self.drain(admin), [])
+
+    def test_stream_replays_what_happened_since_the_page_render(self):
+        self.client.force_login(self.finance_user)
+        html = self.client.get("/dashboard/").content.decode("utf-8")
+        last_event_id = re.search(r"last_event_id=(\d+)", html).group(1)
+
+        doc = self.upload("Budget 2025.pdf")
+        self.classify(doc, [self.financial])
+
+        with mock.patch("home.live.get_live_hub", return_value=self.hub):
+            response = self.client.get(f"/live/?last_event_id={last_event_id}")
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            frames = iter(response.streaming_content)
+            self.assertIn(b"event: hello", next(frames))
+            frame = next(frames).decode("utf-8")
+            response.close()
+
+        self.assertIn("event: document", frame)
+        data = json.loads(frame.split("data: ", 1)[1])
+        self.assertEqual(data["doc"], doc.pk)
+        self.assertIn("Budget 2025.pdf", data["card"])
+        self.assertEqual(self.hub.counters["connections"], 0)
+
+    def test_slow_stream_is_cut_off(self):
+        subscriber = Subscriber(["admin"], limit=2)
+        for i in range(4):
+            subscriber.deliver({"id": i})
+        self.assertTrue(subscriber.overflowed)
+        self.assertEqual([subscriber.get(0) for _ in range(3)], [{"id": 0}, {"id": 1}, None])
+
+    async def test_asgi_stream_needs_a_session(self):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "path": "/live/", "headers": [], "query_string": b""}
+        await live_asgi(scope, receive, send)
+        self.assertEqual(sent[0]["status"], 403)
+
+
+# -------------------------
+# Bulk Document Actions
+# -------------------------
+class BulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        cls.financial = Category.objects.create(name="Financial")
+        cls.regulatory = Category.objects.create(name="Regulatory")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        # Files are swept by hand: the sweeper thread would not see the test transaction
+        patcher = mock.patch.object(FileSweeper, "_ensure_thread")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sweeper = FileSweeper()
+        patcher = mock.patch("home.bulk_actions.get_file_sweeper", return_value=self.sweeper)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_documents(self, count, title="Import"):
+        docs = []
+        for i in range(count):
+            doc = Document(title=f"{title} {i}", uploaded_by=self.admin)
+            doc.file.save(f"{title.lower()}-{i}.txt", ContentFile(b"text"), save=False)
+            doc.save()
+            doc.categories.add(self.financial)
+            docs.append(doc)
+        return docs
+
+    def test_bulk_delete_is_set_based_and_sweeps_files(self):
+        docs = self.make_documents(12)
+        keeper = Document.objects.create(title="Kept", file=docs[0].file.name, previous_version=docs[1])
+
+        ids = select_documents(uploaded_by="admin")
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            deleted = bulk_delete(ids, chunk_size=5)
+        self.assertEqual(deleted, 12)
+        # A few statements per chunk of five, not several per document
+        self.assertLess(len(queries), 40)
+
+        keeper.refresh_from_db()
+        self.assertIsNone(keeper.previous_version)
+        self.assertEqual(len(self.sweeper._pending), 12)
+        self.sweeper.sweep(list(self.sweeper._pending))
+        self.assertEqual(self.sweeper.counters["kept"], 1)  # still referenced by the keeper
+        self.assertTrue(os.path.exists(os.path.join(self.media, docs[0].file.name)))
+        self.assertFalse(os.path.exists(os.path.join(self.media, docs[2].file.name)))
+
+        events = DocumentEvent.objects.filter(kind="removed")
+        self.assertEqual(events.count(), 12)
+        self.assertEqual(events.get(document_id=docs[5].pk).channels, ["admin", "category:Financial"])
+
+    def test_recategorise_writes_the_link_table_and_bumps_fragments(self):
+        docs = self.make_documents(4)
+        stamps = dict(Document.objects.values_list("id", "updated_at"))
+
+        result = bulk_recategorise([d.pk for d in docs], add=["Regulatory", "Executive"], remove=["Financial"])
+        self.assertEqual(result, {"documents": 4, "added": 8, "removed": 4})
+        for doc in Document.objects.filter(pk__in=[d.pk for d in docs]):
+            self.assertEqual(sorted(doc.categories.values_list("name", flat=True)), ["Executive", "Regulatory"])
+            self.assertGreater(doc.updated_at, stamps[doc.pk])
+        removed = DocumentEvent.objects.filter(kind="removed", document_id=docs[0].pk).get()
+        self.assertEqual(removed.channels, ["category:Financial"])
+
+        # Too many documents for the dashboards to patch card by card: one reload
+        with override_settings(LIVE_REPLAY_LIMIT=2):
+            bulk_recategorise([d.pk for d in docs], replace=["Financial"])
+        reload = DocumentEvent.objects.filter(kind="reload")
+        self.assertEqual(reload.count(), 2)  # one for the removals, one for the new cards
+        self.assertIn("category:Financial", reload.last().channels)
+
+    def test_set_department_publishes_the_updated_documents(self):
+        docs = self.make_documents(3)
+        Department.objects.create(name="Operations")
+        last_event = DocumentEvent.objects.latest("id").id
+
+        updated = bulk_set_department([d.pk for d in docs] + [10_000], "Operations", chunk_size=2)
+        self.assertEqual(updated, 3)
+        self.assertEqual(set(Document.objects.values_list("department__name", flat=True)), {"Operations"})
+        events = DocumentEvent.objects.filter(kind="document", id__gt=last_event)
+        self.assertEqual(sorted(events.values_list("document_id", flat=True)), sorted(d.pk for d in docs))
+        self.assertEqual(events.first().channels, ["admin"])
+
+    def test_admin_bulk_endpoint(self):
+        self.make_documents(3)
+        other = Document.objects.create(title="Other", file="documents/other.txt")
+        self.client.force_login(self.admin)
+
+        self.client.post("/documents/bulk/", {"action": "delete", "uploaded_by": "admin", "dry_run": "1"})
+        self.assertEqual(Document.objects.count(), 4)
+
+        response = self.client.post("/documents/bulk/", {"action": "delete", "uploaded_by": "admin"})
+        self.assertRedirects(response, "/admin_dashboard/", fetch_redirect_response=False)
+        self.assertEqual(list(Document.objects.values_list("pk", flat=True)), [other.pk])
+
+        # Without a filter nothing is selected
+        self.client.post("/documents/bulk/", {"action": "delete"})
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_create_role_users_in_bulk(self):
+        Department.objects.create(name="Financial")
+        created, existing = create_role_users([
+            ("a@example.com", "pw-a", "Financial"),
+            ("b@example.com", "pw-b", "Financial"),
+            ("admin", "pw", "Financial"),
+        ])
+        self.assertEqual(existing, ["admin"])
+        self.assertEqual(FinanceUser.objects.count(), 2)
+        self.assertTrue(User.objects.get(username="b@example.com").check_password("pw-b"))
+
+
+# -------------------------
+# Document Downloads
+# -------------------------
+class DocumentDownloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media, DOCUMENT_SENDFILE_BACKEND=None)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.content = bytes(range(100))
+        self.doc = Document(title="Manual", uploaded_by=self.admin)
+        self.doc.file.save("manual.pdf", ContentFile(self.content), save=False)
+        self.doc.save()
+        self.url = f"/documents/{self.doc.pk}/download/"
+        self.client.force_login(self.admin)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_single_range(self):
+        response, body = self.get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(body, self.content[10:20])
+
+    def test_suffix_and_open_ended_ranges(self):
+        response, body = self.get(HTTP_RANGE="bytes=-5")
+        self.assertEqual(response["Content-Range"], "bytes 95-99/100")
+        self.assertEqual(body, self.content[-5:])
+
+        response, body = self.get(HTTP_RANGE="bytes=90-")
+        self.assertEqual(response["Content-Range"], "bytes 90-99/100")
+        self.assertEqual(body, self.content[90:])
+
+        # An end past EOF is clamped to the last byte
+        response, body = self.get(HTTP_RANGE="bytes=95-500")
+        self.assertEqual(response["Content-Range"], "bytes 95-99/100")
+
+    def test_unsatisfiable_range(self):
+        for header in ("bytes=100-", "bytes=50-10", "bytes=-0"):
+            response, _ = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_if_range_with_stale_etag_sends_the_whole_file(self):
+        etag = self.get()[0]["ETag"]
+        response, body = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response, body = self.get(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_same_size_overwrite_changes_the_etag(self):
+        etag = self.get()[0]["ETag"]
+        with open(self.doc.file.path, "wb") as f:
+            f.write(bytes(reversed(self.content)))
+        mtime = os.path.getmtime(self.doc.file.path) + 10
+        os.utime(self.doc.file.path, (mtime, mtime))
+
+        response, body = self.get()
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(body, bytes(reversed(self.content)))
+
+    def test_multi_range_falls_back_to_the_whole_file(self):
+        response, body = self.get(HTTP_RANGE="bytes=0-9,20-29")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+
+# -------------------------
+# Page Previews and Thumbnails
+# -------------------------
+class PreviewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.cache_dir = os.path.join(self.media, "previews")
+        preview_settings = override_settings(MEDIA_ROOT=self.media)
+        preview_settings.enable()
+        self.addCleanup(preview_settings.disable)
+        patcher = mock.patch("home.previews._cache", PreviewCache(self.cache_dir, 1024 * 1024))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.admin)
+
+    def test_page_preview_and_thumbnail_are_cached(self):
+        text = "A" * PAGE_CHARS + "Second page <b>text</b>"
+        doc = Document(title="Notes", uploaded_by=self.admin, extracted_text=text)
+        doc.file.save("notes.txt", ContentFile(text.encode()), save=False)
+        doc.save()
+
+        response = self.client.get(f"/documents/{doc.pk}/preview/2/")
+        self.assertEqual(response.json(), {"page": 2, "pages": 2, "text": "Second page <b>text</b>"})
+        self.assertEqual(self.client.get(f"/documents/{doc.pk}/preview/3/").status_code, 404)
+        # Unchanged file: the browser's copy is still good
+        again = self.client.get(f"/documents/{doc.pk}/preview/2/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        thumbnail = self.client.get(f"/documents/{doc.pk}/thumbnail/")
+        self.assertEqual(thumbnail["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", thumbnail.content)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)  # page 2 and the thumbnail
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = PreviewCache(self.cache_dir, max_bytes=250)
+        cache.set("a", b"a" * 100)
+        cache.set("b", b"b" * 100)
+        os.utime(os.path.join(self.cache_dir, "a"), (1, 1))
+        os.utime(os.path.join(self.cache_dir, "b"), (2, 2))
+        self.assertEqual(cache.get("a"), b"a" * 100)  # read: now the most recent
+
+        cache.set("c", b"c" * 100)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["a", "c"])
+
+    def test_writes_under_the_cap_do_not_scan_the_directory(self):
+        cache = PreviewCache(self.cache_dir, max_bytes=1000)
+        cache.set("first", b"x" * 10)  # counts what is already on disk
+        with mock.patch("home.previews.os.scandir", wraps=os.scandir) as scandir:
+            for i in range(5):
+                cache.set(f"entry-{i}", b"x" * 100)
+            cache.set("entry-0", b"x" * 50)  # a rewrite counts only the difference
+            self.assertEqual(scandir.call_count, 0)
+            cache.set("big", b"x" * 600)
+            self.assertEqual(scandir.call_count, 1)
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self.cache_dir, n)) for n in os.listdir(self.cache_dir)), 1000)
+
+
+# -------------------------
+# Incremental Pipeline
+# -------------------------
+class FailingModel:
+    def generate_content(self, prompt, request_options=None):
+        raise ConnectionError("LLM unavailable")
+
+
+class PipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media, SUMMARY_MODE="llm", CLASSIFY_MODE="summary")
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.model = RecordingModel()
+        patcher = mock.patch("home.pipeline.get_llm_client", lambda api_key: self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, title, text="Quarterly budget and procurement figures for the metro."):
+        doc = Document(title=title)
+        doc.file.save(f"{title}.txt", ContentFile(text.encode()), save=False)
+        doc.save()
+        return doc
+
+    def test_only_the_stale_stage_reruns_after_a_version_bump(self):
+        doc = self.upload("Budget")
+        self.assertEqual(process_document(doc), ["extract", "revision", "summarise", "classify"])
+        self.assertEqual(process_document(doc), [])
+
+        with mock.patch.dict("home.pipeline.STAGE_VERSIONS", summarise="99"):
+            # Same summary text, so classify's input is unchanged and it stays put
+            self.assertEqual(process_document(doc), ["summarise"])
+            self.assertEqual(process_document(doc), [])
+
+    def test_failed_and_fallback_stages_are_retried(self):
+        doc = self.upload("Budget")
+        self.model = FailingModel()
+        with mock.patch("home.pipeline.get_batcher", side_effect=RuntimeError("no classifier")):
+            process_document(doc)
+        self.assertEqual(doc.pipeline_state["summarise"]["status"], "fallback")
+        self.assertEqual(doc.pipeline_state["classify"]["status"], "failed")
+        self.assertEqual(pending_stages(doc), ["summarise", "classify"])
+        self.assertFalse(doc.processed)
+
+        self.model = RecordingModel()
+        self.assertEqual(process_document(doc), ["summarise", "classify"])
+        self.assertEqual(pending_stages(doc), [])
+        self.assertTrue(doc.processed)
+
+    def test_force_reruns_an_up_to_date_stage(self):
+        doc = self.upload("Budget")
+        process_document(doc)
+        self.model.prompts.clear()
+        self.assertEqual(process_document(doc, force=["summarise"]), ["summarise"])
+        self.assertEqual(len(self.model.prompts), 1)
+
+    def test_failed_ocr_leaves_extract_to_retry(self):
+        path = os.path.join(self.media, "build.pdf")
+        build_pdf(path, ["Depot maintenance schedule for the week", b"\x10" * 8])
+        doc = Document(title="Circular")
+        with open(path, "rb") as f:
+            doc.file.save("circular.pdf", ContentFile(f.read()), save=False)
+        doc.save()
+        ocr_settings = override_settings(
+            OCR_ENABLED=True, OCR_CACHE_DIR=os.path.join(self.media, "ocr"), OCR_WORKERS=1
+        )
+        ocr_settings.enable()
+        self.addCleanup(ocr_settings.disable)
+        self.addCleanup(setattr, ocr, "_cache", None)
+
+        def unavailable():
+            raise EnvironmentError("tesseract is not installed")
+
+        with mock.patch.object(ocr, "tesseract_version", unavailable), self.assertLogs("home.ocr", "WARNING"):
+            process_document(doc)
+        self.assertEqual(doc.pipeline_state["extract"]["status"], "fallback")
+        self.assertIn("tesseract is not installed", doc.pipeline_state["extract"]["error"])
+        self.assertIn("extract", pending_stages(doc))
+
+        with mock.patch.multiple(
+            ocr,
+            tesseract_version=lambda: "5.3.0",
+            page_scan=lambda page: b"scan",
+            ocr_image=lambda image_bytes, languages: {"text": "scanned notice", "confidence": 90.0, "seconds": 0.01},
+        ):
+            self.assertEqual(process_document(doc)[0], "extract")
+        self.assertEqual(doc.pipeline_state["extract"]["status"], "done")
+        self.assertIn("scanned notice", doc.extracted_text)
+
+    def test_reprocess_documents_selects_by_id_and_skips_missing_files(self):
+        first, second, missing = self.upload("First"), self.upload("Second"), self.upload("Missing")
+        missing.file.delete(save=False)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("reprocess_documents", str(second.pk), "--no-translate", stdout=out, stderr=err)
+        second.refresh_from_db()
+        first.refresh_from_db()
+        self.assertTrue(second.processed)
+        self.assertIsNone(first.pipeline_state)
+        self.assertIn(f"#{second.pk} Second: ran extract", out.getvalue())
+
+        out = io.StringIO()
+        call_command("reprocess_documents", "--no-translate", stdout=out, stderr=err)
+        self.assertIn(f"#{first.pk} First: ran extract", out.getvalue())
+        self.assertIn(f"#{second.pk} Second: ran nothing", out.getvalue())
+        self.assertIn(f"#{missing.pk} Missing: file missing, skipped", err.getvalue())
+
+
+# -------------------------
+# Extractive Summaries
+# -------------------------
+BRAKE_TEXT = (
+    "The brake pads on every trainset were inspected. "
+    "Zebras and giraffes graze quietly on the savannah. "
+    "Worn brake pads were replaced on three trainsets. "
+    "The brake inspection schedule for trainsets is now monthly."
+)
+
+
+class ExtractiveSummaryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        cls.vect = TfidfVectorizer().fit([
+            "brake pads trainsets inspection schedule monthly replaced worn",
+            "zebras giraffes graze savannah quietly",
+        ])
+
+    def test_off_topic_sentences_rank_last(self):
+        sentences = split_sentences(BRAKE_TEXT)
+        self.assertEqual(len(sentences), 4)
+        for method in ("centroid", "textrank"):
+            scores = rank_sentences(sentences, self.vect, method)
+            self.assertEqual(int(scores.argmin()), 1, method)
+
+    def test_top_sentences_are_kept_in_document_order(self):
+        summary = extractive_summary(BRAKE_TEXT, self.vect, max_sentences=2)
+        kept = split_sentences(summary)
+        self.assertEqual(len(kept), 2)
+        self.assertNotIn("Zebras", summary)
+        sentences = split_sentences(BRAKE_TEXT)
+        self.assertEqual(kept, sorted(kept, key=sentences.index))
+
+    def test_empty_and_short_text(self):
+        self.assertEqual(extractive_summary("", self.vect), "")
+        self.assertEqual(extractive_summary("   \n\n  ", self.vect), "")
+        self.assertEqual(extractive_summary("Only one sentence.", self.vect), "Only one sentence.")
+        # Without a vectorizer the leading sentences stand in
+        self.assertEqual(extractive_summary(BRAKE_TEXT, None, max_sentences=1), "The brake pads on every trainset were inspected.")
+
+    def test_prefilter_sends_only_central_sentences_to_the_llm(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        model = RecordingModel()
+        with override_settings(MEDIA_ROOT=media, SUMMARY_MODE="prefilter", SUMMARY_PREFILTER_SENTENCES=2), \
+                mock.patch("home.pipeline.get_llm_client", lambda api_key: model), \
+                mock.patch("home.pipeline.get_artifacts", return_value=((self.vect, None, None, [], []), "fp")), \
+                mock.patch("home.pipeline.get_batcher") as batcher:
+            batcher.return_value.classify.return_value = ([], [])
+            doc = Document(title="Brakes")
+            doc.file.save("brakes.txt", ContentFile(BRAKE_TEXT.encode()), save=False)
+            doc.save()
+            process_document(doc)
+
+        self.assertEqual(len(model.prompts), 1)
+        self.assertNotIn("Zebras", model.prompts[0])
+        self.assertIn("brake", model.prompts[0])
+        self.assertEqual(doc.pipeline_state["summarise"]["status"], "done")
+
+
+# -------------------------
+# Classification Batching
+# -------------------------
+def fake_classify_texts(texts, vect, clf, labels, thr_arr):
+    return [([f"label:{text}"], [(f"label:{text}", 1.0)]) for text in texts]
+
+
+class ClassificationBatcherTests(SimpleTestCase):
+    def make_batcher(self, classify=fake_classify_texts, **kwargs):
+        patcher = mock.patch("home.batching.classify_texts", side_effect=classify)
+        self.classify_texts = patcher.start()
+        self.addCleanup(patcher.stop)
+        return ClassificationBatcher(None, None, [], [], **kwargs)
+
+    def test_concurrent_requests_share_a_batch_in_order(self):
+        batcher = self.make_batcher(max_batch_size=8, max_wait=0.5)
+        futures = [batcher.submit(f"doc {i}") for i in range(5)]
+        results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual([labels for labels, _ in results], [[f"label:doc {i}"] for i in range(5)])
+        self.assertEqual(self.classify_texts.call_count, 1)
+        self.assertEqual(self.classify_texts.call_args[0][0], [f"doc {i}" for i in range(5)])
+        self.assertEqual(batcher.snapshot()["batch_size_max"], 5)
+
+    def test_a_failed_batch_raises_in_every_caller(self):
+        batcher = self.make_batcher(classify=ValueError("bad input"), max_batch_size=8, max_wait=0.5)
+        futures = [batcher.submit(f"doc {i}") for i in range(3)]
+        for future in futures:
+            with self.assertRaisesMessage(ValueError, "bad input"):
+                future.result(timeout=5)
+        self.assertEqual(batcher.snapshot()["errors"], 1)
+
+    def test_hung_predict_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def hang(*args):
+            release.wait(5)
+            return fake_classify_texts(*args)
+
+        batcher = self.make_batcher(classify=hang, max_wait=0, timeout=0.05)
+        with self.assertRaises(FuturesTimeoutError):
+            batcher.classify("stuck")
+        self.assertEqual(batcher.snapshot()["timeouts"], 1)
+
+    def test_dead_dispatcher_fails_pending_calls_and_restarts(self):
+        calls = []
+
+        def die_once(*args):
+            calls.append(args[0])
+            if len(calls) == 1:
+                raise SystemExit  # kills the dispatcher thread, not just the batch
+            return fake_classify_texts(*args)
+
+        batcher = self.make_batcher(classify=die_once, max_wait=0)
+        with self.assertRaisesMessage(RuntimeError, "dispatcher stopped"):
+            batcher.classify("first", timeout=5)
+        batcher._thread.join(5)
+
+        labels, _ = batcher.classify("second", timeout=5)
+        self.assertEqual(labels, ["label:second"])
+        self.assertEqual(batcher.snapshot()["restarts"], 1)
+
+
+# -------------------------
+# Async Pipeline
+# -------------------------
+class AsyncRecordingClient:
+    """Awaitable view of the test case's current fake model."""
+
+    def __init__(self, case):
+        self.case = case
+
+    async def generate_content(self, prompt):
+        return self.case.model.generate_content(prompt)
+
+
+class AsyncPipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media, SUMMARY_MODE="llm", CLASSIFY_MODE="summary")
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.model = RecordingModel()
+        patchers = [
+            mock.patch("home.pipeline.get_llm_client", lambda api_key: self.model),
+            mock.patch("home.async_pipeline.get_async_llm_client", lambda api_key: AsyncRecordingClient(self)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, title, text="Quarterly budget and procurement figures for the metro."):
+        doc = Document(title=title)
+        doc.file.save(f"{title}.txt", ContentFile(text.encode()), save=False)
+        doc.save()
+        return doc
+
+    def stamps(self, doc):
+        return {stage: (stamp["version"], stamp["status"]) for stage, stamp in doc.pipeline_state.items()}
+
+    def test_async_path_stamps_the_same_stages_as_the_sync_path(self):
+        sync_doc = self.upload("Budget")
+        async_doc = self.upload("Depot memo", "Depot memo on brake inspections and the rolling stock schedule.")
+        process_document(sync_doc, translate=True)
+        ran = async_to_sync(aprocess_document)(async_doc, translate=True)
+
+        self.assertEqual(ran, ["extract", "revision", "translate", "summarise", "classify"])
+        self.assertEqual(self.stamps(async_doc), self.stamps(sync_doc))
+        async_doc.refresh_from_db()
+        self.assertEqual(async_doc.translated_text, "EN[Depot memo on brake inspections and the rolling stock schedule.]")
+        self.assertTrue(async_doc.summary.startswith("EN["))
+        self.assertEqual(set(async_doc.confidence_scores), set(sync_doc.confidence_scores))
+        self.assertTrue(async_doc.processed)
+        self.assertEqual(async_to_sync(aprocess_document)(async_doc, translate=True), [])
+
+    def test_async_path_keeps_fallbacks_and_failures_for_retry(self):
+        doc = self.upload("Budget")
+        self.model = FailingModel()
+        with mock.patch("home.async_pipeline.get_batcher", side_effect=RuntimeError("no classifier")):
+            async_to_sync(aprocess_document)(doc)
+        self.assertEqual(doc.pipeline_state["summarise"]["status"], "fallback")
+        self.assertEqual(doc.pipeline_state["classify"]["status"], "failed")
+        self.assertEqual(pending_stages(doc), ["summarise", "classify"])
+
+        self.model = RecordingModel()
+        self.assertEqual(async_to_sync(aprocess_document)(doc), ["summarise", "classify"])
+        self.assertEqual(pending_stages(doc), [])
+
+    async def test_async_upload_view_processes_every_file(self):
+        user = await User.objects.acreate_user("uploader", "uploader@example.com", "pw")
+        await self.async_client.aforce_login(user)
+        files = [
+            SimpleUploadedFile(f"memo{i}.txt", f"Depot memo {i} on brake inspections.".encode())
+            for i in range(3)
+        ]
+
+        response = await self.async_client.post(
+            "/upload-documents/async/",
+            {"files": files, "department": "Operations"},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        docs = [doc async for doc in Document.objects.select_related("department").order_by("title")]
+        self.assertEqual([doc.title for doc in docs], ["memo0.txt", "memo1.txt", "memo2.txt"])
+        for doc in docs:
+            self.assertTrue(doc.processed)
+            self.assertEqual(doc.department.name, "Operations")
+            self.assertEqual(pending_stages(doc), [])
+        self.assertEqual(len(self.model.prompts), 3 * 2)  # a translation and a summary each
+
+    async def test_async_upload_refuses_anonymous_users(self):
+        response = await self.async_client.post(
+            "/upload-documents/async/", {"files": [SimpleUploadedFile("memo.txt", b"Depot memo.")]}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("next=", response.url)
+        self.assertEqual(await Document.objects.acount(), 0)
@@ -7,9 +7,17 @@ urlpatterns = [
     path("admin_login/", views.admin_login, name="admin_login"),
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path("upload-documents/", views.upload_documents, name="upload_documents"),
+    path("upload-documents/async/", views.upload_documents_async, name="upload_documents_async"),
     path("login/", views.user_login, name="user_login"),
     path("dashboard/", views.dashboard, name="dashboard"),
     path("logout/", views.user_logout, name="user_logout"),
+    path("metrics/", views.metrics, name="metrics"),
+    path("live/", views.live_events, name="live_events"),
+    path("documents/export/<str:fmt>/", views.export_documents, name="export_documents"),
+    path("documents/bulk/", views.bulk_documents, name="bulk_documents"),
     path("documents/<int:doc_id>/delete/", views.delete_document, name="delete_document"),
+    path("documents/<int:doc_id>/download/", views.download_document, name="download_document"),
+    path("documents/<int:doc_id>/preview/<int:page>/", views.document_preview, name="document_preview"),
+    path("documents/<int:doc_id>/thumbnail/", views.document_thumbnail, name="document_thumbnail"),
     
 ]
@@ -1,15 +1,57 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from .models import *
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .doc_processor import process_and_classify
+from .doc_processor import TEXT_EXTRACTORS
+from .pipeline import DEFAULT_ARTIFACTS_DIR, classifier_metrics, pending_stages, process_document
+from .llm_client import llm_metrics
+from .async_pipeline import aprocess_document
+from .downloads import document_file_response
+from .fragments import ADMIN_FRAGMENTS, DASHBOARD_FRAGMENTS, document_fragments, highlight_pages
+from .live import (
+    ADMIN_CHANNEL,
+    category_channel,
+    event_stream,
+    latest_event_id,
+    live_metrics,
+    parse_event_id,
+    user_channel,
+)
+from .exports import (
+    CONTENT_TYPES,
+    EXPORT_FORMATS,
+    STREAM_ENCODERS,
+    ExportFilterError,
+    export_queryset,
+    iter_rows,
+    write_parquet,
+)
+from .bulk_actions import (
+    BULK_ACTIONS,
+    BulkActionError,
+    bulk_delete,
+    bulk_recategorise,
+    bulk_set_department,
+    create_role_users,
+    get_file_sweeper,
+    select_documents,
+    sweeper_metrics,
+)
+from .scheduler import PRIORITY_CLASSES, get_ingest_scheduler, ingest_metrics, job_priority
+from .previews import get_page_preview, get_thumbnail, preview_version
 from django.conf import settings
+from django.db import transaction
+import asyncio
 import os
+import tempfile
+from concurrent.futures import wait
 
 
-API_KEY = "API KEY HERE"
+API_KEY = settings.GEMINI_API_KEY
 # -------------------------
 # Role Mapping by Department
 # -------------------------
@@ -34,6 +76,32 @@ ROLE_MODELS = {
     "ExecutiveUser": ExecutiveUser,
 }
 
+# -------------------------
+# Role Lookup by Related User Object
+# -------------------------
+ROLE_ATTRS = [
+    ("engineer", "Engineer", "Technical"),
+    ("operationsuser", "Operations", "Operational"),
+    ("financeuser", "Finance", "Financial"),
+    ("hruser", "HR/Admin", "Administrative"),
+    ("complianceuser", "Compliance", "Regulatory"),
+    ("executiveuser", "Executive", "Executive"),
+]
+
+def get_user_role(user):
+    """Return (role label, department category) for a logged-in user."""
+    for attr, role, department_name in ROLE_ATTRS:
+        if hasattr(user, attr):
+            return role, department_name
+    return "Unknown", None
+
+def can_view_document(user, document):
+    """Admins and uploaders see everything; others only their category's documents."""
+    if user.is_superuser or document.uploaded_by_id == user.id:
+        return True
+    _, user_department_name = get_user_role(user)
+    return document.categories.filter(name=user_department_name).exists()
+
 role_to_category = {
     "Finance": "Financial",
     "Operations": "Operational",
@@ -76,11 +144,18 @@ def admin_dashboard(request):
     
     departments = Department.objects.all()
     message = None
-    documents = Document.objects.all()
+    # Only the version stamps are read here; cards are reused from the fragment cache
+    fragments = document_fragments(
+        request, Document.objects.only("id", "updated_at"), ADMIN_FRAGMENTS
+    )
     context = {
             "departments": departments,
             "message": message,
-            "documents": documents,
+            "document_cards": fragments["card"],
+            "document_data": fragments["data"],
+            "upload_url": "upload_documents_async" if settings.ASYNC_UPLOADS else "upload_documents",
+            "priority_classes": PRIORITY_CLASSES,
+            "live_last_event_id": latest_event_id() if settings.LIVE_EVENTS_ENABLED else None,
         }
 
     if request.method == "POST":
@@ -89,17 +164,12 @@ def admin_dashboard(request):
         dept_id = request.POST.get("department")
 
         if email and password and dept_id:
-            if User.objects.filter(username=email).exists():
+            department = Department.objects.get(id=dept_id)
+            # Saves the user and its role model row (same path as the create_users command)
+            _, existing = create_role_users([(email, password, department.name)])
+            if existing:
                 message = "User with this email already exists."
             else:
-                user = User.objects.create_user(username=email, email=email, password=password)
-                department = Department.objects.get(id=dept_id)
-
-                # Save user to the correct role model
-                role_model = ROLE_MAP.get(department.name)
-                if role_model:
-                    role_model.objects.create(user=user)
-
                 message = f"User {email} created successfully in {department.name}!"
         
         
@@ -138,74 +208,195 @@ def upload_documents(request):
             messages.error(request, "No files selected for upload.")
             return redirect(request.META.get("HTTP_REFERER", "/"))
 
+        if department_name:
+            dept, _ = Department.objects.get_or_create(name=department_name)
+        else:
+            dept = None  
+
+        # Jobs share the process-wide scheduler, so a large batch here cannot
+        # hold up an urgent file uploaded by someone else
+        role, _ = get_user_role(request.user)
+        priority = job_priority(
+            role, request.POST.get("priority"), len(files), is_superuser=request.user.is_superuser
+        )
+        scheduler = get_ingest_scheduler()
+
+        failed = 0
+        jobs = []
         for f in files:
-            # Save file to media/documents/ temporarily
-            upload_path = os.path.join(settings.MEDIA_ROOT, "documents", f.name)
-            os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-
-            with open(upload_path, "wb+") as dest:
-                for chunk in f.chunks():
-                    dest.write(chunk)
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            artifacts_dir = os.path.join(current_dir, "artifacts")
-
-            try:
-                # Process and classify
-                result = process_and_classify(
-                    file_path=upload_path,
-                    artifacts_dir=artifacts_dir,
-                    gemini_api_key=API_KEY,
-                    translate=True
-                )
-
-                if department_name:
-                    dept, _ = Department.objects.get_or_create(name=department_name)
-                else:
-                    dept = None  
-                
-                # Create Document record
-                doc = Document.objects.create(
-                    title=f.name,
-                    uploaded_by=request.user,
-                    department=dept,
-                    file=f,  
-                    extracted_text=result.get("extracted_text", ""),
-                    translated_text=result.get("translated_text", ""),
-                    summary=result.get("summary", ""),
-                    processed=True
-                )
-
-                # Add predicted categories (labels)
-                labels = result.get("predicted_labels", [])
-                for label in labels:
-                    cat, _ = Category.objects.get_or_create(name=label)
-                    doc.categories.add(cat)
-
-                doc.save()
-            except Exception as e:
-                messages.error(request, f"Error processing {f.name}: {str(e)}")
-                return redirect(request.META.get("HTTP_REFERER", "/"))
+            ext = os.path.splitext(f.name)[1].lower()
+            if ext not in TEXT_EXTRACTORS:
+                messages.error(request, f"Error processing {f.name}: Unsupported file type: {ext}")
+                failed += 1
+                continue
+
+            # Save the upload first so every stage's output can be persisted on it
+            doc = Document.objects.create(
+                title=f.name,
+                uploaded_by=request.user,
+                department=dept,
+                file=f,  
+            )
+
+            future = scheduler.submit(
+                process_document,
+                doc,
+                artifacts_dir=DEFAULT_ARTIFACTS_DIR,
+                gemini_api_key=API_KEY,
+                translate=True,
+                priority=priority,
+                department=dept.name if dept else "",
+            )
+            jobs.append((f.name, doc, future))
+
+        done, not_done = wait([future for _, _, future in jobs], timeout=settings.INGEST_WAIT_SECONDS)
+        for name, doc, future in jobs:
+            if future not in done:
+                continue
+            if future.exception() is not None:
+                messages.error(request, f"Error processing {name}: {future.exception()}")
+                failed += 1
+                continue
+
+            # Failed or fallback stages are kept and retried by reprocess_documents
+            pending = pending_stages(doc)
+            if pending:
+                messages.warning(request, f"{name}: stages to retry: {', '.join(pending)}")
+                failed += 1
+
+        if not_done:
+            messages.info(request, f"{len(not_done)} file(s) are still processing and will appear once done.")
+        if failed + len(not_done) < len(files):
+            messages.success(request, "Files uploaded and processed successfully!")
+        return redirect(request.META.get("HTTP_REFERER", "/"))
 
+@login_required
+async def upload_documents_async(request):
+    """
+    ASGI variant of upload_documents: the uploaded files are processed
+    concurrently, and each job holds a coroutine rather than a thread while
+    it waits on the LLM. It deliberately bypasses the ingest scheduler, whose
+    priority classes ration worker threads; here the only limit is
+    ASYNC_INGEST_CONCURRENCY jobs per request.
+    """
+    if request.method != "POST":
+        return redirect(request.META.get("HTTP_REFERER", "/"))
 
-        messages.success(request, "Files uploaded and processed successfully!")
+    user = await request.auser()
+    files = request.FILES.getlist("files")
+    department_name = request.POST.get("department")
+
+    if not files:
+        messages.error(request, "No files selected for upload.")
         return redirect(request.META.get("HTTP_REFERER", "/"))
 
+    if department_name:
+        dept, _ = await Department.objects.aget_or_create(name=department_name)
+    else:
+        dept = None
+
+    slots = asyncio.Semaphore(settings.ASYNC_INGEST_CONCURRENCY)
+
+    async def ingest(f):
+        ext = os.path.splitext(f.name)[1].lower()
+        if ext not in TEXT_EXTRACTORS:
+            messages.error(request, f"Error processing {f.name}: Unsupported file type: {ext}")
+            return False
+
+        async with slots:
+            doc = await Document.objects.acreate(
+                title=f.name,
+                uploaded_by=user,
+                department=dept,
+                file=f,
+            )
+            await aprocess_document(
+                doc,
+                artifacts_dir=DEFAULT_ARTIFACTS_DIR,
+                gemini_api_key=API_KEY,
+                translate=True
+            )
+
+        pending = pending_stages(doc)
+        if pending:
+            messages.warning(request, f"{f.name}: stages to retry: {', '.join(pending)}")
+            return False
+        return True
+
+    results = await asyncio.gather(*(ingest(f) for f in files))
+    if any(results):
+        messages.success(request, "Files uploaded and processed successfully!")
+    return redirect(request.META.get("HTTP_REFERER", "/"))
+
 @login_required
 def delete_document(request, doc_id):
     document = get_object_or_404(Document, id=doc_id)
 
     if request.method == "POST":
-        # Delete the file from storage
-        if document.file:
-            document.file.delete(save=False)
-
-        document.delete()
+        name = document.file.name
+        with transaction.atomic():
+            document.delete()
+            # The stored file goes once the row is gone, off the request path
+            transaction.on_commit(lambda: get_file_sweeper().submit([name]))
         messages.success(request, "Document deleted successfully!")
     else:
         messages.error(request, "Invalid request method.")
 
     return redirect("admin_dashboard")
 
+@login_required
+def download_document(request, doc_id):
+    document = get_object_or_404(Document, id=doc_id)
+
+    if not can_view_document(request.user, document):
+        messages.error(request, "You do not have access to this document.")
+        return redirect("dashboard")
+
+    if not document.file or not document.file.storage.exists(document.file.name):
+        raise Http404("Document file not found.")
+
+    return document_file_response(request, document)
+
+def _cached_preview_response(request, document, suffix, render, content_type):
+    """Serve a rendered preview with an ETag tied to the file's content hash."""
+    if not can_view_document(request.user, document):
+        return HttpResponse(status=403)
+    if not document.file or not document.file.storage.exists(document.file.name):
+        raise Http404("Document file not found.")
+
+    etag = f'"{preview_version(document)}-{suffix}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        body = render()
+    except IndexError:
+        raise Http404("Page not found.")
+
+    response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = f"private, max-age={settings.PREVIEW_MAX_AGE}"
+    return response
+
+@login_required
+def document_preview(request, doc_id, page):
+    document = get_object_or_404(Document, id=doc_id)
+    return _cached_preview_response(
+        request, document, f"p{page}",
+        lambda: get_page_preview(document, page),
+        "application/json",
+    )
+
+@login_required
+def document_thumbnail(request, doc_id):
+    document = get_object_or_404(Document, id=doc_id)
+    return _cached_preview_response(
+        request, document, "thumb",
+        lambda: get_thumbnail(document),
+        "image/svg+xml",
+    )
+
 
 # -------------------------
 # Dashboard
@@ -217,38 +408,181 @@ def dashboard(request):
     if not request.user.is_authenticated:
         return redirect("user_login")
 
-    user_role = "Unknown"
-    user_department_name = None
-
-    if hasattr(request.user, "engineer"):
-        user_role = "Engineer"
-        user_department_name = "Technical"
-    elif hasattr(request.user, "operationsuser"):
-        user_role = "Operations"
-        user_department_name = "Operational"
-    elif hasattr(request.user, "financeuser"):
-        user_role = "Finance"
-        user_department_name = "Financial"
-    elif hasattr(request.user, "hruser"):
-        user_role = "HR/Admin"
-        user_department_name = "Administrative"
-    elif hasattr(request.user, "complianceuser"):
-        user_role = "Compliance"
-        user_department_name = "Regulatory"
-    elif hasattr(request.user, "executiveuser"):
-        user_role = "Executive"
-        user_department_name = "Executive"
+    user_role, user_department_name = get_user_role(request.user)
 
     category_name = role_to_category.get(user_role)
 
+    # Read before the list, so the live stream replays anything that lands in between
+    live_last_event_id = latest_event_id() if settings.LIVE_EVENTS_ENABLED else None
+
     # Filter documents that have this category
-    filtered_docs = Document.objects.filter(categories__name=category_name).distinct()
+    filtered_docs = Document.objects.filter(categories__name=category_name).distinct().only("id", "updated_at")
 
+    # The highlighted pages depend on the viewer's category, hence the variant
+    fragments = document_fragments(
+        request, filtered_docs, DASHBOARD_FRAGMENTS,
+        variant=category_name or "", prepare=highlight_pages(category_name),
+    )
 
     return render(request, "dashboard.html", {
         "user": request.user,
         "role": user_role,
-        "documents": filtered_docs,
+        "document_cards": fragments["card"],
+        "document_data": fragments["data"],
+        "live_last_event_id": live_last_event_id,
+    })
+
+
+# -------------------------
+# Live Updates (Server-Sent Events)
+# -------------------------
+def live_channels(user):
+    """What a user's dashboard follows: every document for admins, their role's category otherwise."""
+    if user.is_superuser:
+        channels = [ADMIN_CHANNEL]
+    else:
+        user_role, _ = get_user_role(user)
+        category_name = role_to_category.get(user_role)
+        channels = [category_channel(category_name)] if category_name else []
+    return channels + [user_channel(user.id)]
+
+@login_required
+def live_events(request):
+    """
+    Stage progress and new or reclassified document cards for the open
+    dashboard, replacing page reloads. The page passes ?last_event_id= from
+    its render; the browser sends Last-Event-ID on reconnect. Under ASGI
+    this path is served by home.live.live_asgi instead, without a thread
+    per open stream.
+    """
+    if not settings.LIVE_EVENTS_ENABLED:
+        raise Http404("Live updates are disabled.")
+    try:
+        after_id = parse_event_id(request.headers.get("Last-Event-ID") or request.GET.get("last_event_id"))
+    except ValueError:
+        return HttpResponse("Invalid event id.", status=400, content_type="text/plain")
+
+    response = StreamingHttpResponse(
+        event_stream(live_channels(request.user), after_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: pass frames through unbuffered
+    return response
+
+
+# -------------------------
+# Bulk Export (admins only)
+# -------------------------
+@login_required
+def export_documents(request, fmt):
+    """
+    Stream documents with their categories, scores and summaries.
+    Filters: ?from=YYYY-MM-DD&to=YYYY-MM-DD&category=<name>&department=<name>
+    """
+    if not request.user.is_superuser:
+        return redirect("admin_login")
+    if fmt not in EXPORT_FORMATS:
+        raise Http404("Unknown export format.")
+
+    try:
+        qs = export_queryset(
+            date_from=request.GET.get("from"),
+            date_to=request.GET.get("to"),
+            category=request.GET.get("category"),
+            department=request.GET.get("department"),
+        )
+    except ExportFilterError as e:
+        return HttpResponse(str(e), status=400, content_type="text/plain")
+
+    filename = f"documents.{fmt}"
+    if fmt == "parquet":
+        # Parquet needs a seekable file; it is built in chunks on disk, then streamed
+        out = tempfile.TemporaryFile()
+        try:
+            write_parquet(iter_rows(qs), out)
+        except ImportError as e:
+            out.close()
+            return HttpResponse(str(e), status=501, content_type="text/plain")
+        out.seek(0)
+        return FileResponse(out, as_attachment=True, filename=filename, content_type=CONTENT_TYPES[fmt])
+
+    response = StreamingHttpResponse(STREAM_ENCODERS[fmt](iter_rows(qs)), content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# -------------------------
+# Bulk Document Actions (admins only)
+# -------------------------
+def _names(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+@login_required
+def bulk_documents(request):
+    """
+    Apply one action to every document matching the filters (from, to,
+    category, department, uploaded_by, comma-separated ids): delete,
+    recategorise (comma-separated add/remove category names) or
+    set-department (new_department; empty clears it). dry_run only counts.
+    """
+    if not request.user.is_superuser:
+        return redirect("admin_login")
+    if request.method != "POST":
+        messages.error(request, "Invalid request method.")
+        return redirect("admin_dashboard")
+
+    action = request.POST.get("action")
+    try:
+        ids = [int(i) for i in _names(request.POST.get("ids"))] or None
+    except ValueError:
+        messages.error(request, "Document ids must be comma-separated numbers.")
+        return redirect("admin_dashboard")
+    try:
+        if action not in BULK_ACTIONS:
+            raise BulkActionError(f"Unknown action: {action!r}")
+        doc_ids = select_documents(
+            date_from=request.POST.get("from"),
+            date_to=request.POST.get("to"),
+            category=request.POST.get("category"),
+            department=request.POST.get("department"),
+            uploaded_by=request.POST.get("uploaded_by"),
+            ids=ids,
+        )
+        if request.POST.get("dry_run"):
+            messages.success(request, f"{len(doc_ids)} documents match; nothing was changed.")
+        elif action == "delete":
+            count = bulk_delete(doc_ids)
+            messages.success(request, f"Deleted {count} documents.")
+        elif action == "recategorise":
+            result = bulk_recategorise(
+                doc_ids, add=_names(request.POST.get("add")), remove=_names(request.POST.get("remove"))
+            )
+            messages.success(
+                request,
+                f"Recategorised {result['documents']} documents "
+                f"({result['added']} categories added, {result['removed']} removed).",
+            )
+        else:
+            count = bulk_set_department(doc_ids, request.POST.get("new_department") or None)
+            messages.success(request, f"Updated the department of {count} documents.")
+    except (BulkActionError, ExportFilterError) as e:
+        messages.error(request, str(e))
+    return redirect("admin_dashboard")
+
+
+# -------------------------
+# Runtime Metrics (admins only)
+# -------------------------
+@login_required
+def metrics(request):
+    if not request.user.is_superuser:
+        return redirect("admin_login")
+    return JsonResponse({
+        "llm": llm_metrics(),
+        "classifier": classifier_metrics(),
+        "ingest": ingest_metrics(),
+        "live": live_metrics(),
+        "file_sweeper": sweeper_metrics(),
     })
 
 